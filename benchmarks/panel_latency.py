@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+"""
+Benchmark of the dashboard panel queries on a large SonarRequest/SonarData table.
+
+Fills a throw-away SQLite database (or the database given with --database)
+with N requests, each with a few SonarData rows, then times the queries
+behind the Requests panel, the category panels and the request detail page.
+
+Usage:
+    python benchmarks/panel_latency.py --rows 1000000
+    python benchmarks/panel_latency.py --rows 10000000 --database /tmp/sonar-bench.sqlite3
+
+Run it once as is and once with --without-indexes, which drops the dashboard
+indexes added by migration 0009 for the timed runs and recreates them
+afterwards, to compare the access paths with and without the indexes.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'base.settings')
+
+VERBS = ['GET', 'GET', 'GET', 'POST', 'PUT', 'DELETE']
+STATUSES = ['200', '200', '200', '201', '302', '404', '500']
+CATEGORIES = ['details', 'queries', 'headers', 'exception', 'dumps', 'signals']
+BATCH_SIZE = 5000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Time the django-sonar dashboard queries.')
+    parser.add_argument('--rows', type=int, default=100000, help='Number of requests to create')
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument(
+        '--without-indexes', action='store_true', help='Time the queries without the indexes of migration 0009'
+    )
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+    return parser.parse_args()
+
+
+def setup_django(database):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = database
+    django.setup()
+
+
+def populate(rows):
+    from django.db import transaction
+    from django.utils import timezone
+
+    from django_sonar.models import SonarData, SonarRequest
+
+    now = timezone.now()
+    created = 0
+    while created < rows:
+        size = min(BATCH_SIZE, rows - created)
+        requests = []
+        data = []
+        for offset in range(size):
+            created_at = now - timedelta(seconds=rows - created - offset)
+            sonar_request = SonarRequest(
+                uuid=uuid.uuid4(),
+                verb=random.choice(VERBS),
+                path=f'/api/items/{random.randint(1, 10000)}/',
+                status=random.choice(STATUSES),
+                duration=random.randint(1, 2000),
+                created_at=created_at,
+            )
+            requests.append(sonar_request)
+            for category in random.sample(CATEGORIES, 3):
+                data.append(SonarData(sonar_request=sonar_request, category=category, data={}, created_at=created_at))
+
+        with transaction.atomic():
+            SonarRequest.objects.bulk_create(requests)
+            SonarData.objects.bulk_create(data)
+        created += size
+        print(f'\r  {created}/{rows} requests', end='', flush=True)
+    print()
+
+
+def dashboard_indexes():
+    """
+    Return the (model, index) pairs added by the dashboard indexes migration
+    """
+    from importlib import import_module
+
+    from django.apps import apps
+
+    migration = import_module('django_sonar.migrations.0009_dashboard_indexes').Migration
+    return [
+        (apps.get_model('django_sonar', operation.model_name), operation.index)
+        for operation in migration.operations
+    ]
+
+
+@contextmanager
+def without_indexes():
+    """
+    Drop the dashboard indexes for the duration of the block and recreate them afterwards
+
+    Only the indexes are touched, so the schema stays the one of the current
+    models (migrating back to 0008 would also undo the later migrations).
+    """
+    from django.db import connection
+
+    indexes = dashboard_indexes()
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        print('Recreating the dashboard indexes')
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.add_index(model, index)
+
+
+def timed(label, func, repeat):
+    func()  # warm-up
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    print(f'  {label:<40} median {statistics.median(durations):9.2f} ms   max {max(durations):9.2f} ms')
+
+
+def run_benchmark(repeat):
+    from django.test import RequestFactory
+
+    from django_sonar.models import SonarRequest
+    from django_sonar.panels import registry as panel_registry
+
+    factory = RequestFactory()
+    requests_panel = panel_registry.get('requests')
+    exceptions_panel = panel_registry.get('exceptions')
+    sample_uuid = SonarRequest.objects.order_by('created_at').values_list('uuid', flat=True)[
+        SonarRequest.objects.count() // 2
+    ]
+
+    def requests_list(**params):
+        def run():
+            context = requests_panel.get_list_context(factory.get('/sonar/requests/', params))
+            list(context['sonar_requests'])
+        return run
+
+    def category_list():
+        context = exceptions_panel.get_list_context(factory.get('/sonar/exceptions/'))
+        list(context['exceptions'][:50])
+
+    def request_detail():
+        exceptions_panel.get_detail_context(factory.get('/'), sample_uuid)
+
+    timed('requests panel, first page', requests_list(), repeat)
+    timed('requests panel, page 100', requests_list(page=100), repeat)
+    timed('requests panel, verb=post', requests_list(verb='post'), repeat)
+    timed('requests panel, status=500', requests_list(status='500'), repeat)
+    timed('exceptions panel, latest 50', category_list, repeat)
+    timed('exception of one request', request_detail, repeat)
+
+
+def main():
+    args = parse_args()
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix='sonar-bench-'), 'bench.sqlite3')
+    setup_django(database)
+
+    from django.core.management import call_command
+
+    from django_sonar.models import SonarRequest
+
+    call_command('migrate', verbosity=0)
+
+    existing = SonarRequest.objects.count()
+    if existing < args.rows:
+        print(f'Creating {args.rows - existing} requests in {database}')
+        populate(args.rows - existing)
+
+    count = SonarRequest.objects.count()
+    if args.without_indexes:
+        with without_indexes():
+            print(f'Timing panel queries on {count} requests, without the dashboard indexes')
+            run_benchmark(args.repeat)
+    else:
+        print(f'Timing panel queries on {count} requests')
+        run_benchmark(args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class DjangoSonarConfig(AppConfig):
@@ -6,3 +7,8 @@ class DjangoSonarConfig(AppConfig):
     name = 'django_sonar'
     verbose_name = 'Django Sonar'
 
+    def ready(self):
+        from django_sonar.core.queries import install_query_recorder
+
+        # Record SQL through execute_wrapper, independently of DEBUG
+        connection_created.connect(install_query_recorder, dispatch_uid='django_sonar_query_recorder')
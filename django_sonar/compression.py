@@ -0,0 +1,122 @@
+"""
+Compression of large SonarData payloads.
+
+When enabled, payloads whose serialized JSON is larger than
+``compression_threshold`` bytes are stored compressed in the binary
+``SonarData.data_blob`` column instead of the ``data`` JSON column. The
+blob starts with a one byte codec marker, so rows written with different
+codecs can coexist. Reading ``SonarData.data`` decodes the blob on first
+access (see ``models.fields.CompressedJSONField``).
+
+Settings (all optional):
+- compression: compress new payloads above the threshold (default False)
+- compression_threshold: min size in bytes of the serialized payload (default 1024)
+- compression_codec: 'zstd', 'zlib' or 'auto', zstd when the zstandard
+  package is installed and zlib otherwise (default 'auto')
+- compression_level: codec compression level (default None, codec default)
+"""
+
+import json
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+
+from django_sonar.utils import get_sonar_settings
+
+try:
+    import zstandard
+except ImportError:  # optional dependency: pip install django-sonar[zstd]
+    zstandard = None
+
+
+DEFAULT_THRESHOLD = 1024
+
+ZLIB_MARKER = b'z'
+ZSTD_MARKER = b's'
+
+
+def is_compression_enabled():
+    return bool(get_sonar_settings().get('compression', False))
+
+
+def get_codec():
+    """
+    Resolve the configured codec.
+
+    :return: 'zstd' or 'zlib'
+    """
+    codec = get_sonar_settings().get('compression_codec', 'auto')
+    if codec == 'auto':
+        return 'zstd' if zstandard is not None else 'zlib'
+    if codec == 'zstd' and zstandard is None:
+        raise ImproperlyConfigured('compression_codec "zstd" requires the zstandard package.')
+    if codec not in ('zstd', 'zlib'):
+        raise ImproperlyConfigured(f'Unknown compression_codec "{codec}", use "zstd", "zlib" or "auto".')
+    return codec
+
+
+def serialize_payload(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def compress_payload(data, codec=None, level=None):
+    """
+    Compress a JSON-serializable payload.
+
+    :param data: Payload
+    :param codec: 'zstd' or 'zlib' (defaults to the compression_codec setting)
+    :param level: Compression level (defaults to the compression_level setting)
+    :return: Blob (codec marker followed by the compressed JSON)
+    """
+    return _compress(serialize_payload(data), codec, level)
+
+
+def _compress(raw, codec=None, level=None):
+    codec = codec or get_codec()
+    if level is None:
+        level = get_sonar_settings().get('compression_level')
+
+    if codec == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return ZSTD_MARKER + compressor.compress(raw)
+    return ZLIB_MARKER + zlib.compress(raw, -1 if level is None else level)
+
+
+def decompress_payload(blob):
+    """
+    Decode a blob written by compress_payload().
+
+    :param blob: bytes or memoryview
+    :return: Payload
+    """
+    blob = bytes(blob)
+    marker, body = blob[:1], blob[1:]
+    if marker == ZLIB_MARKER:
+        raw = zlib.decompress(body)
+    elif marker == ZSTD_MARKER:
+        if zstandard is None:
+            raise ImproperlyConfigured('This payload is zstd-compressed: install the zstandard package to read it.')
+        raw = zstandard.ZstdDecompressor().decompress(body)
+    else:
+        raise ValueError(f'Unknown compression marker {marker!r}.')
+    return json.loads(raw)
+
+
+def encode_payload(data, force=False):
+    """
+    Compress a payload when compression applies to it.
+
+    :param data: Payload
+    :param force: Compress even when the compression setting is disabled
+    :return: Blob, or None when the payload should be stored as JSON
+    """
+    if data is None or not (force or is_compression_enabled()):
+        return None
+
+    raw = serialize_payload(data)
+    if len(raw) < get_sonar_settings().get('compression_threshold', DEFAULT_THRESHOLD):
+        return None
+
+    blob = _compress(raw)
+    # Incompressible payloads are not worth the decoding cost
+    return blob if len(blob) < len(raw) else None
@@ -5,12 +5,16 @@ Core business logic for request processing, data collection, and filtering.
 """
 
 from .parsers import RequestParser
-from .collectors import DataCollector
+from .collectors import DataCollector, BatchDataCollector
 from .filters import PathFilter, SensitiveDataFilter
+from .sampling import RequestSampler, TailSampler
 
 __all__ = [
     'RequestParser',
     'DataCollector',
+    'BatchDataCollector',
     'PathFilter',
     'SensitiveDataFilter',
+    'RequestSampler',
+    'TailSampler',
 ]
@@ -0,0 +1,157 @@
+"""
+Content-addressed storage of repeated payloads.
+
+Request details (middlewares, view, user), header sets, sessions and
+payloads are nearly identical across requests. With ``dedup`` enabled, the
+payloads of those categories are stored once in SonarBlob, keyed by a hash
+of their canonical JSON, and SonarData rows only reference the blob.
+
+Every process remembers the hashes it already wrote (or found), so a
+repeated payload is not written again. Another process may have deleted
+those blobs since (a clear, retention pruning), so the remembered hashes
+of a batch are checked with one primary key lookup and the missing blobs
+are written again instead of being left dangling. A remembered hash is
+trusted for ``dedup_cache_ttl`` seconds only: orphan blobs younger than
+the TTL are kept by retention pruning, so keep it well below the shortest
+retention.
+
+Settings (all optional):
+- dedup: store the payloads of the dedup categories as shared blobs (default False)
+- dedup_categories: categories to deduplicate (default details, headers, session, payload)
+- dedup_cache_size: hashes remembered per process (default 10000)
+- dedup_cache_ttl: seconds a remembered hash is trusted (default 3600)
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import router, transaction
+
+from django_sonar.models import SonarBlob
+from django_sonar.utils import get_sonar_settings
+
+
+DEFAULT_CATEGORIES = ('details', 'headers', 'session', 'payload')
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 3600
+
+
+def is_dedup_enabled():
+    return bool(get_sonar_settings().get('dedup', False))
+
+
+def get_dedup_categories():
+    return get_sonar_settings().get('dedup_categories', DEFAULT_CATEGORIES)
+
+
+def hash_payload(data):
+    """
+    Hash the canonical JSON of a payload.
+
+    :param data: JSON-serializable payload
+    :return: Tuple (hex digest, canonical JSON size in bytes)
+    """
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest(), len(canonical)
+
+
+class BlobCache:
+    """Bounded, thread-safe set of recently written blob hashes"""
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        """
+        Initialize an empty cache.
+
+        :param max_size: Max number of hashes remembered
+        :param ttl: Seconds a hash is trusted after being written
+        """
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, blob_hash):
+        with self._lock:
+            written_at = self._hashes.get(blob_hash)
+            if written_at is None:
+                return False
+            if time.monotonic() - written_at > self.ttl:
+                del self._hashes[blob_hash]
+                return False
+            self._hashes.move_to_end(blob_hash)
+            return True
+
+    def add(self, hashes):
+        """Remember hashes as written now."""
+        now = time.monotonic()
+        with self._lock:
+            for blob_hash in hashes:
+                self._hashes[blob_hash] = now
+                self._hashes.move_to_end(blob_hash)
+            while len(self._hashes) > self.max_size:
+                self._hashes.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._hashes.clear()
+
+
+blob_cache = BlobCache()
+
+
+def _configure_cache():
+    sonar_settings = get_sonar_settings()
+    blob_cache.max_size = max(1, int(sonar_settings.get('dedup_cache_size', DEFAULT_CACHE_SIZE)))
+    blob_cache.ttl = sonar_settings.get('dedup_cache_ttl', DEFAULT_CACHE_TTL)
+
+
+def build_blob(category, data):
+    """
+    Build the shared blob of a payload when its category is deduplicated.
+
+    :param category: SonarData category
+    :param data: JSON-serializable payload
+    :return: Unsaved SonarBlob, or None when the payload is stored inline
+    """
+    if data is None or not is_dedup_enabled() or category not in get_dedup_categories():
+        return None
+    blob_hash, size = hash_payload(data)
+    return SonarBlob(hash=blob_hash, data=data, size=size)
+
+
+def write_blobs(blobs, batch_size=None):
+    """
+    Insert the blobs this process did not write recently, or that were deleted since.
+
+    Call it in the transaction writing the SonarData rows: hashes are only
+    remembered once that transaction is committed.
+
+    :param blobs: Dictionary {hash: SonarBlob}
+    :param batch_size: Max rows per INSERT
+    :return: List of hashes sent to the database
+    """
+    if not blobs:
+        return []
+    _configure_cache()
+
+    database = router.db_for_write(SonarBlob)
+    missing = []
+    remembered = []
+    for blob_hash, blob in blobs.items():
+        (remembered if blob_hash in blob_cache else missing).append(blob_hash)
+    if remembered:
+        # The cache is per process: a clear run elsewhere deletes the blobs without forgetting their hashes here
+        existing = set(
+            SonarBlob.objects.using(database).filter(hash__in=remembered).values_list('hash', flat=True)
+        )
+        missing += [blob_hash for blob_hash in remembered if blob_hash not in existing]
+    if missing:
+        SonarBlob.objects.bulk_create(
+            [blobs[blob_hash] for blob_hash in missing], batch_size=batch_size, ignore_conflicts=True
+        )
+        transaction.on_commit(lambda: blob_cache.add(missing), using=database)
+        return missing
+    return []
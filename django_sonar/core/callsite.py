@@ -0,0 +1,103 @@
+"""
+Call-site attribution for captured queries.
+
+The call site of a query is the first stack frame outside Django,
+DjangoSonar, the standard library and installed packages, i.e. the line of
+project code that issued it. Frames are walked with ``sys._getframe`` and
+the "is this project code" decision is cached per code object, so after
+warm-up a lookup is a few dictionary hits per frame.
+
+Settings (optional):
+- query_call_sites: annotate captured queries with their call site (default True)
+"""
+
+import os
+import sys
+import sysconfig
+
+import django
+
+from django_sonar.utils import get_sonar_settings
+
+
+MAX_CACHED_CODES = 10000
+
+_NOT_APP = object()
+_code_cache = {}
+
+
+def _get_library_paths():
+    paths = {
+        os.path.dirname(django.__file__),
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),  # django_sonar
+    }
+    for name in ('stdlib', 'platstdlib', 'purelib', 'platlib'):
+        path = sysconfig.get_paths().get(name)
+        if path:
+            paths.add(path)
+    return tuple(os.path.realpath(path) + os.sep for path in paths)
+
+
+_LIBRARY_PATHS = _get_library_paths()
+
+
+def is_call_site_enabled():
+    return bool(get_sonar_settings().get('query_call_sites', True))
+
+
+def _describe_code(code):
+    filename = code.co_filename
+    if filename.startswith('<'):
+        return _NOT_APP
+
+    path = os.path.realpath(filename)
+    if path.startswith(_LIBRARY_PATHS) or 'site-packages' in path or 'dist-packages' in path:
+        return _NOT_APP
+
+    try:
+        relative = os.path.relpath(path)
+    except ValueError:
+        relative = path
+    return path if relative.startswith('..') else relative
+
+
+def get_call_site(skip=1):
+    """
+    Find the project code line that led to the current call.
+
+    :param skip: Number of innermost frames to skip
+    :return: String 'path:line in function', or None when no project frame exists
+    """
+    frame = sys._getframe(skip)
+    while frame is not None:
+        code = frame.f_code
+        described = _code_cache.get(code)
+        if described is None:
+            if len(_code_cache) >= MAX_CACHED_CODES:
+                _code_cache.clear()
+            described = _code_cache[code] = _describe_code(code)
+        if described is not _NOT_APP:
+            return f"{described}:{frame.f_lineno} in {code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def group_by_call_site(executed_queries):
+    """
+    Group captured queries by call site.
+
+    :param executed_queries: Iterable of query dictionaries
+    :return: List of dictionaries (call_site, count, total_time), slowest first
+    """
+    groups = {}
+    for query in executed_queries:
+        call_site = query.get('call_site') or ''
+        group = groups.get(call_site)
+        if group is None:
+            group = groups[call_site] = {'call_site': call_site, 'count': 0, 'total_time': 0.0}
+        group['count'] += 1
+        group['total_time'] += float(query.get('time') or 0)
+
+    for group in groups.values():
+        group['total_time'] = round(group['total_time'], 3)
+    return sorted(groups.values(), key=lambda group: (group['total_time'], group['count']), reverse=True)
@@ -0,0 +1,210 @@
+"""
+Clearing of the captured data (see the ``clear_sonar_data`` command).
+
+A full clear runs the flush statements of the database backend (TRUNCATE
+on PostgreSQL and MySQL, DELETE on SQLite, resetting the sequences) on the
+database the router sends the Sonar tables to, which is not ``default``
+when they live in a separate ``sonar_db``. The dashboard's clear button
+only flushes the raw data (requests, entries and blobs, ``RAW_MODELS``)
+and keeps the aggregates.
+
+A selective clear (age, path prefix, status, categories) deletes the
+selected requests with their entries, or only the entries of the selected
+categories, in bounded primary key chunks with one short transaction per
+chunk, like retention pruning (see ``core.retention``). The aggregates
+(query statistics, route rollups, sampling counters) are kept, and shared
+blobs left unreferenced are deleted afterwards.
+"""
+
+from datetime import timedelta
+
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.db.models import Q
+
+from django_sonar.models import (
+    SonarBlob,
+    SonarData,
+    SonarQueryStat,
+    SonarRequest,
+    SonarRouteRollup,
+    SonarSampleCounter,
+)
+from .blobs import blob_cache
+from .exports import get_status_filter
+from .retention import RetentionPruner
+
+
+SONAR_MODELS = [SonarData, SonarRequest, SonarSampleCounter, SonarQueryStat, SonarRouteRollup, SonarBlob]
+
+RAW_MODELS = [SonarData, SonarRequest, SonarBlob]
+
+
+def get_sonar_tables(models=SONAR_MODELS):
+    """
+    Group the Sonar tables by the database they are written to.
+
+    :param models: Models of the tables
+    :return: Dictionary {database alias: [table names]}
+    """
+    tables = {}
+    for model in models:
+        tables.setdefault(router.db_for_write(model) or 'default', []).append(model._meta.db_table)
+    return tables
+
+
+def flush_sonar_tables(models=SONAR_MODELS):
+    """
+    Delete every row of the Sonar tables and reset their sequences.
+
+    :param models: Models of the flushed tables (RAW_MODELS keeps the aggregates)
+    """
+    style = no_style()
+    for alias, tables in get_sonar_tables(models).items():
+        connection = connections[alias]
+        connection.ops.execute_sql_flush(connection.ops.sql_flush(style, tables, reset_sequences=True))
+    blob_cache.clear()
+
+
+def get_maintenance_statements(connection, tables, vacuum=False, analyze=False):
+    """
+    Build the statements reclaiming space and refreshing planner statistics.
+
+    :param connection: Database connection of the tables
+    :param tables: Table names
+    :param vacuum: Reclaim the space of deleted rows
+    :param analyze: Refresh the planner statistics
+    :return: List of SQL statements, empty when the database has none
+    """
+    quote = connection.ops.quote_name
+    statements = []
+    if connection.vendor == 'sqlite':
+        # VACUUM rebuilds the whole database file
+        statements += ['VACUUM'] if vacuum else []
+        statements += [f'ANALYZE {quote(table)}' for table in tables] if analyze else []
+    elif connection.vendor == 'postgresql':
+        command = {(True, True): 'VACUUM (ANALYZE)', (True, False): 'VACUUM', (False, True): 'ANALYZE'}.get(
+            (vacuum, analyze)
+        )
+        statements += [f'{command} {quote(table)}' for table in tables] if command else []
+    elif connection.vendor == 'mysql':
+        # OPTIMIZE rebuilds InnoDB tables and refreshes their statistics too
+        if vacuum:
+            statements.append('OPTIMIZE TABLE ' + ', '.join(quote(table) for table in tables))
+        elif analyze:
+            statements.append('ANALYZE TABLE ' + ', '.join(quote(table) for table in tables))
+    return statements
+
+
+def optimize_sonar_tables(vacuum=False, analyze=False):
+    """
+    Run VACUUM and/or ANALYZE on the Sonar tables, outside of any transaction.
+
+    :param vacuum: Reclaim the space of deleted rows
+    :param analyze: Refresh the planner statistics
+    :return: List of the executed statements (empty for unsupported databases)
+    """
+    executed = []
+    for alias, tables in get_sonar_tables().items():
+        connection = connections[alias]
+        statements = get_maintenance_statements(connection, tables, vacuum, analyze)
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+        executed += statements
+    return executed
+
+
+class SonarCleaner(RetentionPruner):
+    """Delete the selected requests, or entries, in bounded chunks"""
+
+    def __init__(self, older_than=None, path_prefixes=None, statuses=None, categories=None,
+                 batch_size=None, sleep=None, progress=None, now=None):
+        """
+        Initialize the cleaner.
+
+        :param older_than: Only requests (or entries) older than this many days
+        :param path_prefixes: Only requests whose path starts with one of these
+        :param statuses: Only requests with these status codes or classes ('404', '5xx')
+        :param categories: Only delete the entries of these categories, keeping the requests
+        :param batch_size: Rows deleted per chunk (defaults to retention_batch_size)
+        :param sleep: Seconds to pause between chunks (defaults to retention_sleep)
+        :param progress: Optional callable(result) called after every chunk
+        :param now: Reference time of older_than (defaults to now)
+        """
+        super().__init__(policy={}, batch_size=batch_size, sleep=sleep, now=now)
+        self.older_than = older_than
+        self.path_prefixes = list(path_prefixes or [])
+        self.statuses = list(statuses or [])
+        self.categories = list(categories or [])
+        self.progress = progress
+        self.result = {'requests': 0, 'entries': 0, 'blobs': 0}
+
+    def get_requests(self):
+        """
+        Select the requests matching the age, path and status selectors.
+
+        :return: SonarRequest queryset
+        """
+        queryset = SonarRequest.objects.all()
+        if self.older_than is not None:
+            queryset = queryset.filter(created_at__lt=self.now - timedelta(days=self.older_than))
+        if self.path_prefixes:
+            path_filter = Q()
+            for prefix in self.path_prefixes:
+                path_filter |= Q(path__startswith=prefix)
+            queryset = queryset.filter(path_filter)
+        status_filter = get_status_filter(self.statuses)
+        if status_filter is not None:
+            queryset = queryset.filter(status_filter)
+        return queryset
+
+    def get_entries(self):
+        """
+        Select the entries of the selected categories and requests.
+
+        :return: SonarData queryset
+        """
+        queryset = SonarData.objects.filter(category__in=self.categories)
+        if self.older_than is not None:
+            queryset = queryset.filter(created_at__lt=self.now - timedelta(days=self.older_than))
+        if self.path_prefixes or self.statuses:
+            queryset = queryset.filter(sonar_request_id__in=self.get_requests().values('pk'))
+        return queryset
+
+    def clear(self):
+        """
+        Delete the selection.
+
+        :return: Dictionary {'requests': int, 'entries': int, 'blobs': int} of deleted rows
+        """
+        if self.categories:
+            self._delete_in_chunks(self.get_entries(), self._delete_entries)
+        else:
+            self._delete_in_chunks(self.get_requests(), self._delete_requests)
+        self.result['blobs'] = self.prune_orphan_blobs()['rows']
+        return self.result
+
+    def _delete_in_chunks(self, queryset, delete):
+        # Select on the database the chunks are deleted from: a lagging replica would return them again
+        queryset = queryset.using(router.db_for_write(queryset.model))
+        while True:
+            pks = list(queryset.values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                return
+            delete(pks)
+            if self.progress is not None:
+                self.progress(self.result)
+            if len(pks) < self.batch_size:
+                return
+            self._pause()
+
+    def _delete_requests(self, pks):
+        database = router.db_for_write(SonarRequest)
+        with transaction.atomic(using=database):
+            # No signals or cascades to run: plain DELETE statements
+            self.result['entries'] += SonarData.objects.filter(sonar_request_id__in=pks)._raw_delete(database)
+            self.result['requests'] += SonarRequest.objects.filter(pk__in=pks)._raw_delete(database)
+
+    def _delete_entries(self, pks):
+        self.result['entries'] += SonarData.objects.filter(pk__in=pks)._raw_delete(router.db_for_write(SonarData))
@@ -9,33 +9,60 @@ Handles saving request data to SonarData model with different categories:
 - session (session data)
 - dumps (sonar() dumps)
 - exceptions (exception data)
+- events (sonar_event() entries)
+- logs (SonarHandler records)
+
+DataCollector writes every entry as soon as it is saved. BatchDataCollector
+gathers entries in memory and writes them all at once, together with the
+SonarRequest row. Both write through the configured storage backend (see
+``django_sonar.storage``): with the database backend this is a single
+bulk_create in one transaction.
 """
 
 from django_sonar.models import SonarData
 from django_sonar import utils
-from django_sonar.utils import make_json_serializable
+from django_sonar.storage import get_storage
+from django_sonar.utils import get_sonar_settings, make_json_serializable
+from .blobs import build_blob
+from .fingerprints import detect_n_plus_one
+
+
+DEFAULT_BULK_BATCH_SIZE = 500
+
+
+def get_bulk_batch_size():
+    """
+    Return the max number of rows per INSERT used by bulk writes.
+
+    :return: DJANGO_SONAR['bulk_batch_size'] or the default (500)
+    """
+    return max(1, int(get_sonar_settings().get('bulk_batch_size', DEFAULT_BULK_BATCH_SIZE)))
 
 
 class DataCollector:
     """Handles collection and persistence of request data"""
 
-    def __init__(self, sonar_request_uuid):
+    def __init__(self, sonar_request_uuid, created_at=None):
         """
         Initialize collector with request UUID.
         
         :param sonar_request_uuid: UUID of the SonarRequest instance
+        :param created_at: Optional timestamp stored on every entry
         """
         self.sonar_request_uuid = sonar_request_uuid
+        self.created_at = created_at
+        self.blobs = {}
 
-    def save_entry(self, category, payload, request_uuid=None, tags=None, meta=None):
+    def build_entry(self, category, payload, request_uuid=None, tags=None, meta=None):
         """
-        Save a generic SonarData entry for any category.
+        Build an unsaved SonarData entry for any category.
 
         :param category: Entry category key
         :param payload: JSON-serializable payload body
         :param request_uuid: Optional SonarRequest UUID override
         :param tags: Optional list of tags
         :param meta: Optional metadata dictionary
+        :return: Unsaved SonarData instance
         """
         target_request_uuid = request_uuid or self.sonar_request_uuid
         if not target_request_uuid:
@@ -49,20 +76,46 @@ class DataCollector:
             if meta is not None:
                 data['meta'] = meta
 
-        SonarData.objects.create(
-            sonar_request_id=target_request_uuid,
-            category=category,
-            data=make_json_serializable(data)
-        )
+        fields = {
+            'sonar_request_id': target_request_uuid,
+            'category': category,
+            'data': make_json_serializable(data),
+        }
+        if self.created_at is not None:
+            fields['created_at'] = self.created_at
+
+        # Repeated payloads are stored once and referenced
+        blob = build_blob(category, fields['data'])
+        if blob is not None:
+            self.blobs[blob.hash] = blob
+            fields['data'] = None
+            fields['blob_id'] = blob.hash
+
+        return SonarData(**fields)
+
+    def save_entry(self, category, payload, request_uuid=None, tags=None, meta=None):
+        """
+        Save a generic SonarData entry for any category.
+
+        :param category: Entry category key
+        :param payload: JSON-serializable payload body
+        :param request_uuid: Optional SonarRequest UUID override
+        :param tags: Optional list of tags
+        :param meta: Optional metadata dictionary
+        """
+        entry = self.build_entry(category, payload, request_uuid=request_uuid, tags=tags, meta=meta)
+        blobs, self.blobs = self.blobs, {}
+        get_storage().save_entries([entry], blobs=blobs)
 
-    def save_details(self, user_info, view_func, middlewares_used, memory_diff):
+    def save_details(self, user_info, view_func, middlewares_used, memory_diff, memory_profile=None):
         """
         Save request details (user, view, memory, middlewares).
         
         :param user_info: Dictionary with user information or None
         :param view_func: String identifying the view function
         :param middlewares_used: List/tuple of middleware names
-        :param memory_diff: Memory usage in MB
+        :param memory_diff: Memory usage in MB, or None when not profiled
+        :param memory_profile: Optional dictionary with peak (MB) and top_allocations
         """
         details = {
             'user_info': user_info,
@@ -70,6 +123,9 @@ class DataCollector:
             'middlewares_used': middlewares_used,
             'memory_used': memory_diff
         }
+        if memory_profile:
+            details['memory_peak'] = memory_profile['peak']
+            details['memory_top_allocations'] = memory_profile['top_allocations']
         self.save_entry('details', details)
 
     def save_payload(self, get_payload, post_payload):
@@ -85,18 +141,32 @@ class DataCollector:
         }
         self.save_entry('payload', payload)
 
-    def save_queries(self, executed_queries):
+    def save_queries(self, executed_queries, query_count=None, aliases=None):
         """
         Save database queries executed during request.
         
-        :param executed_queries: List of query dictionaries from Django
+        :param executed_queries: List of query dictionaries (sql, params, time, rowcount, alias)
+        :param query_count: Total number of queries, when more were executed than kept
+        :param aliases: Optional per-alias totals {alias: {'count': int, 'time': ms}}
         """
         queries = {
             'executed_queries': executed_queries,
-            'query_count': len(executed_queries)
+            'query_count': len(executed_queries) if query_count is None else query_count
         }
+        if aliases is not None:
+            queries['aliases'] = aliases
         self.save_entry('queries', queries)
 
+    def save_n_plus_one(self, executed_queries):
+        """
+        Save N+1 findings (fingerprints repeated above the threshold), if any.
+
+        :param executed_queries: List of query dictionaries
+        """
+        findings = detect_n_plus_one(executed_queries)
+        if findings:
+            self.save_entry('n_plus_one', {'findings': findings})
+
     def save_headers(self, request_headers):
         """
         Save request headers.
@@ -119,46 +189,129 @@ class DataCollector:
         }
         self.save_entry('session', session)
 
-    def save_dumps(self):
+    def save_dumps(self, sonar_dumps=None):
         """
-        Save sonar() dumps from thread local storage.
+        Save sonar() dumps from request-scoped storage.
         
-        Retrieves dumps from utils.get_sonar_dump() and resets them.
+        Retrieves dumps from utils.get_sonar_dump() and resets them,
+        unless an explicit list of dumps is given.
+
+        :param sonar_dumps: Optional list of dumps captured earlier
         """
-        sonar_dumps = utils.get_sonar_dump()
+        if sonar_dumps is None:
+            sonar_dumps = utils.get_sonar_dump()
+            utils.reset_sonar_dump()
         for dump in sonar_dumps:
             self.save_entry('dumps', dump)
-        utils.reset_sonar_dump()
 
-    def save_exceptions(self):
+    def save_exceptions(self, sonar_exceptions=None):
         """
-        Save exception data from thread local storage.
+        Save exception data from request-scoped storage.
         
-        Retrieves exceptions from utils.get_sonar_exceptions() and resets them.
+        Retrieves exceptions from utils.get_sonar_exceptions() and resets them,
+        unless an explicit list of exceptions is given.
+
+        :param sonar_exceptions: Optional list of exceptions captured earlier
         """
-        sonar_exceptions = utils.get_sonar_exceptions()
+        if sonar_exceptions is None:
+            sonar_exceptions = utils.get_sonar_exceptions()
+            utils.reset_sonar_exceptions()
         for ex in sonar_exceptions:
             self.save_entry('exception', ex)
-        utils.reset_sonar_exceptions()
 
-    def save_events(self):
+    def save_events(self, sonar_events=None):
         """
-        Save structured events from thread local storage.
+        Save structured events from request-scoped storage.
+
+        Retrieves events from utils.get_sonar_events() and resets them,
+        unless an explicit list of events is given.
 
-        Retrieves events from utils.get_sonar_events() and resets them.
+        :param sonar_events: Optional list of events captured earlier
         """
-        sonar_events = utils.get_sonar_events()
+        if sonar_events is None:
+            sonar_events = utils.get_sonar_events()
+            utils.reset_sonar_events()
         for event in sonar_events:
             self.save_entry('events', event)
-        utils.reset_sonar_events()
 
-    def save_logs(self):
+    def save_logs(self, sonar_logs=None):
         """
-        Save structured log entries from thread local storage.
+        Save structured log entries from request-scoped storage.
 
-        Retrieves logs from utils.get_sonar_logs() and resets them.
+        Retrieves logs from utils.get_sonar_logs() and resets them,
+        unless an explicit list of log entries is given.
+
+        :param sonar_logs: Optional list of log entries captured earlier
         """
-        sonar_logs = utils.get_sonar_logs()
+        if sonar_logs is None:
+            sonar_logs = utils.get_sonar_logs()
+            utils.reset_sonar_logs()
         for log_entry in sonar_logs:
             self.save_entry('logs', log_entry)
-        utils.reset_sonar_logs()
+
+    def save_snapshot(self, snapshot):
+        """
+        Save every category captured in a request snapshot.
+
+        :param snapshot: Snapshot dictionary built by the middleware
+        """
+        self.save_details(
+            snapshot['user_info'],
+            snapshot['view_func'],
+            snapshot['middlewares_used'],
+            snapshot['memory_used'],
+            snapshot.get('memory_profile'),
+        )
+        self.save_payload(snapshot['get_payload'], snapshot['post_payload'])
+        self.save_queries(snapshot['queries'], snapshot.get('query_count'), snapshot.get('query_aliases'))
+        self.save_n_plus_one(snapshot['queries'])
+        self.save_headers(snapshot['headers'])
+        self.save_session(snapshot['session'])
+        self.save_events(snapshot['events'])
+        self.save_logs(snapshot['logs'])
+        self.save_dumps(snapshot['dumps'])
+        self.save_exceptions(snapshot['exceptions'])
+
+
+class BatchDataCollector(DataCollector):
+    """Collects request data in memory and writes it with one bulk insert"""
+
+    def __init__(self, sonar_request_uuid, created_at=None, max_batch_size=None):
+        """
+        Initialize collector with request UUID.
+
+        :param sonar_request_uuid: UUID of the SonarRequest instance
+        :param created_at: Optional timestamp stored on every entry
+        :param max_batch_size: Max rows per INSERT (defaults to bulk_batch_size setting)
+        """
+        super().__init__(sonar_request_uuid, created_at=created_at)
+        self.max_batch_size = max_batch_size or get_bulk_batch_size()
+        self.entries = []
+
+    def save_entry(self, category, payload, request_uuid=None, tags=None, meta=None):
+        """
+        Queue a generic SonarData entry until flush() is called.
+
+        :param category: Entry category key
+        :param payload: JSON-serializable payload body
+        :param request_uuid: Optional SonarRequest UUID override
+        :param tags: Optional list of tags
+        :param meta: Optional metadata dictionary
+        """
+        self.entries.append(
+            self.build_entry(category, payload, request_uuid=request_uuid, tags=tags, meta=meta)
+        )
+
+    def flush(self, sonar_request=None):
+        """
+        Write all queued entries, and optionally the SonarRequest row, at once.
+
+        :param sonar_request: Optional unsaved SonarRequest inserted before the entries
+        :return: List of written SonarData instances
+        """
+        entries, self.entries = self.entries, []
+        blobs, self.blobs = self.blobs, {}
+        get_storage().save_entries(
+            entries, blobs=blobs, sonar_request=sonar_request, batch_size=self.max_batch_size
+        )
+        return entries
@@ -0,0 +1,253 @@
+"""
+Automatic EXPLAIN capture for slow query fingerprints.
+
+When a captured SELECT is slower than ``explain_threshold`` milliseconds,
+its query plan is fetched by a background thread on the same database
+alias (never on the request path) and stored once per fingerprint on
+SonarQueryStat. The plan is refreshed at most every
+``explain_refresh_interval`` seconds.
+
+Settings (all optional):
+- explain_threshold: min duration in ms to explain a query (default None, disabled)
+- explain_analyze: use EXPLAIN ANALYZE on PostgreSQL (default False). The
+  statement is really executed, inside a transaction that is rolled back
+- explain_refresh_interval: seconds before a plan is refreshed (default 3600)
+- explain_queue_size: max pending statements to explain (default 100)
+
+Supported backends: SQLite (EXPLAIN QUERY PLAN), PostgreSQL and MySQL.
+Only SELECT statements are explained.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+from datetime import timedelta
+
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from django_sonar.models import SonarQueryStat
+from django_sonar.utils import get_sonar_settings
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 3600
+DEFAULT_QUEUE_SIZE = 100
+
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+class ExplainUnsupported(Exception):
+    """Raised when a statement or backend cannot be explained"""
+
+
+def get_explain_threshold():
+    return get_sonar_settings().get('explain_threshold')
+
+
+def get_refresh_interval():
+    return timedelta(seconds=get_sonar_settings().get('explain_refresh_interval', DEFAULT_REFRESH_INTERVAL))
+
+
+def is_explainable(sql, params):
+    """
+    Check whether a captured statement can safely be explained.
+
+    :param sql: SQL statement
+    :param params: Captured parameters
+    :return: True for single SELECT statements, False otherwise
+    """
+    if not sql.lstrip().upper().startswith('SELECT') or ';' in sql.rstrip().rstrip(';'):
+        return False
+    # executemany() parameters are a list of parameter lists
+    if params and isinstance(params[0], (list, tuple)):
+        return False
+    return True
+
+
+def explain_query(sql, params, alias, analyze=False):
+    """
+    Run EXPLAIN for a statement on the given database alias.
+
+    :param sql: SQL statement
+    :param params: Statement parameters
+    :param alias: Database alias the statement ran on
+    :param analyze: Use EXPLAIN ANALYZE where supported
+    :return: Query plan as text
+    """
+    connection = connections[alias]
+    vendor = connection.vendor
+
+    if vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif vendor == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    elif vendor == 'mysql':
+        prefix = 'EXPLAIN '
+    else:
+        raise ExplainUnsupported(f'EXPLAIN is not supported on "{vendor}".')
+
+    with transaction.atomic(using=alias):
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params or None)
+            rows = cursor.fetchall()
+        # EXPLAIN ANALYZE really runs the statement: never keep its effects
+        transaction.set_rollback(True, using=alias)
+
+    if vendor == 'sqlite':
+        # Rows are (id, parent, notused, detail), rebuild the tree indentation
+        depths = {0: -1}
+        lines = []
+        for node_id, parent, _notused, detail in rows:
+            depths[node_id] = depths.get(parent, -1) + 1
+            lines.append('  ' * depths[node_id] + detail)
+        return '\n'.join(lines)
+
+    return '\n'.join(' | '.join(str(column) for column in row) for row in rows)
+
+
+class ExplainWorker:
+    """Bounded queue of statements explained by a background thread"""
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, analyze=False):
+        """
+        Initialize the worker. The thread is started by ``start()``.
+
+        :param queue_size: Maximum number of statements waiting
+        :param analyze: Use EXPLAIN ANALYZE where supported
+        """
+        self.analyze = analyze
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the background thread (no-op if already running)."""
+        if self.is_running:
+            return
+        self._thread = threading.Thread(target=self._run, name='django-sonar-explain', daemon=True)
+        self._thread.start()
+
+    def submit(self, fingerprint, sql, params, alias):
+        """
+        Queue a statement unless its fingerprint is already waiting.
+
+        :return: True if queued, False otherwise
+        """
+        with self._pending_lock:
+            if fingerprint in self._pending:
+                return False
+            try:
+                self._queue.put_nowait((fingerprint, sql, params, alias))
+            except queue.Full:
+                return False
+            self._pending.add(fingerprint)
+        return True
+
+    def process_pending(self):
+        """Synchronously explain every queued statement in the calling thread."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._explain(*item)
+
+    def stop(self):
+        """Stop the background thread, dropping statements not explained yet."""
+        if self._thread is not None:
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._queue.put(None)
+            self._thread.join(5.0)
+            self._thread = None
+
+    def _explain(self, fingerprint, sql, params, alias):
+        try:
+            plan = explain_query(sql, params, alias, analyze=self.analyze)
+        except ExplainUnsupported:
+            plan = ''
+        except Exception:
+            logger.exception('django-sonar could not explain query %s', fingerprint)
+            plan = ''
+        finally:
+            with self._pending_lock:
+                self._pending.discard(fingerprint)
+
+        # Failures are stored too, so they are only retried after the refresh interval
+        try:
+            SonarQueryStat.objects.filter(fingerprint=fingerprint).update(
+                explain_plan=plan, explain_sql=sql, explained_at=timezone.now()
+            )
+        except Exception:
+            logger.exception('django-sonar could not store the plan of query %s', fingerprint)
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                close_old_connections()
+                self._explain(*item)
+        finally:
+            connections.close_all()
+
+
+def get_explain_worker():
+    """
+    Return the process-wide explain worker, (re)created after a fork.
+
+    :return: Running ExplainWorker instance
+    """
+    global _worker, _worker_pid
+
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid():
+            sonar_settings = get_sonar_settings()
+            _worker = ExplainWorker(
+                sonar_settings.get('explain_queue_size', DEFAULT_QUEUE_SIZE),
+                bool(sonar_settings.get('explain_analyze', False)),
+            )
+            _worker_pid = os.getpid()
+        _worker.start()
+        return _worker
+
+
+def shutdown_explain_worker():
+    """Stop the process-wide explain worker."""
+    global _worker, _worker_pid
+
+    with _worker_lock:
+        worker, _worker, _worker_pid = _worker, None, None
+    if worker is not None:
+        worker.stop()
+
+
+def schedule_explains(candidates):
+    """
+    Hand slow statements to the explain worker.
+
+    :param candidates: List of (fingerprint, sql, params, alias) tuples
+    """
+    if not candidates:
+        return
+    worker = get_explain_worker()
+    for candidate in candidates:
+        worker.submit(*candidate)
+
+
+atexit.register(shutdown_explain_worker)
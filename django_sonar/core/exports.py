@@ -0,0 +1,151 @@
+"""
+Streaming export of the captured requests.
+
+Requests are read oldest first in keyset-paginated pages: each page is
+``(created_at, uuid) > last row of the previous page``, which stays an
+index range scan however deep into the table the export is, where OFFSET
+pagination would rescan every skipped row. The entries of a page are
+read with ``QuerySet.iterator()`` (a server-side cursor on PostgreSQL),
+together with their shared blob, and decoded through ``SonarData.data``.
+Only one page of requests is held in memory at a time.
+
+Every exported request is a plain dictionary: the SonarRequest columns plus
+an ``entries`` list of {category, created_at, data}, in the order they were
+captured.
+"""
+
+import json
+from functools import reduce
+from operator import or_
+
+from django.db.models import Exists, OuterRef, Q
+
+from django_sonar.models import SonarData, SonarRequest
+from django_sonar.utils import make_json_serializable
+
+
+DEFAULT_CHUNK_SIZE = 500
+
+EXPORT_REQUEST_FIELDS = tuple(field.attname for field in SonarRequest._meta.concrete_fields)
+
+
+def get_status_filter(statuses):
+    """
+    Build a filter on status codes ('404') or classes ('5xx').
+
+    :param statuses: Iterable of status codes or classes
+    :return: Q object, or None when no status is given
+    """
+    conditions = []
+    for status in statuses or ():
+        status = str(status).strip().lower()
+        if status.endswith('xx'):
+            conditions.append(Q(status__startswith=status[:-2]))
+        elif status:
+            conditions.append(Q(status=status))
+    return reduce(or_, conditions) if conditions else None
+
+
+def get_export_queryset(since=None, until=None, routes=None, statuses=None, categories=None):
+    """
+    Select the exported requests.
+
+    :param since: Oldest created_at included
+    :param until: created_at excluded from this date on
+    :param routes: Routes (URL patterns) exported
+    :param statuses: Status codes or classes exported
+    :param categories: Only export requests with entries of these categories
+    :return: SonarRequest queryset
+    """
+    queryset = SonarRequest.objects.all()
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    if until is not None:
+        queryset = queryset.filter(created_at__lt=until)
+    if routes:
+        queryset = queryset.filter(route__in=routes)
+    status_filter = get_status_filter(statuses)
+    if status_filter is not None:
+        queryset = queryset.filter(status_filter)
+    if categories:
+        queryset = queryset.filter(
+            Exists(SonarData.objects.filter(sonar_request=OuterRef('pk'), category__in=categories))
+        )
+    return queryset
+
+
+def iter_request_pages(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Read requests oldest first, one keyset-paginated page at a time.
+
+    :param queryset: SonarRequest queryset
+    :param chunk_size: Requests per page
+    :return: Iterator of lists of request dictionaries
+    """
+    queryset = queryset.order_by('created_at', 'uuid').values(*EXPORT_REQUEST_FIELDS)
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(
+                Q(created_at__gt=last['created_at']) | Q(created_at=last['created_at'], uuid__gt=last['uuid'])
+            )
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+
+
+def iter_page_entries(uuids, categories=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Read the entries of a page of requests.
+
+    :param uuids: Request UUIDs of the page
+    :param categories: Only read these categories
+    :param chunk_size: Rows fetched per round trip
+    :return: Iterator of SonarData instances, in capture order
+    """
+    queryset = SonarData.objects.filter(sonar_request_id__in=uuids)
+    if categories:
+        queryset = queryset.filter(category__in=categories)
+    return queryset.select_related('blob').order_by('pk').iterator(chunk_size=chunk_size)
+
+
+def iter_export(since=None, until=None, routes=None, statuses=None, categories=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream the selected requests with their entries.
+
+    :param since: Oldest created_at included
+    :param until: created_at excluded from this date on
+    :param routes: Routes (URL patterns) exported
+    :param statuses: Status codes or classes exported
+    :param categories: Categories of the exported entries (default all)
+    :param chunk_size: Requests per page
+    :return: Iterator of request dictionaries with an ``entries`` list
+    """
+    chunk_size = max(1, int(chunk_size))
+    queryset = get_export_queryset(since, until, routes, statuses, categories)
+    for requests in iter_request_pages(queryset, chunk_size):
+        entries = {request['uuid']: [] for request in requests}
+        for entry in iter_page_entries(list(entries), categories, chunk_size):
+            entries[entry.sonar_request_id].append({
+                'category': entry.category,
+                'created_at': entry.created_at,
+                'data': entry.data,
+            })
+        for request in requests:
+            request['entries'] = entries[request['uuid']]
+            yield request
+
+
+def dump_export_line(request):
+    """
+    Serialize an exported request as one NDJSON line (without the newline).
+
+    :param request: Dictionary yielded by iter_export()
+    :return: str
+    """
+    return json.dumps(make_json_serializable(request), ensure_ascii=False, separators=(',', ':'))
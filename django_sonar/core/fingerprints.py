@@ -0,0 +1,102 @@
+"""
+SQL fingerprinting and N+1 detection.
+
+A fingerprint is the normalized shape of a statement: comments are removed,
+literals and placeholders collapse to ``?``, IN-lists and multi-row VALUES
+collapse to a single item and whitespace is squeezed. Statements that only
+differ by their parameters share the same fingerprint.
+
+Normalization uses precompiled regular expressions instead of a full
+tokenizer and is cached per distinct SQL string, since the same statements
+are executed over and over.
+
+Settings (optional):
+- n_plus_one_threshold: min executions of one fingerprint within a request
+  to report an N+1 (default 5, None disables detection)
+"""
+
+import hashlib
+import re
+from functools import lru_cache
+
+from django_sonar.utils import get_sonar_settings
+
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+
+_COMMENTS = re.compile(r'/\*.*?\*/|--[^\n]*', re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'(?<![\w."])-?\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.IGNORECASE)
+_PLACEHOLDERS = re.compile(r'%s|%\(\w+\)s|\$\d+|(?<![:\w]):[A-Za-z_]\w*|\?')
+_IN_LISTS = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_VALUES_LISTS = re.compile(r'(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=4096)
+def normalize_sql(sql):
+    """
+    Normalize a SQL statement to its fingerprint text.
+
+    :param sql: SQL statement
+    :return: Normalized SQL string
+    """
+    normalized = _COMMENTS.sub(' ', sql)
+    normalized = _STRINGS.sub('?', normalized)
+    normalized = _PLACEHOLDERS.sub('?', normalized)
+    normalized = _NUMBERS.sub('?', normalized)
+    normalized = _IN_LISTS.sub('IN (...)', normalized)
+    normalized = _VALUES_LISTS.sub(r'\1', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+
+@lru_cache(maxsize=4096)
+def fingerprint_sql(sql):
+    """
+    Get a short stable identifier of a statement's fingerprint.
+
+    :param sql: SQL statement
+    :return: Hex digest of the normalized statement
+    """
+    return hashlib.blake2b(normalize_sql(sql).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def get_n_plus_one_threshold():
+    return get_sonar_settings().get('n_plus_one_threshold', DEFAULT_N_PLUS_ONE_THRESHOLD)
+
+
+def detect_n_plus_one(executed_queries, threshold=None):
+    """
+    Find fingerprints repeated within one request at least threshold times.
+
+    :param executed_queries: List of captured query dictionaries
+    :param threshold: Min repetitions (defaults to n_plus_one_threshold setting)
+    :return: List of findings (fingerprint, sql, count, total_time, call_site), worst first
+    """
+    if threshold is None:
+        threshold = get_n_plus_one_threshold()
+    if not threshold:
+        return []
+
+    groups = {}
+    for query in executed_queries:
+        sql = query.get('sql')
+        if not sql:
+            continue
+        fingerprint = fingerprint_sql(sql)
+        group = groups.get(fingerprint)
+        if group is None:
+            group = groups[fingerprint] = {
+                'fingerprint': fingerprint,
+                'sql': normalize_sql(sql),
+                'count': 0,
+                'total_time': 0.0,
+                'call_site': query.get('call_site'),
+            }
+        group['count'] += 1
+        group['total_time'] += float(query.get('time') or 0)
+
+    findings = [group for group in groups.values() if group['count'] >= threshold]
+    for finding in findings:
+        finding['total_time'] = round(finding['total_time'], 3)
+    return sorted(findings, key=lambda finding: (finding['count'], finding['total_time']), reverse=True)
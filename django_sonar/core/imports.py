@@ -0,0 +1,180 @@
+"""
+Bulk import of exported requests (see ``core.exports``).
+
+Requests are loaded in batches: one query finds the requests of the batch
+already present, then one transaction bulk-inserts the new requests, their
+shared blobs and their entries, and merges them into the route rollups.
+UUIDs and timestamps are preserved, and requests already present are
+skipped, so importing the same file twice is a no-op.
+
+Entries are built like captured ones (see ``core.collectors``), so the
+compression and deduplication settings of the importing environment apply.
+"""
+
+import json
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+
+from django_sonar.models import SonarData, SonarRequest
+from .blobs import write_blobs
+from .collectors import BatchDataCollector, get_bulk_batch_size
+from .exports import EXPORT_REQUEST_FIELDS
+from .rollups import collect_rollups, is_rollups_enabled, update_rollups
+
+
+DEFAULT_BATCH_SIZE = 500
+
+# SonarData columns checked by validation: the data is any JSON, the request is inserted with it
+ENTRY_VALIDATION_EXCLUDE = ['sonar_request', 'data', 'data_blob', 'blob']
+
+ImportedRequest = namedtuple('ImportedRequest', ['sonar_request', 'entries', 'blobs'])
+
+
+def read_ndjson(lines):
+    """
+    Parse NDJSON lines, skipping blank ones.
+
+    :param lines: Iterable of str
+    :return: Iterator of (line number, dictionary or the ValueError raised by the line)
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError('expected a JSON object')
+        except ValueError as exc:
+            record = exc
+        yield line_number, record
+
+
+def build_imported_request(record, validate=True):
+    """
+    Build the unsaved rows of an exported request.
+
+    :param record: Dictionary written by export_sonar_data
+    :param validate: Run model validation on the request and its entries
+    :return: ImportedRequest
+    """
+    if not record.get('uuid'):
+        raise ValueError('missing "uuid"')
+
+    fields = {}
+    for name in EXPORT_REQUEST_FIELDS:
+        if name in record:
+            fields[name] = SonarRequest._meta.get_field(name).to_python(record[name])
+    sonar_request = SonarRequest(**fields)
+    if validate:
+        sonar_request.full_clean(validate_unique=False, validate_constraints=False)
+
+    created_at_field = SonarData._meta.get_field('created_at')
+    collector = BatchDataCollector(sonar_request.uuid, created_at=sonar_request.created_at)
+    for item in record.get('entries') or []:
+        collector.save_entry(item['category'], item.get('data'))
+        entry = collector.entries[-1]
+        if item.get('created_at'):
+            entry.created_at = created_at_field.to_python(item['created_at'])
+        if validate:
+            entry.full_clean(exclude=ENTRY_VALIDATION_EXCLUDE, validate_unique=False, validate_constraints=False)
+
+    return ImportedRequest(sonar_request, collector.entries, collector.blobs)
+
+
+def get_rollup_request(imported):
+    sonar_request = imported.sonar_request
+    return {
+        'verb': sonar_request.verb,
+        'route': sonar_request.route,
+        'status': sonar_request.status,
+        'duration': sonar_request.duration,
+        'hostname': sonar_request.hostname,
+        'created_at': sonar_request.created_at,
+        'has_exception': any(entry.category == 'exception' for entry in imported.entries),
+    }
+
+
+class SonarImporter:
+    """Load exported requests in batched transactions"""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, validate=True, on_error=None):
+        """
+        Initialize the importer.
+
+        :param batch_size: Requests per transaction
+        :param validate: Run model validation on every row
+        :param on_error: Optional callable(line number, exception) called for invalid lines
+        """
+        self.batch_size = max(1, int(batch_size))
+        self.validate = validate
+        self.on_error = on_error
+        self.result = {'requests': 0, 'entries': 0, 'skipped': 0, 'invalid': 0}
+
+    def run(self, records):
+        """
+        Import records.
+
+        :param records: Iterable of (line number, dictionary) as yielded by read_ndjson()
+        :return: Dictionary {'requests', 'entries', 'skipped', 'invalid'}
+        """
+        batch = []
+        for line_number, record in records:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                batch.append(build_imported_request(record, self.validate))
+            except (ValidationError, ValueError, TypeError, KeyError) as exc:
+                self.result['invalid'] += 1
+                if self.on_error is not None:
+                    self.on_error(line_number, exc)
+                continue
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        return self.result
+
+    def write(self, batch):
+        """
+        Insert a batch of ImportedRequest, skipping the requests already present.
+
+        :param batch: List of ImportedRequest
+        """
+        # Look up and insert on the written database: a lagging replica would miss recent imports
+        database = router.db_for_write(SonarRequest)
+        existing = set(
+            SonarRequest.objects.using(database).filter(
+                uuid__in=[imported.sonar_request.uuid for imported in batch]
+            ).values_list('uuid', flat=True)
+        )
+        imported_requests = []
+        for imported in batch:
+            if imported.sonar_request.uuid in existing:
+                self.result['skipped'] += 1
+                continue
+            # Also skips a request repeated in the same file
+            existing.add(imported.sonar_request.uuid)
+            imported_requests.append(imported)
+        if not imported_requests:
+            return
+
+        entries = [entry for imported in imported_requests for entry in imported.entries]
+        blobs = {}
+        for imported in imported_requests:
+            blobs.update(imported.blobs)
+        rollups = collect_rollups(map(get_rollup_request, imported_requests)) if is_rollups_enabled() else {}
+
+        insert_size = get_bulk_batch_size()
+        with transaction.atomic(using=database):
+            SonarRequest.objects.bulk_create(
+                [imported.sonar_request for imported in imported_requests], batch_size=insert_size
+            )
+            write_blobs(blobs, batch_size=insert_size)
+            SonarData.objects.bulk_create(entries, batch_size=insert_size)
+            update_rollups(rollups)
+
+        self.result['requests'] += len(imported_requests)
+        self.result['entries'] += len(entries)
@@ -0,0 +1,263 @@
+"""
+Columnar Parquet export of the captured requests, for offline analytics.
+
+Requests are flattened into three tables, each a directory of Hive-style
+date partitions (``<table>/date=YYYY-MM-DD/part-<run>.parquet``, UTC dates)
+readable as one dataset by pyarrow, pandas, DuckDB or Spark:
+
+- requests: the SonarRequest columns, typed (status, duration, query count
+  and DB time are numbers), plus the user, view and memory from ``details``
+- queries: one row per captured statement of the ``queries`` entries
+- headers: one row per request header of the ``headers`` entries
+
+The pages of ``core.exports`` are read oldest first and every page is
+written as one row group, so only one page is held in memory and only the
+files of the current date are open. Each run writes new part files, so
+successive exports can share the same directory.
+
+Requires the optional pyarrow package (``pip install django-sonar[parquet]``).
+"""
+
+import os
+import uuid
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from .exports import get_export_queryset, iter_page_entries, iter_request_pages
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:  # optional dependency: pip install django-sonar[parquet]
+    pyarrow = None
+
+
+DEFAULT_PARQUET_CHUNK_SIZE = 5000
+
+PARQUET_CATEGORIES = ('details', 'queries', 'headers')
+
+PARQUET_COMPRESSIONS = ('snappy', 'zstd', 'gzip', 'none')
+
+PARQUET_TABLES = ('requests', 'queries', 'headers')
+
+
+def get_parquet_schemas():
+    """
+    Get the schema of every exported table.
+
+    :return: Dictionary {table: pyarrow.Schema}
+    """
+    created_at = ('created_at', pyarrow.timestamp('us', tz='UTC'))
+    return {
+        'requests': pyarrow.schema([
+            ('uuid', pyarrow.string()),
+            created_at,
+            ('verb', pyarrow.string()),
+            ('path', pyarrow.string()),
+            ('route', pyarrow.string()),
+            ('status', pyarrow.int16()),
+            ('duration', pyarrow.int32()),
+            ('query_count', pyarrow.int32()),
+            ('db_time', pyarrow.float64()),
+            ('ip_address', pyarrow.string()),
+            ('hostname', pyarrow.string()),
+            ('is_ajax', pyarrow.bool_()),
+            ('user_id', pyarrow.string()),
+            ('username', pyarrow.string()),
+            ('view_func', pyarrow.string()),
+            ('memory_used', pyarrow.float64()),
+            ('memory_peak', pyarrow.float64()),
+        ]),
+        'queries': pyarrow.schema([
+            ('request_uuid', pyarrow.string()),
+            created_at,
+            ('position', pyarrow.int32()),
+            ('alias', pyarrow.string()),
+            ('sql', pyarrow.string()),
+            ('time', pyarrow.float64()),
+            ('rowcount', pyarrow.int64()),
+            ('call_site', pyarrow.string()),
+        ]),
+        'headers': pyarrow.schema([
+            ('request_uuid', pyarrow.string()),
+            created_at,
+            ('name', pyarrow.string()),
+            ('value', pyarrow.string()),
+        ]),
+    }
+
+
+def get_status_code(status):
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_utc(created_at):
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at)
+    return created_at.astimezone(dt_timezone.utc)
+
+
+def get_request_row(request, details):
+    """
+    Flatten an exported request and its details entry.
+
+    :param request: Request dictionary of iter_request_pages()
+    :param details: Data of the details entry ({} when missing)
+    :return: Dictionary matching the requests schema
+    """
+    user_info = details.get('user_info') or {}
+    user_id = user_info.get('user_id')
+    return {
+        'uuid': str(request['uuid']),
+        'created_at': request['created_at'],
+        'verb': request['verb'],
+        'path': request['path'],
+        'route': request['route'],
+        'status': get_status_code(request['status']),
+        'duration': request['duration'],
+        'query_count': request['query_count'],
+        'db_time': request['db_time'],
+        'ip_address': request['ip_address'],
+        'hostname': request['hostname'],
+        'is_ajax': request['is_ajax'],
+        'user_id': str(user_id) if user_id is not None else None,
+        'username': user_info.get('username'),
+        'view_func': details.get('view_func'),
+        'memory_used': details.get('memory_used'),
+        'memory_peak': details.get('memory_peak'),
+    }
+
+
+def iter_query_rows(request, data):
+    for position, query in enumerate(data.get('executed_queries') or []):
+        yield {
+            'request_uuid': str(request['uuid']),
+            'created_at': request['created_at'],
+            'position': position,
+            'alias': query.get('alias'),
+            'sql': query.get('sql'),
+            'time': query.get('time'),
+            'rowcount': query.get('rowcount'),
+            'call_site': query.get('call_site'),
+        }
+
+
+def iter_header_rows(request, data):
+    for name, value in (data.get('request_headers') or {}).items():
+        yield {
+            'request_uuid': str(request['uuid']),
+            'created_at': request['created_at'],
+            'name': name,
+            'value': None if value is None else str(value),
+        }
+
+
+class ParquetExporter:
+    """Write pages of requests as date-partitioned Parquet tables"""
+
+    def __init__(self, directory, compression='snappy'):
+        """
+        Initialize the exporter.
+
+        :param directory: Root directory of the tables, created when missing
+        :param compression: One of PARQUET_COMPRESSIONS
+        """
+        if pyarrow is None:
+            raise ImproperlyConfigured('The Parquet export requires the pyarrow package.')
+        if compression not in PARQUET_COMPRESSIONS:
+            raise ImproperlyConfigured(f'Unknown Parquet compression "{compression}".')
+        self.directory = directory
+        self.compression = compression
+        self.run_id = uuid.uuid4().hex[:12]
+        self.schemas = get_parquet_schemas()
+        # Open writer of every table: (date, ParquetWriter), pages come oldest first
+        self.writers = {}
+        self.counts = dict.fromkeys(PARQUET_TABLES, 0)
+
+    def write_page(self, requests, chunk_size=DEFAULT_PARQUET_CHUNK_SIZE):
+        """
+        Write a page of requests with their flattened entries.
+
+        :param requests: Request dictionaries, oldest first
+        :param chunk_size: Entries fetched per round trip
+        """
+        # Copies: the page's last created_at is the keyset of the next page
+        requests = [dict(request, created_at=get_utc(request['created_at'])) for request in requests]
+        by_uuid = {request['uuid']: request for request in requests}
+
+        details = {}
+        rows = {'queries': defaultdict(list), 'headers': defaultdict(list)}
+        for entry in iter_page_entries(list(by_uuid), PARQUET_CATEGORIES, chunk_size):
+            request = by_uuid[entry.sonar_request_id]
+            data = entry.data or {}
+            if entry.category == 'details':
+                details[request['uuid']] = data
+            elif entry.category == 'queries':
+                rows['queries'][request['created_at'].date()].extend(iter_query_rows(request, data))
+            else:
+                rows['headers'][request['created_at'].date()].extend(iter_header_rows(request, data))
+
+        rows['requests'] = defaultdict(list)
+        for request in requests:
+            rows['requests'][request['created_at'].date()].append(
+                get_request_row(request, details.get(request['uuid'], {}))
+            )
+
+        for table in PARQUET_TABLES:
+            for date, table_rows in sorted(rows[table].items()):
+                if table_rows:
+                    self._get_writer(table, date).write_table(
+                        pyarrow.Table.from_pylist(table_rows, schema=self.schemas[table])
+                    )
+                    self.counts[table] += len(table_rows)
+
+    def _get_writer(self, table, date):
+        current = self.writers.get(table)
+        if current is not None and current[0] == date:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        directory = os.path.join(self.directory, table, f'date={date.isoformat()}')
+        os.makedirs(directory, exist_ok=True)
+        writer = pyarrow_parquet.ParquetWriter(
+            os.path.join(directory, f'part-{self.run_id}.parquet'),
+            self.schemas[table],
+            compression=self.compression,
+        )
+        self.writers[table] = (date, writer)
+        return writer
+
+    def close(self):
+        for _date, writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def export_parquet(directory, since=None, until=None, routes=None, statuses=None,
+                   chunk_size=DEFAULT_PARQUET_CHUNK_SIZE, compression='snappy'):
+    """
+    Export the selected requests as Parquet tables.
+
+    :param directory: Root directory of the tables
+    :param since: Oldest created_at included
+    :param until: created_at excluded from this date on
+    :param routes: Routes (URL patterns) exported
+    :param statuses: Status codes or classes exported
+    :param chunk_size: Requests per page and row group
+    :param compression: One of PARQUET_COMPRESSIONS
+    :return: Dictionary {table: rows written}
+    """
+    exporter = ParquetExporter(directory, compression)
+    chunk_size = max(1, int(chunk_size))
+    try:
+        for requests in iter_request_pages(get_export_queryset(since, until, routes, statuses), chunk_size):
+            exporter.write_page(requests, chunk_size)
+    finally:
+        exporter.close()
+    return exporter.counts
@@ -0,0 +1,257 @@
+"""
+Daily range partitioning of the Sonar tables on PostgreSQL.
+
+Optional layout where ``sonar_requests`` and ``sonar_data`` are partitioned
+by day on ``created_at``: one ``<table>_pYYYYMMDD`` partition per day plus
+a ``<table>_default`` partition catching rows outside the existing ranges.
+Partitions are created ahead of time by the ``partition_sonar_data``
+command, and retention drops whole partitions instead of deleting rows.
+
+PostgreSQL requires the partition key in every unique constraint, so in
+this layout the primary keys become (pk, created_at) and the database
+foreign key from ``sonar_data`` to ``sonar_requests`` is dropped. Nothing
+cascades then: retention and the clears delete the entry rows of the
+requests they delete explicitly, or drop their whole partitions. Day
+boundaries follow the timezone of the database connection (UTC when
+USE_TZ is enabled).
+"""
+
+import re
+from datetime import date, timedelta
+
+from django.db import connections, router, transaction
+
+from django_sonar.models import SonarData, SonarRequest
+
+
+PARTITIONED_MODELS = [SonarRequest, SonarData]
+PARTITION_KEY = 'created_at'
+
+
+class PartitioningUnsupported(Exception):
+    """Raised when the database of the Sonar tables is not PostgreSQL"""
+
+
+def get_connection():
+    # Partitions are created and dropped on the database the Sonar tables are written to
+    return connections[router.db_for_write(SonarRequest)]
+
+
+def get_partition_name(table, day):
+    """
+    Name of the partition of a table holding one day.
+
+    :param table: Partitioned table name
+    :param day: date of the partition
+    :return: Partition table name
+    """
+    return f'{table}_p{day:%Y%m%d}'
+
+
+def check_supported(connection=None):
+    """Raise PartitioningUnsupported unless the Sonar tables live on PostgreSQL."""
+    connection = connection or get_connection()
+    if connection.vendor != 'postgresql':
+        raise PartitioningUnsupported('Partitioning of the Sonar tables requires PostgreSQL.')
+
+
+def is_partitioned(model):
+    """
+    Check whether the table of a model is partitioned.
+
+    :param model: SonarRequest or SonarData
+    :return: True on PostgreSQL when the table is partitioned
+    """
+    connection = get_connection()
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [model._meta.db_table])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def get_partitions(model):
+    """
+    List the daily partitions of a model table.
+
+    :param model: SonarRequest or SonarData
+    :return: Sorted list of (day, partition name), the default partition excluded
+    """
+    table = model._meta.db_table
+    pattern = re.compile(rf'^{re.escape(table)}_p(\d{{8}})$')
+    with get_connection().cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = to_regclass(%s)',
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            value = match.group(1)
+            partitions.append((date(int(value[:4]), int(value[4:6]), int(value[6:])), name))
+    return sorted(partitions)
+
+
+def create_partition(model, day):
+    """
+    Create and attach the partition of one day, moving its rows out of the
+    default partition if any landed there.
+
+    :param model: SonarRequest or SonarData
+    :param day: date of the partition
+    :return: Partition name
+    """
+    connection = get_connection()
+    quote = connection.ops.quote_name
+    table = model._meta.db_table
+    name = get_partition_name(table, day)
+    default = f'{table}_default'
+    bounds = [day.isoformat(), (day + timedelta(days=1)).isoformat()]
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [default])
+        if cursor.fetchone()[0]:
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {quote(default)} '
+                f'WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *) '
+                f'INSERT INTO {quote(name)} SELECT * FROM moved',
+                bounds,
+            )
+        cursor.execute(f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)', bounds)
+    return name
+
+
+def create_partitions(start, days):
+    """
+    Create the missing daily partitions of the Sonar tables.
+
+    :param start: First day (date)
+    :param days: Number of days from start
+    :return: List of created partition names
+    """
+    check_supported()
+    created = []
+    for model in PARTITIONED_MODELS:
+        existing = {day for day, _name in get_partitions(model)}
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            if day not in existing:
+                created.append(create_partition(model, day))
+    return created
+
+
+def drop_partitions(before):
+    """
+    Drop the daily partitions entirely older than a day.
+
+    :param before: date, partitions of earlier days are dropped
+    :return: List of dictionaries (table, name, rows estimate, bytes on disk)
+    """
+    connection = get_connection()
+    check_supported(connection)
+    quote = connection.ops.quote_name
+    dropped = []
+    for model in PARTITIONED_MODELS:
+        for day, name in get_partitions(model):
+            if day >= before:
+                continue
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT GREATEST(reltuples, 0)::bigint, pg_total_relation_size(oid) '
+                    'FROM pg_class WHERE oid = to_regclass(%s)',
+                    [name],
+                )
+                rows, size = cursor.fetchone()
+                cursor.execute(f'DROP TABLE {quote(name)}')
+            dropped.append({'table': model._meta.db_table, 'name': name, 'rows': rows, 'bytes': size})
+    return dropped
+
+
+def get_index_statements(schema_editor, model):
+    """
+    Build the statements creating the indexes of a model table: its
+    Meta.indexes and the index of every db_index field (ForeignKeys such as
+    sonar_data.sonar_request_id and blob_id).
+
+    :param schema_editor: Schema editor of the Sonar tables database
+    :param model: SonarRequest or SonarData
+    :return: List of SQL statements
+    """
+    statements = [index.create_sql(model, schema_editor) for index in model._meta.indexes]
+    for field in model._meta.local_fields:
+        statements += schema_editor._field_indexes_sql(model, field)
+    return statements
+
+
+def convert_to_partitioned():
+    """
+    Recreate the Sonar tables as partitioned tables, copying existing rows.
+
+    Runs in one transaction and locks both tables while rows are copied:
+    run it on empty tables or during a maintenance window.
+
+    :return: List of created partition names
+    """
+    connection = get_connection()
+    check_supported(connection)
+    quote = connection.ops.quote_name
+    created = []
+
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            for model in PARTITIONED_MODELS:
+                table = model._meta.db_table
+                legacy = f'{table}_legacy'
+                pk = model._meta.pk.column
+                cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}')
+                cursor.execute(
+                    f'CREATE TABLE {quote(table)} (LIKE {quote(legacy)} '
+                    f'INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING STORAGE) '
+                    f'PARTITION BY RANGE ({PARTITION_KEY})'
+                )
+                cursor.execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY ({quote(pk)}, {PARTITION_KEY})')
+                cursor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+
+                # A serial (non identity) default keeps using the legacy sequence: move its ownership
+                cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [legacy, pk])
+                sequence = cursor.fetchone()[0]
+                if sequence and model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+                    cursor.execute(
+                        'SELECT attidentity FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = %s',
+                        [table, pk],
+                    )
+                    if not cursor.fetchone()[0]:
+                        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.{quote(pk)}')
+
+                cursor.execute(f'SELECT MIN({PARTITION_KEY})::date, MAX({PARTITION_KEY})::date FROM {quote(legacy)}')
+                first, last = cursor.fetchone()
+                if first is not None:
+                    for offset in range((last - first).days + 1):
+                        created.append(create_partition(model, first + timedelta(days=offset)))
+                cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(legacy)}')
+
+                if model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+                    cursor.execute(
+                        f'SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({quote(pk)}), 0) + 1, false) '
+                        f'FROM {quote(table)}',
+                        [table, pk],
+                    )
+
+            # sonar_data_legacy references sonar_requests_legacy: drop it first
+            for model in reversed(PARTITIONED_MODELS):
+                cursor.execute(f'DROP TABLE {quote(model._meta.db_table + "_legacy")}')
+
+        # LIKE copies no index: recreate them on the partitioned tables (propagated to every partition)
+        with connection.schema_editor() as schema_editor:
+            for model in PARTITIONED_MODELS:
+                for statement in get_index_statements(schema_editor, model):
+                    schema_editor.execute(statement)
+
+    return created
@@ -0,0 +1,168 @@
+"""
+Snapshot persistence utilities.
+
+A snapshot is a plain dictionary holding everything the middleware captured
+for one request: the SonarRequest columns (uuid, verb, path, status, ...)
+plus the raw data of every SonarData category (details, payload, queries,
+headers, session, events, logs, dumps, exceptions).
+
+Snapshots are persisted either inline at the end of the request or later,
+in batches, by the write-behind writer (see ``core.writer``).
+
+Requests dropped by tail sampling are never turned into snapshots: they
+are only counted in per-minute SonarSampleCounter rows and in the per-route
+rollups (see ``core.rollups``).
+"""
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import F
+
+from django_sonar.models import SonarData, SonarRequest, SonarRouteRollup, SonarSampleCounter
+from .blobs import write_blobs
+from .collectors import BatchDataCollector, get_bulk_batch_size
+from .query_stats import collect_query_stats, is_query_stats_enabled, update_query_stats
+from .rollups import collect_rollups, is_rollups_enabled, update_rollups
+
+
+SNAPSHOT_REQUEST_FIELDS = (
+    'uuid',
+    'verb',
+    'path',
+    'route',
+    'status',
+    'duration',
+    'query_count',
+    'db_time',
+    'ip_address',
+    'hostname',
+    'is_ajax',
+    'created_at',
+)
+
+
+def build_sonar_request(snapshot):
+    """
+    Build an unsaved SonarRequest instance from a snapshot.
+
+    Fields missing from the snapshot keep their model default.
+
+    :param snapshot: Snapshot dictionary built by the middleware
+    :return: SonarRequest instance
+    """
+    return SonarRequest(**{field: snapshot[field] for field in SNAPSHOT_REQUEST_FIELDS if field in snapshot})
+
+
+def build_snapshot_rows(snapshots):
+    """
+    Build the unsaved rows of a batch of snapshots.
+
+    :param snapshots: Iterable of snapshot dictionaries
+    :return: Tuple (SonarRequest list, SonarData list, {hash: SonarBlob})
+    """
+    sonar_requests = []
+    entries = []
+    blobs = {}
+
+    for snapshot in snapshots:
+        sonar_request = build_sonar_request(snapshot)
+        collector = BatchDataCollector(sonar_request.uuid, created_at=sonar_request.created_at)
+        collector.save_snapshot(snapshot)
+
+        sonar_requests.append(sonar_request)
+        entries.extend(collector.entries)
+        blobs.update(collector.blobs)
+
+    return sonar_requests, entries, blobs
+
+
+def persist_snapshots(snapshots, batch_size=None):
+    """
+    Persist a batch of snapshots in a single transaction.
+
+    All SonarRequest rows are written with one bulk_create, followed by one
+    bulk_create for every SonarData entry of every snapshot, and the query
+    fingerprint statistics and route rollups of the whole batch are updated
+    at once.
+
+    :param snapshots: Iterable of snapshot dictionaries
+    :param batch_size: Max rows per INSERT (defaults to bulk_batch_size setting)
+    """
+    snapshots = list(snapshots)
+    batch_size = batch_size or get_bulk_batch_size()
+    sonar_requests, entries, blobs = build_snapshot_rows(snapshots)
+    if not sonar_requests:
+        return
+
+    query_stats = collect_query_stats(snapshots) if is_query_stats_enabled() else {}
+    rollups = collect_rollups(snapshots) if is_rollups_enabled() else {}
+
+    # bulk_create writes through the router: the transaction must be on the same database
+    with transaction.atomic(using=router.db_for_write(SonarRequest)):
+        SonarRequest.objects.bulk_create(sonar_requests, batch_size=batch_size)
+        write_blobs(blobs, batch_size=batch_size)
+        SonarData.objects.bulk_create(entries, batch_size=batch_size)
+        update_query_stats(query_stats)
+        update_rollups(rollups)
+
+
+def get_sample_counter_key(summary):
+    """
+    Get the SonarSampleCounter row a dropped request is counted in.
+
+    :param summary: Summary dictionary built by the middleware
+    :return: Tuple (bucket, hostname), bucket truncated to the minute
+    """
+    bucket = summary['created_at'].replace(second=0, microsecond=0)
+    return bucket, summary['hostname'] or ''
+
+
+def add_sample_count(counts, summary):
+    """
+    Add a dropped request to an in-memory {key: [dropped, total_duration]} dictionary.
+
+    :param counts: Dictionary being accumulated
+    :param summary: Summary dictionary built by the middleware
+    """
+    totals = counts.setdefault(get_sample_counter_key(summary), [0, 0.0])
+    totals[0] += 1
+    totals[1] += summary['duration']
+
+
+def persist_sample_counts(counts):
+    """
+    Add accumulated dropped-request counts to their SonarSampleCounter rows.
+
+    Every bucket costs one UPDATE, plus one INSERT the first time it is seen.
+
+    :param counts: Dictionary {(bucket, hostname): [dropped, total_duration]}
+    """
+    using = router.db_for_write(SonarSampleCounter)
+    with transaction.atomic(using=using):
+        for (bucket, hostname), (dropped, total_duration) in counts.items():
+            counter = SonarSampleCounter.objects.filter(bucket=bucket, hostname=hostname)
+            increments = {
+                'dropped': F('dropped') + dropped,
+                'total_duration': F('total_duration') + total_duration,
+            }
+            if counter.update(**increments):
+                continue
+            try:
+                with transaction.atomic(using=using):
+                    SonarSampleCounter.objects.create(
+                        bucket=bucket, hostname=hostname, dropped=dropped, total_duration=total_duration
+                    )
+            except IntegrityError:
+                # Another process created the bucket in the meantime
+                counter.update(**increments)
+
+
+def persist_rollups(deltas):
+    """
+    Merge the rollups of requests dropped by tail sampling.
+
+    :param deltas: Dictionary built with core.rollups.add_rollup()
+    """
+    if not deltas:
+        return
+    with transaction.atomic(using=router.db_for_write(SonarRouteRollup)):
+        update_rollups(deltas)
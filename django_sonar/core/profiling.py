@@ -0,0 +1,160 @@
+"""
+Opt-in memory profiling.
+
+tracemalloc slows down every allocation of the whole process while it is
+tracing, so it is only running while at least one profiled request is in
+flight. A captured request is profiled when:
+
+- memory_profiling_rate: it is picked by this fraction of captured requests
+  (default 0.0, never)
+- memory_profiling_header: it carries this header (default 'X-Sonar-Profile')
+  with a valid token from get_profiling_token(), signed with SECRET_KEY and
+  valid for memory_profiling_token_max_age seconds (default 3600)
+
+Profiled requests record the memory allocated during the request, the peak
+traced memory and the top memory_profiling_top_n (default 10) allocation
+sites, diffing tracemalloc snapshots taken before and after the view.
+
+tracemalloc is process-wide: concurrent profiled requests see each other's
+allocations, and a tracemalloc session started by someone else is reused
+and left running.
+"""
+
+import random
+import threading
+import tracemalloc
+
+from django.core import signing
+
+from django_sonar.utils import get_sonar_settings
+
+
+PROFILING_SALT = 'django_sonar.memory_profiling'
+PROFILING_TOKEN_VALUE = 'profile'
+
+_lock = threading.Lock()
+_active_profiles = 0
+_owns_tracing = False
+
+
+def get_profiling_token():
+    """
+    Build a header value that enables memory profiling for one request.
+
+    :return: Signed token string
+    """
+    return signing.TimestampSigner(salt=PROFILING_SALT).sign(PROFILING_TOKEN_VALUE)
+
+
+def _acquire_tracing():
+    global _active_profiles, _owns_tracing
+
+    with _lock:
+        if _active_profiles == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _owns_tracing = True
+        _active_profiles += 1
+        tracemalloc.reset_peak()
+
+
+def _release_tracing():
+    global _active_profiles, _owns_tracing
+
+    with _lock:
+        _active_profiles -= 1
+        if _active_profiles == 0 and _owns_tracing:
+            tracemalloc.stop()
+            _owns_tracing = False
+
+
+class MemoryProfiler:
+    """Decides which requests are memory profiled and measures them"""
+
+    DEFAULT_HEADER = 'X-Sonar-Profile'
+    DEFAULT_TOP_N = 10
+    DEFAULT_TOKEN_MAX_AGE = 3600
+
+    def __init__(self):
+        """Initialize profiler with rate, header and limits from settings"""
+        sonar_settings = get_sonar_settings()
+
+        self.rate = float(sonar_settings.get('memory_profiling_rate', 0.0))
+        self.top_n = int(sonar_settings.get('memory_profiling_top_n', self.DEFAULT_TOP_N))
+        self.token_max_age = sonar_settings.get('memory_profiling_token_max_age', self.DEFAULT_TOKEN_MAX_AGE)
+
+        header = sonar_settings.get('memory_profiling_header', self.DEFAULT_HEADER)
+        self.header_meta_key = 'HTTP_' + header.upper().replace('-', '_') if header else None
+
+    def has_valid_token(self, request):
+        """
+        Check whether the request carries a valid signed profiling token.
+
+        :param request: Django request object
+        :return: True if the token is present and valid, False otherwise
+        """
+        token = request.META.get(self.header_meta_key) if self.header_meta_key else None
+        if not token:
+            return False
+        try:
+            value = signing.TimestampSigner(salt=PROFILING_SALT).unsign(token, max_age=self.token_max_age)
+        except signing.BadSignature:
+            return False
+        return value == PROFILING_TOKEN_VALUE
+
+    def should_profile(self, request):
+        """
+        Decide whether a captured request should be memory profiled.
+
+        :param request: Django request object
+        :return: True if the request should be profiled, False otherwise
+        """
+        if self.has_valid_token(request):
+            return True
+        return self.rate > 0.0 and random.random() < self.rate
+
+    def start(self):
+        """
+        Start profiling the current request.
+
+        :return: Opaque profiling state to pass to stop()
+        """
+        _acquire_tracing()
+        return {
+            'snapshot': tracemalloc.take_snapshot(),
+            'current': tracemalloc.get_traced_memory()[0],
+        }
+
+    def stop(self, state):
+        """
+        Stop profiling the current request and report what it allocated.
+
+        :param state: State returned by start()
+        :return: Dictionary with memory_used and peak (MB) and top_allocations
+        """
+        try:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            _release_tracing()
+
+        ignored = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        )
+        stats = snapshot.filter_traces(ignored).compare_to(state['snapshot'].filter_traces(ignored), 'lineno')
+
+        top_allocations = []
+        for stat in stats[:self.top_n]:
+            frame = stat.traceback[0]
+            top_allocations.append({
+                'file_name': frame.filename,
+                'line_number': frame.lineno,
+                'size_diff': stat.size_diff / 1024,  # Convert to KB
+                'count_diff': stat.count_diff,
+            })
+
+        return {
+            'memory_used': (current - state['current']) / 1024 / 1024,  # Convert to MB
+            'peak': peak / 1024 / 1024,  # Convert to MB
+            'top_allocations': top_allocations,
+        }
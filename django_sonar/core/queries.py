@@ -0,0 +1,170 @@
+"""
+SQL capture based on ``connection.execute_wrapper``.
+
+Unlike ``connection.queries`` this works with ``DEBUG = False`` and never
+touches ``queries_log``. A recorder is installed on every database
+connection when it is created (see ``apps.DjangoSonarConfig.ready``); it
+only records while a request capture is active in the current context, so
+queries outside captured requests cost a single context variable lookup.
+
+Settings (optional):
+- max_queries: max statements kept per request (default 1000); statements
+  past the cap are still counted
+- query_aliases: database aliases to capture (default None, every alias
+  in DATABASES)
+
+Kept statements are annotated with their call site (see ``core.callsite``).
+"""
+
+import time
+from contextvars import ContextVar
+
+from django_sonar.utils import get_sonar_settings, make_json_serializable
+from .callsite import get_call_site, is_call_site_enabled
+
+
+DEFAULT_MAX_QUERIES = 1000
+
+_query_buffer = ContextVar('sonar_query_buffer', default=None)
+
+
+class QueryBuffer:
+    """Bounded per-request buffer of executed statements"""
+
+    def __init__(self, max_queries=DEFAULT_MAX_QUERIES, call_sites=False):
+        """
+        Initialize an empty buffer.
+
+        :param max_queries: Maximum number of statements kept
+        :param call_sites: Whether kept statements are annotated with their call site
+        """
+        self.max_queries = max(0, int(max_queries))
+        self.call_sites = call_sites
+        self.queries = []
+        self.count = 0
+        self.time = 0.0
+        self.aliases = {}
+
+    @property
+    def is_full(self):
+        """Whether new statements are only counted."""
+        return len(self.queries) >= self.max_queries
+
+    @property
+    def truncated(self):
+        """Number of statements counted but not kept."""
+        return self.count - len(self.queries)
+
+    def add(self, sql, params, duration, rowcount, alias, call_site=None):
+        """
+        Record one executed statement.
+
+        :param sql: SQL statement
+        :param params: Raw statement parameters
+        :param duration: Execution time in milliseconds
+        :param rowcount: Cursor rowcount, or None if the statement failed
+        :param alias: Database alias the statement ran on
+        :param call_site: Optional 'path:line in function' of the calling code
+        """
+        self.count += 1
+        self.time += duration
+
+        alias_stats = self.aliases.get(alias)
+        if alias_stats is None:
+            alias_stats = self.aliases[alias] = {'count': 0, 'time': 0.0}
+        alias_stats['count'] += 1
+        alias_stats['time'] += duration
+
+        if len(self.queries) < self.max_queries:
+            self.queries.append((sql, params, duration, rowcount, alias, call_site))
+
+    def as_list(self):
+        """
+        Get the recorded statements as JSON-serializable dictionaries.
+
+        :return: List of dictionaries with sql, params, time (ms), rowcount, alias and call_site
+        """
+        return [
+            {
+                'sql': sql,
+                'params': make_json_serializable(params),
+                'time': round(duration, 3),
+                'rowcount': rowcount,
+                'alias': alias,
+                'call_site': call_site,
+            }
+            for sql, params, duration, rowcount, alias, call_site in self.queries
+        ]
+
+    def get_alias_stats(self):
+        """
+        Get per-alias totals, including statements past the cap.
+
+        :return: Dictionary {alias: {'count': int, 'time': ms}}
+        """
+        return {
+            alias: {'count': stats['count'], 'time': round(stats['time'], 3)}
+            for alias, stats in self.aliases.items()
+        }
+
+
+def get_max_queries():
+    return int(get_sonar_settings().get('max_queries', DEFAULT_MAX_QUERIES))
+
+
+def get_query_aliases():
+    aliases = get_sonar_settings().get('query_aliases')
+    return None if aliases is None else set(aliases)
+
+
+def start_query_capture():
+    """
+    Start recording queries executed in the current context.
+
+    :return: The new QueryBuffer
+    """
+    buffer = QueryBuffer(get_max_queries(), call_sites=is_call_site_enabled())
+    _query_buffer.set(buffer)
+    return buffer
+
+
+def stop_query_capture():
+    """
+    Stop recording queries in the current context.
+
+    :return: The QueryBuffer that was active, or an empty one
+    """
+    buffer = _query_buffer.get()
+    _query_buffer.set(None)
+    return buffer if buffer is not None else QueryBuffer(0)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper recording statements into the active QueryBuffer."""
+    buffer = _query_buffer.get()
+    if buffer is None:
+        return execute(sql, params, many, context)
+
+    rowcount = None
+    start = time.perf_counter()
+    try:
+        result = execute(sql, params, many, context)
+        rowcount = context['cursor'].rowcount
+        return result
+    finally:
+        duration = (time.perf_counter() - start) * 1000  # Convert to milliseconds
+        call_site = get_call_site() if buffer.call_sites and not buffer.is_full else None
+        buffer.add(sql, params, duration, rowcount, context['connection'].alias, call_site)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    """
+    Install the recorder on a database connection (connection_created receiver).
+
+    :param connection: DatabaseWrapper instance
+    """
+    aliases = get_query_aliases()
+    if aliases is not None and connection.alias not in aliases:
+        return
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
@@ -0,0 +1,160 @@
+"""
+Per-fingerprint query statistics.
+
+Every persisted batch of snapshots updates one SonarQueryStat row per
+query fingerprint (see ``core.fingerprints``): call count, total and max
+duration, a mergeable latency sketch with its p50/p95/p99, first/last seen
+and a few example request UUIDs. Updates are incremental, so the Top
+Queries panel never scans SonarData. Fingerprints slower than
+``explain_threshold`` are handed to the EXPLAIN worker (see ``core.explain``)
+once the update is committed.
+
+Settings (optional):
+- query_stats: maintain the statistics (default False)
+- query_stats_examples: example request UUIDs kept per fingerprint (default 5)
+"""
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from django_sonar.models import SonarQueryStat
+from django_sonar.utils import get_sonar_settings
+from .explain import get_explain_threshold, get_refresh_interval, is_explainable, schedule_explains
+from .fingerprints import fingerprint_sql, normalize_sql
+from .sketches import LatencySketch
+
+
+DEFAULT_EXAMPLES = 5
+
+STAT_UPDATE_FIELDS = [
+    'alias',
+    'calls',
+    'total_time',
+    'max_time',
+    'p50',
+    'p95',
+    'p99',
+    'sketch',
+    'example_requests',
+    'last_seen',
+]
+
+
+def is_query_stats_enabled():
+    return bool(get_sonar_settings().get('query_stats', False))
+
+
+def get_max_examples():
+    return int(get_sonar_settings().get('query_stats_examples', DEFAULT_EXAMPLES))
+
+
+def collect_query_stats(snapshots):
+    """
+    Aggregate the queries of a batch of snapshots per fingerprint.
+
+    :param snapshots: Iterable of snapshot dictionaries
+    :return: Dictionary {fingerprint: delta} ready for update_query_stats()
+    """
+    max_examples = get_max_examples()
+    explain_threshold = get_explain_threshold()
+    deltas = {}
+
+    for snapshot in snapshots:
+        request_uuid = str(snapshot['uuid'])
+        seen_at = snapshot.get('created_at') or timezone.now()
+
+        for query in snapshot.get('queries') or []:
+            sql = query.get('sql')
+            if not sql:
+                continue
+            fingerprint = fingerprint_sql(sql)
+            duration = float(query.get('time') or 0)
+
+            delta = deltas.get(fingerprint)
+            if delta is None:
+                delta = deltas[fingerprint] = {
+                    'sql': normalize_sql(sql),
+                    'alias': query.get('alias') or '',
+                    'calls': 0,
+                    'total_time': 0.0,
+                    'max_time': 0.0,
+                    'sketch': LatencySketch(),
+                    'examples': [],
+                    'first_seen': seen_at,
+                    'last_seen': seen_at,
+                    'explain': None,
+                }
+            delta['calls'] += 1
+            delta['total_time'] += duration
+            delta['max_time'] = max(delta['max_time'], duration)
+            delta['sketch'].add(duration)
+            delta['first_seen'] = min(delta['first_seen'], seen_at)
+            delta['last_seen'] = max(delta['last_seen'], seen_at)
+            if request_uuid not in delta['examples']:
+                delta['examples'] = (delta['examples'] + [request_uuid])[-max_examples:]
+
+            # Keep the slowest explainable statement of the fingerprint
+            if explain_threshold is not None and duration >= explain_threshold:
+                params = query.get('params') or []
+                slowest = delta['explain']
+                if (slowest is None or duration > slowest[0]) and is_explainable(sql, params):
+                    delta['explain'] = (duration, sql, params, query.get('alias') or 'default')
+
+    return deltas
+
+
+def update_query_stats(deltas):
+    """
+    Merge per-fingerprint deltas into SonarQueryStat rows.
+
+    Costs three statements per batch whatever its size: an INSERT of the
+    missing fingerprints, a locking SELECT and a bulk UPDATE. Must run in a
+    transaction on the SonarQueryStat database.
+
+    :param deltas: Dictionary returned by collect_query_stats()
+    """
+    if not deltas:
+        return
+
+    max_examples = get_max_examples()
+    explain_before = timezone.now() - get_refresh_interval()
+    explain_candidates = []
+
+    # Create missing rows first, so concurrent writers only race on UPDATEs
+    SonarQueryStat.objects.bulk_create(
+        [
+            SonarQueryStat(fingerprint=fingerprint, sql=delta['sql'], first_seen=delta['first_seen'])
+            for fingerprint, delta in deltas.items()
+        ],
+        ignore_conflicts=True,
+    )
+
+    stats = list(SonarQueryStat.objects.select_for_update().filter(fingerprint__in=list(deltas)))
+    for stat in stats:
+        delta = deltas[stat.fingerprint]
+
+        sketch = LatencySketch.from_dict(stat.sketch)
+        sketch.merge(delta['sketch'])
+
+        stat.alias = delta['alias']
+        stat.calls += delta['calls']
+        stat.total_time += delta['total_time']
+        stat.max_time = max(stat.max_time, delta['max_time'])
+        stat.p50 = sketch.quantile(0.5)
+        stat.p95 = sketch.quantile(0.95)
+        stat.p99 = sketch.quantile(0.99)
+        stat.sketch = sketch.to_dict()
+        examples = [uuid for uuid in stat.example_requests if uuid not in delta['examples']]
+        stat.example_requests = (examples + delta['examples'])[-max_examples:]
+        stat.last_seen = max(stat.last_seen, delta['last_seen'])
+
+        if delta.get('explain') and (stat.explained_at is None or stat.explained_at < explain_before):
+            _duration, sql, params, alias = delta['explain']
+            explain_candidates.append((stat.fingerprint, sql, params, alias))
+
+    SonarQueryStat.objects.bulk_update(stats, STAT_UPDATE_FIELDS)
+
+    if explain_candidates:
+        transaction.on_commit(
+            lambda: schedule_explains(explain_candidates), using=router.db_for_write(SonarQueryStat)
+        )
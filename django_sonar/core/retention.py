@@ -0,0 +1,345 @@
+"""
+Age-based retention of the captured data.
+
+Retention is configured per SonarData category, in days, plus four
+reserved keys:
+- 'requests': SonarRequest rows, deleted together with their remaining data
+- 'sample_counters': SonarSampleCounter rows (tail sampling counters)
+- 'query_stats': SonarQueryStat rows not seen for that long
+- 'rollups': SonarRouteRollup rows (per-route aggregates, usually kept
+  much longer than the raw requests)
+
+Rows are deleted in bounded primary key chunks, one short transaction per
+chunk with a pause in between, so pruning never holds long locks or
+produces huge WAL segments. A request is kept while it still has data in a
+category retained longer than requests, and is deleted by a later run.
+
+Shared payload blobs (see ``core.blobs``) left without any SonarData row
+are deleted at the end of every run.
+
+With a storage backend other than the database (see ``django_sonar.storage``)
+the 'requests' key is applied by the backend itself.
+
+When the tables are partitioned by day (PostgreSQL, see ``core.partitions``)
+the days older than every retention involved are dropped as whole
+partitions before chunked deletes handle the rest.
+
+Settings (all optional):
+- retention: dictionary {category or reserved key: days} (default {}, keep everything)
+- retention_batch_size: rows deleted per chunk (default 1000)
+- retention_sleep: seconds to pause between chunks (default 0.1)
+- retention_interval: run pruning every N seconds in a background thread of
+  each process (default None, disabled; prefer scheduling the
+  ``prune_sonar_data`` command when running many processes)
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import Exists, F, OuterRef, Sum, TextField
+from django.db.models.functions import Cast, Coalesce, Length
+from django.utils import timezone
+
+from django_sonar.models import (
+    SonarBlob,
+    SonarData,
+    SonarQueryStat,
+    SonarRequest,
+    SonarRouteRollup,
+    SonarSampleCounter,
+)
+from django_sonar.storage import get_storage
+from django_sonar.utils import get_sonar_settings
+from .blobs import DEFAULT_CACHE_TTL
+from .partitions import drop_partitions, is_partitioned
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_SLEEP = 0.1
+
+RESERVED_TARGETS = {
+    'requests': (SonarRequest, 'created_at'),
+    'sample_counters': (SonarSampleCounter, 'bucket'),
+    'query_stats': (SonarQueryStat, 'last_seen'),
+    'rollups': (SonarRouteRollup, 'bucket'),
+}
+
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+def get_retention_policy():
+    """
+    Read the retention policy from the settings.
+
+    :return: Dictionary {category or reserved key: days}
+    """
+    policy = {}
+    for key, days in (get_sonar_settings().get('retention') or {}).items():
+        if days is not None:
+            policy[key] = float(days)
+    return policy
+
+
+# Compressed or serialized JSON length of the data, an approximation of the bytes freed
+_DATA_SIZE = Coalesce(Length('data_blob'), Length(Cast('data', TextField())))
+
+
+def _get_bytes(queryset, size):
+    return queryset.aggregate(total=Sum(size))['total'] or 0
+
+
+class RetentionPruner:
+    """Delete rows older than the retention policy in bounded chunks"""
+
+    def __init__(self, policy=None, batch_size=None, sleep=None, now=None):
+        """
+        Initialize the pruner.
+
+        :param policy: Dictionary {category or reserved key: days} (defaults to the retention setting)
+        :param batch_size: Rows deleted per chunk (defaults to retention_batch_size)
+        :param sleep: Seconds to pause between chunks (defaults to retention_sleep)
+        :param now: Reference time for the cutoffs (defaults to now)
+        """
+        sonar_settings = get_sonar_settings()
+        self.policy = get_retention_policy() if policy is None else policy
+        self.batch_size = max(1, int(batch_size or sonar_settings.get('retention_batch_size', DEFAULT_BATCH_SIZE)))
+        self.sleep = sonar_settings.get('retention_sleep', DEFAULT_SLEEP) if sleep is None else sleep
+        self.now = now or timezone.now()
+
+    def get_cutoff(self, days):
+        return self.now - timedelta(days=days)
+
+    def prune(self, dry_run=False):
+        """
+        Apply the whole policy.
+
+        :param dry_run: Only count the rows that would be deleted
+        :return: Dictionary {key: {'rows': int, 'bytes': int}}
+        """
+        report = {}
+        # Categories first: they may make requests with long-lived data deletable
+        for key, days in sorted(self.policy.items(), key=lambda item: item[0] in RESERVED_TARGETS):
+            if key == 'requests':
+                report[key] = self.prune_requests(days, dry_run)
+            elif key in RESERVED_TARGETS:
+                model, field = RESERVED_TARGETS[key]
+                report[key] = self.prune_model(model, field, days, dry_run)
+            else:
+                report[key] = self.prune_category(key, days, dry_run)
+        if report:
+            report['blobs'] = self.prune_orphan_blobs(dry_run)
+        return report
+
+    def prune_category(self, category, days, dry_run=False):
+        """
+        Delete the SonarData rows of a category older than days.
+
+        :return: Dictionary {'rows': int, 'bytes': int}
+        """
+        queryset = SonarData.objects.filter(category=category, created_at__lt=self.get_cutoff(days))
+        return self._delete_chunks(queryset, dry_run, size=_DATA_SIZE)
+
+    def prune_model(self, model, field, days, dry_run=False):
+        """
+        Delete the rows of a model whose field is older than days.
+
+        :return: Dictionary {'rows': int, 'bytes': int}
+        """
+        queryset = model.objects.filter(**{f'{field}__lt': self.get_cutoff(days)})
+        return self._delete_chunks(queryset, dry_run)
+
+    def prune_requests(self, days, dry_run=False):
+        """
+        Delete requests older than days with their data, except those still
+        holding data of a category retained longer.
+
+        :return: Dictionary {'rows': int, 'bytes': int}, rows counting requests only
+        """
+        storage = get_storage()
+        if not storage.database:
+            # Requests live outside the Sonar tables: the backend drops whole files or records
+            return {'rows': 0, 'bytes': 0} if dry_run else storage.prune(self.get_cutoff(days))
+
+        queryset = SonarRequest.objects.filter(created_at__lt=self.get_cutoff(days))
+
+        # Categories are pruned before requests, so what remains of them is still retained
+        longer = [key for key, value in self.policy.items() if key not in RESERVED_TARGETS and value > days]
+        if longer:
+            retained = SonarData.objects.filter(sonar_request=OuterRef('pk'), category__in=longer)
+            queryset = queryset.exclude(Exists(retained))
+
+        if dry_run:
+            return {'rows': queryset.count(), 'bytes': 0}
+
+        result = {'rows': 0, 'bytes': 0}
+        if is_partitioned(SonarRequest):
+            # Days older than every retention involved are dropped as whole partitions
+            keep_days = max([days] + [self.policy[key] for key in longer])
+            for partition in drop_partitions(self.get_cutoff(keep_days).date()):
+                if partition['table'] == SonarRequest._meta.db_table:
+                    result['rows'] += partition['rows']
+                result['bytes'] += partition['bytes']
+
+        # Select and delete on the database the rows are written to, not on a read replica
+        database = router.db_for_write(SonarRequest)
+        queryset = queryset.using(database)
+        while True:
+            pks = list(queryset.values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                return result
+            with transaction.atomic(using=database):
+                data = SonarData.objects.using(database).filter(sonar_request_id__in=pks)
+                result['bytes'] += _get_bytes(data, _DATA_SIZE)
+                # No signals or cascades to run: plain DELETE statements
+                data._raw_delete(database)
+                result['rows'] += SonarRequest.objects.filter(pk__in=pks)._raw_delete(database)
+            if len(pks) < self.batch_size:
+                return result
+            self._pause()
+
+    def prune_orphan_blobs(self, dry_run=False):
+        """
+        Delete the shared payload blobs no SonarData row references anymore.
+
+        Blobs younger than dedup_cache_ttl are kept: the rows referencing
+        them may not be committed yet.
+
+        :return: Dictionary {'rows': int, 'bytes': int}
+        """
+        ttl = get_sonar_settings().get('dedup_cache_ttl', DEFAULT_CACHE_TTL)
+        queryset = SonarBlob.objects.filter(created_at__lt=self.now - timedelta(seconds=ttl)).exclude(
+            Exists(SonarData.objects.filter(blob=OuterRef('pk')))
+        )
+        return self._delete_chunks(queryset, dry_run, size=F('size'))
+
+    def _delete_chunks(self, queryset, dry_run, size=None):
+        if dry_run:
+            result = {'rows': queryset.count(), 'bytes': 0}
+            if size is not None:
+                result['bytes'] = _get_bytes(queryset, size)
+            return result
+
+        result = {'rows': 0, 'bytes': 0}
+        model = queryset.model
+        database = router.db_for_write(model)
+        queryset = queryset.using(database)
+        while True:
+            if size is not None:
+                chunk = list(queryset.annotate(freed_bytes=size).values_list('pk', 'freed_bytes')[:self.batch_size])
+                pks = [pk for pk, _size in chunk]
+                result['bytes'] += sum(size or 0 for _pk, size in chunk)
+            else:
+                pks = list(queryset.values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                return result
+            result['rows'] += model.objects.filter(pk__in=pks)._raw_delete(database)
+            if len(pks) < self.batch_size:
+                return result
+            self._pause()
+
+    def _pause(self):
+        if self.sleep:
+            time.sleep(self.sleep)
+
+
+def prune_sonar_data(dry_run=False, **kwargs):
+    """
+    Apply the retention policy once.
+
+    :param dry_run: Only count the rows that would be deleted
+    :param kwargs: RetentionPruner arguments
+    :return: Dictionary {key: {'rows': int, 'bytes': int}}
+    """
+    return RetentionPruner(**kwargs).prune(dry_run=dry_run)
+
+
+class RetentionScheduler:
+    """Daemon thread applying the retention policy at a fixed interval"""
+
+    def __init__(self, interval):
+        """
+        Initialize the scheduler. The thread is started by ``start()``.
+
+        :param interval: Seconds between two runs
+        """
+        self.interval = float(interval)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the background thread (no-op if already running)."""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='django-sonar-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the background thread after the current chunk."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        try:
+            while not self._stop_event.wait(self.interval):
+                close_old_connections()
+                try:
+                    report = prune_sonar_data()
+                except Exception:
+                    logger.exception('django-sonar retention pruning failed')
+                    continue
+                deleted = sum(result['rows'] for result in report.values())
+                if deleted:
+                    logger.info('django-sonar retention pruned %s rows', deleted)
+        finally:
+            connections.close_all()
+
+
+def ensure_retention_scheduler():
+    """
+    Start the process-wide scheduler when retention_interval is set,
+    (re)creating it after a fork.
+
+    :return: Running RetentionScheduler instance, or None when disabled
+    """
+    global _scheduler, _scheduler_pid
+
+    if _scheduler_pid == os.getpid():
+        return _scheduler
+
+    interval = get_sonar_settings().get('retention_interval')
+    with _scheduler_lock:
+        if _scheduler_pid != os.getpid():
+            _scheduler = RetentionScheduler(interval) if interval else None
+            _scheduler_pid = os.getpid()
+            if _scheduler is not None:
+                _scheduler.start()
+        return _scheduler
+
+
+def shutdown_retention_scheduler():
+    """Stop the process-wide scheduler."""
+    global _scheduler, _scheduler_pid
+
+    with _scheduler_lock:
+        scheduler, _scheduler, _scheduler_pid = _scheduler, None, None
+    if scheduler is not None:
+        scheduler.stop()
+
+
+atexit.register(shutdown_retention_scheduler)
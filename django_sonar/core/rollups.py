@@ -0,0 +1,323 @@
+"""
+Per-route request rollups.
+
+Every persisted batch adds its requests to SonarRouteRollup rows keyed by
+(resolution, bucket, route, verb, status class, hostname), one per minute
+and one per hour: count, error count, total and max duration and a
+mergeable latency sketch. Requests dropped by tail sampling are rolled up
+too, so the aggregates describe all the captured traffic and not only the
+kept requests. The Endpoints panel only reads rollups: its cost depends on
+the number of routes and buckets in the window, not on the number of raw
+requests, and it keeps working once raw data is pruned. The same rows give
+the per-route percentile thresholds and the latency sparklines of the
+Requests panel: sketches are merged across buckets and hostnames at query
+time, so a p99 over weeks of traffic costs a few hundred rows.
+
+The route is the URL pattern of the resolved view (e.g.
+``books/<int:pk>/``), or an empty string when the path did not resolve.
+
+Settings (optional):
+- rollups: maintain the rollups (default False)
+"""
+
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.utils import timezone
+
+from django_sonar.models import SonarRouteRollup
+from django_sonar.utils import get_sonar_settings
+from .sketches import LatencySketch
+
+
+# Rollup rows are numerous: a 5% error keeps sketches around a hundred buckets
+SKETCH_ACCURACY = 0.05
+
+ROLLUP_UPDATE_FIELDS = [
+    'count',
+    'error_count',
+    'total_duration',
+    'max_duration',
+    'sketch',
+]
+
+ROUTE_MAX_LENGTH = SonarRouteRollup._meta.get_field('route').max_length
+
+# Three parameters per endpoint: stays below the SQLite limit of 999
+MAX_PERCENTILE_ENDPOINTS = 250
+
+RESOLUTION_STEPS = {
+    SonarRouteRollup.MINUTE: timedelta(minutes=1),
+    SonarRouteRollup.HOUR: timedelta(hours=1),
+}
+
+
+def is_rollups_enabled():
+    return bool(get_sonar_settings().get('rollups', False))
+
+
+def get_route(resolved):
+    """
+    Get the route of a ResolverMatch, as stored on SonarRequest and rollups.
+
+    :param resolved: ResolverMatch or None
+    :return: URL pattern, or an empty string
+    """
+    if resolved is None:
+        return ''
+    return (resolved.route or '')[:ROUTE_MAX_LENGTH]
+
+
+def get_status_class(status):
+    return f'{int(status) // 100}xx'
+
+
+def truncate_bucket(created_at, resolution):
+    """
+    Truncate a timestamp to the start of its bucket.
+
+    :param created_at: Aware datetime
+    :param resolution: SonarRouteRollup.MINUTE or SonarRouteRollup.HOUR
+    :return: Datetime of the bucket
+    """
+    bucket = created_at.replace(second=0, microsecond=0)
+    if resolution == SonarRouteRollup.HOUR:
+        bucket = bucket.replace(minute=0)
+    return bucket
+
+
+def add_rollup(deltas, request):
+    """
+    Add one request to an in-memory {key: delta} dictionary, at every resolution.
+
+    :param deltas: Dictionary being accumulated
+    :param request: Snapshot or tail sampling summary (verb, route, status,
+        duration, hostname, created_at and exceptions or has_exception)
+    """
+    created_at = request.get('created_at') or timezone.now()
+    duration = float(request['duration'] or 0)
+    is_error = int(request['status']) >= 500 or bool(request.get('has_exception') or request.get('exceptions'))
+    key = (
+        request.get('route') or '',
+        (request.get('verb') or '').upper(),
+        get_status_class(request['status']),
+        request.get('hostname') or '',
+    )
+
+    for resolution, _label in SonarRouteRollup.RESOLUTIONS:
+        rollup_key = (resolution, truncate_bucket(created_at, resolution)) + key
+        delta = deltas.get(rollup_key)
+        if delta is None:
+            delta = deltas[rollup_key] = {
+                'count': 0,
+                'error_count': 0,
+                'total_duration': 0.0,
+                'max_duration': 0.0,
+                'sketch': LatencySketch(SKETCH_ACCURACY),
+            }
+        delta['count'] += 1
+        delta['error_count'] += is_error
+        delta['total_duration'] += duration
+        delta['max_duration'] = max(delta['max_duration'], duration)
+        delta['sketch'].add(duration)
+
+
+def collect_rollups(requests):
+    """
+    Aggregate a batch of snapshots or summaries per rollup row.
+
+    :param requests: Iterable of snapshot or summary dictionaries
+    :return: Dictionary {key: delta} ready for update_rollups()
+    """
+    deltas = {}
+    for request in requests:
+        add_rollup(deltas, request)
+    return deltas
+
+
+def update_rollups(deltas):
+    """
+    Merge rollup deltas into SonarRouteRollup rows.
+
+    Like the query statistics, costs three statements per batch whatever its
+    size: an INSERT of the missing rows, a locking SELECT and a bulk UPDATE.
+    Must run in a transaction on the SonarRouteRollup database.
+
+    :param deltas: Dictionary returned by collect_rollups()
+    """
+    if not deltas:
+        return
+
+    # Create missing rows first, so concurrent writers only race on UPDATEs
+    SonarRouteRollup.objects.bulk_create(
+        [
+            SonarRouteRollup(
+                resolution=resolution, bucket=bucket, route=route, verb=verb,
+                status_class=status_class, hostname=hostname,
+            )
+            for resolution, bucket, route, verb, status_class, hostname in deltas
+        ],
+        ignore_conflicts=True,
+    )
+
+    rollups = list(
+        SonarRouteRollup.objects.select_for_update().filter(
+            resolution__in={key[0] for key in deltas},
+            bucket__in={key[1] for key in deltas},
+            route__in={key[2] for key in deltas},
+        )
+    )
+    updated = []
+    for rollup in rollups:
+        delta = deltas.get(
+            (rollup.resolution, rollup.bucket, rollup.route, rollup.verb, rollup.status_class, rollup.hostname)
+        )
+        if delta is None:
+            continue
+
+        sketch = LatencySketch.from_dict(rollup.sketch) if rollup.sketch else LatencySketch(SKETCH_ACCURACY)
+        sketch.merge(delta['sketch'])
+
+        rollup.count += delta['count']
+        rollup.error_count += delta['error_count']
+        rollup.total_duration += delta['total_duration']
+        rollup.max_duration = max(rollup.max_duration, delta['max_duration'])
+        rollup.sketch = sketch.to_dict()
+        updated.append(rollup)
+
+    SonarRouteRollup.objects.bulk_update(updated, ROLLUP_UPDATE_FIELDS)
+
+
+def summarize_rollups(rollups):
+    """
+    Merge rollup rows per endpoint (route and verb), across status classes and hosts.
+
+    :param rollups: Iterable of SonarRouteRollup instances
+    :return: List of endpoint dictionaries (route, verb, count, error_count,
+        error_rate, total_duration, mean_duration, max_duration, p50, p95, p99, last_seen)
+    """
+    endpoints = {}
+    for rollup in rollups:
+        endpoint = endpoints.get((rollup.route, rollup.verb))
+        if endpoint is None:
+            endpoint = endpoints[(rollup.route, rollup.verb)] = {
+                'route': rollup.route,
+                'verb': rollup.verb,
+                'count': 0,
+                'error_count': 0,
+                'total_duration': 0.0,
+                'max_duration': 0.0,
+                'sketches': [],
+                'last_seen': rollup.bucket,
+            }
+        endpoint['count'] += rollup.count
+        endpoint['error_count'] += rollup.error_count
+        endpoint['total_duration'] += rollup.total_duration
+        endpoint['max_duration'] = max(endpoint['max_duration'], rollup.max_duration)
+        endpoint['sketches'].append(rollup.sketch)
+        endpoint['last_seen'] = max(endpoint['last_seen'], rollup.bucket)
+
+    summaries = []
+    for endpoint in endpoints.values():
+        sketch = merge_sketches(endpoint.pop('sketches'))
+        count = endpoint['count']
+        endpoint['error_rate'] = endpoint['error_count'] / count if count else 0
+        endpoint['mean_duration'] = endpoint['total_duration'] / count if count else 0
+        endpoint['p50'] = sketch.quantile(0.5)
+        endpoint['p95'] = sketch.quantile(0.95)
+        endpoint['p99'] = sketch.quantile(0.99)
+        summaries.append(endpoint)
+    return summaries
+
+
+def merge_sketches(sketches):
+    """
+    Merge serialized rollup sketches.
+
+    :param sketches: Iterable of dictionaries from SonarRouteRollup.sketch
+    :return: LatencySketch
+    """
+    merged = LatencySketch(SKETCH_ACCURACY)
+    for data in sketches:
+        if data:
+            merged.merge(LatencySketch.from_dict(data))
+    return merged
+
+
+def get_endpoint_percentiles(q, since, resolution=SonarRouteRollup.HOUR, limit=MAX_PERCENTILE_ENDPOINTS):
+    """
+    Estimate a latency quantile per endpoint (route and verb) from the rollups.
+
+    :param q: Quantile between 0.0 and 1.0 (e.g. 0.95)
+    :param since: Oldest bucket included
+    :param resolution: Rollup resolution read
+    :param limit: Max endpoints returned, the busiest first
+    :return: Dictionary {(route, verb): duration in milliseconds}
+    """
+    rows = SonarRouteRollup.objects.filter(
+        resolution=resolution, bucket__gte=truncate_bucket(since, resolution)
+    ).values_list('route', 'verb', 'count', 'sketch')
+
+    endpoints = {}
+    for route, verb, count, sketch in rows:
+        totals = endpoints.setdefault((route, verb), [0, []])
+        totals[0] += count
+        totals[1].append(sketch)
+
+    busiest = sorted(endpoints.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    return {endpoint: merge_sketches(sketches).quantile(q) for endpoint, (_count, sketches) in busiest}
+
+
+def get_slow_requests_filter(q, since):
+    """
+    Build a SonarRequest filter keeping the requests slower than the quantile of their endpoint.
+
+    :param q: Quantile between 0.0 and 1.0 (e.g. 0.95)
+    :param since: Oldest rollup bucket the quantiles are computed on
+    :return: Q object, or None when there is no rollup yet
+    """
+    percentiles = get_endpoint_percentiles(q, since)
+    if not percentiles:
+        return None
+    return reduce(or_, (
+        Q(route=route, verb=verb, duration__gte=threshold)
+        for (route, verb), threshold in percentiles.items()
+    ))
+
+
+def get_latency_series(since, q=0.95, resolution=SonarRouteRollup.MINUTE):
+    """
+    Build the per-bucket request count and latency quantile of all endpoints.
+
+    :param since: Oldest bucket included
+    :param q: Quantile between 0.0 and 1.0 (e.g. 0.95)
+    :param resolution: Rollup resolution read
+    :return: List of dictionaries {'bucket', 'count', 'quantile'}, one per
+        bucket up to now, with a zero count (and None quantile) for buckets without traffic
+    """
+    start = truncate_bucket(since, resolution)
+    rows = SonarRouteRollup.objects.filter(resolution=resolution, bucket__gte=start).values_list(
+        'bucket', 'count', 'sketch'
+    )
+
+    buckets = {}
+    for bucket, count, sketch in rows:
+        totals = buckets.setdefault(bucket, [0, []])
+        totals[0] += count
+        totals[1].append(sketch)
+
+    series = []
+    step = RESOLUTION_STEPS[resolution]
+    bucket = start
+    end = truncate_bucket(timezone.now(), resolution)
+    while bucket <= end:
+        count, sketches = buckets.get(bucket, (0, ()))
+        series.append({
+            'bucket': bucket,
+            'count': count,
+            'quantile': merge_sketches(sketches).quantile(q) if count else None,
+        })
+        bucket += step
+    return series
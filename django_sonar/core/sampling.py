@@ -0,0 +1,160 @@
+"""
+Request sampling.
+
+Head sampling decides, before any capture work is done, whether a request
+is recorded. Rates are fractions between 0.0 (never) and 1.0 (always):
+
+- sample_rate: global rate (default 1.0, everything is captured)
+- sample_rate_paths: {path_prefix: rate}, the longest matching prefix wins
+- sample_rate_url_names: {url_name: rate}, matched against the resolved
+  view name ('namespace:name') or url name; takes precedence over paths
+- sample_request_id_header: header used as a deterministic sampling key
+  (default 'X-Request-ID'), so retries of the same request get the same
+  decision. Requests without the header are sampled randomly.
+
+Tail sampling decides, after the response, whether a head-sampled request
+is persisted in full. Dropped requests only bump a per-minute counter
+(see SonarSampleCounter). A request is kept when any rule matches:
+
+- tail_sampling: enable tail sampling (default False)
+- tail_sampling_min_status: keep responses with status >= value (default 500)
+- tail_sampling_min_duration: keep requests slower than value ms (default 1000)
+- tail_sampling_min_queries: keep requests with >= value queries (default 50)
+- tail_sampling_keep_exceptions: keep requests that raised (default True)
+- tail_sampling_predicates: list of callables (or dotted paths) called with
+  (request, response, summary); a truthy result keeps the request
+
+Set any threshold to None to disable it.
+"""
+
+import hashlib
+import random
+
+from django.utils.module_loading import import_string
+
+from django_sonar.utils import get_sonar_settings
+
+
+class RequestSampler:
+    """Handles head-based sampling decisions for the middleware"""
+
+    DEFAULT_REQUEST_ID_HEADER = 'X-Request-ID'
+
+    def __init__(self):
+        """Initialize sampler with rates from settings"""
+        sonar_settings = get_sonar_settings()
+
+        self.rate = float(sonar_settings.get('sample_rate', 1.0))
+
+        # Longest prefixes first so the most specific rule wins
+        path_rates = sonar_settings.get('sample_rate_paths', {}) or {}
+        self.path_rates = sorted(
+            ((prefix, float(rate)) for prefix, rate in path_rates.items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+        url_name_rates = sonar_settings.get('sample_rate_url_names', {}) or {}
+        self.url_name_rates = {name: float(rate) for name, rate in url_name_rates.items()}
+
+        header = sonar_settings.get('sample_request_id_header', self.DEFAULT_REQUEST_ID_HEADER)
+        self.request_id_meta_key = 'HTTP_' + header.upper().replace('-', '_') if header else None
+
+    @property
+    def needs_resolve(self):
+        """Whether URL resolution is required to take a decision."""
+        return bool(self.url_name_rates)
+
+    def get_rate(self, path, resolved=None):
+        """
+        Get the sampling rate that applies to a request.
+
+        :param path: Request path
+        :param resolved: Optional ResolverMatch for URL-name overrides
+        :return: Sampling rate between 0.0 and 1.0
+        """
+        if resolved is not None and self.url_name_rates:
+            for name in (resolved.view_name, resolved.url_name):
+                if name in self.url_name_rates:
+                    return self.url_name_rates[name]
+
+        for prefix, rate in self.path_rates:
+            if path.startswith(prefix):
+                return rate
+
+        return self.rate
+
+    def get_sample_key(self, request):
+        """
+        Map a request to a number in [0, 1).
+
+        Deterministic when the request carries a request id header.
+
+        :param request: Django request object
+        :return: Float between 0.0 (inclusive) and 1.0 (exclusive)
+        """
+        request_id = request.META.get(self.request_id_meta_key) if self.request_id_meta_key else None
+        if request_id:
+            digest = hashlib.blake2b(request_id.encode('utf-8'), digest_size=8).digest()
+            return int.from_bytes(digest, 'big') / 2 ** 64
+        return random.random()
+
+    def should_sample(self, request, resolved=None):
+        """
+        Decide whether the request should be captured.
+
+        :param request: Django request object
+        :param resolved: Optional ResolverMatch for URL-name overrides
+        :return: True if the request should be captured, False otherwise
+        """
+        rate = self.get_rate(request.path, resolved)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        return self.get_sample_key(request) < rate
+
+
+class TailSampler:
+    """Handles tail-based keep/drop decisions for the middleware"""
+
+    DEFAULT_MIN_STATUS = 500
+    DEFAULT_MIN_DURATION = 1000
+    DEFAULT_MIN_QUERIES = 50
+
+    def __init__(self):
+        """Initialize sampler with thresholds and predicates from settings"""
+        sonar_settings = get_sonar_settings()
+
+        self.enabled = bool(sonar_settings.get('tail_sampling', False))
+        self.min_status = sonar_settings.get('tail_sampling_min_status', self.DEFAULT_MIN_STATUS)
+        self.min_duration = sonar_settings.get('tail_sampling_min_duration', self.DEFAULT_MIN_DURATION)
+        self.min_queries = sonar_settings.get('tail_sampling_min_queries', self.DEFAULT_MIN_QUERIES)
+        self.keep_exceptions = bool(sonar_settings.get('tail_sampling_keep_exceptions', True))
+        self.predicates = [
+            import_string(predicate) if isinstance(predicate, str) else predicate
+            for predicate in sonar_settings.get('tail_sampling_predicates', []) or []
+        ]
+
+    def should_keep(self, request, response, summary):
+        """
+        Decide whether a processed request should be persisted in full.
+
+        :param request: Django request object
+        :param response: Django response object
+        :param summary: Dictionary with status, duration (ms), query_count and has_exception
+        :return: True if the request should be kept, False otherwise
+        """
+        if not self.enabled:
+            return True
+
+        if self.keep_exceptions and summary['has_exception']:
+            return True
+        if self.min_status is not None and summary['status'] >= self.min_status:
+            return True
+        if self.min_duration is not None and summary['duration'] >= self.min_duration:
+            return True
+        if self.min_queries is not None and summary['query_count'] >= self.min_queries:
+            return True
+
+        return any(predicate(request, response, summary) for predicate in self.predicates)
@@ -0,0 +1,145 @@
+"""
+Mergeable latency sketches.
+
+A LatencySketch keeps counts in logarithmic buckets (as in DDSketch), so
+any quantile is estimated within a fixed relative error and two sketches
+are merged by adding their bucket counts. Sketches serialize to plain
+dictionaries, which makes them cheap to store in a JSONField and to merge
+incrementally at write time.
+
+The number of buckets only depends on the range of the values: with the
+default 1% accuracy, durations between 1 microsecond and 1 hour need less
+than 1100 buckets. Serialized sketches store their buckets as a dense list
+of counts from the lowest index when most buckets in between are used
+(the usual case for the latencies of one route), or as a sparse
+{index: count} mapping otherwise.
+"""
+
+import math
+
+
+class LatencySketch:
+    """Log-bucketed quantile sketch for durations in milliseconds"""
+
+    DEFAULT_RELATIVE_ACCURACY = 0.01
+    MIN_VALUE = 0.001  # 1 microsecond, smaller durations count as zero
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """
+        Initialize an empty sketch.
+
+        :param relative_accuracy: Max relative error of quantile estimates
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('relative_accuracy must be between 0 and 1.')
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, count=1):
+        """
+        Add a value to the sketch.
+
+        :param value: Duration in milliseconds
+        :param count: Number of occurrences
+        """
+        if value < self.MIN_VALUE:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one.
+
+        :param other: LatencySketch with the same relative accuracy
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different relative accuracy.')
+        if not other.count:
+            return
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile.
+
+        :param q: Quantile between 0.0 and 1.0 (e.g. 0.95)
+        :return: Estimated value in milliseconds, or None for an empty sketch
+        """
+        if not self.count:
+            return None
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+
+        return self.max
+
+    def to_dict(self):
+        """
+        Serialize the sketch to a JSON-friendly dictionary.
+
+        :return: Dictionary accepted by from_dict()
+        """
+        data = {'relative_accuracy': self.relative_accuracy}
+        if self.buckets:
+            offset = min(self.buckets)
+            span = max(self.buckets) - offset + 1
+            # A zero costs 2 bytes of JSON, a sparse entry about 8
+            if span <= 4 * len(self.buckets):
+                data['offset'] = offset
+                data['counts'] = [self.buckets.get(index, 0) for index in range(offset, offset + span)]
+            else:
+                data['buckets'] = {str(index): count for index, count in self.buckets.items()}
+        data.update({
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+        })
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a sketch serialized with to_dict().
+
+        :param data: Dictionary (an empty or missing one gives an empty sketch)
+        :return: LatencySketch instance
+        """
+        data = data or {}
+        sketch = cls(data.get('relative_accuracy', cls.DEFAULT_RELATIVE_ACCURACY))
+        sketch.buckets = {int(index): count for index, count in data.get('buckets', {}).items()}
+        offset = data.get('offset', 0)
+        for position, count in enumerate(data.get('counts', ())):
+            if count:
+                sketch.buckets[offset + position] = count
+        sketch.zero_count = data.get('zero_count', 0)
+        sketch.count = data.get('count', 0)
+        sketch.min = data.get('min')
+        sketch.max = data.get('max')
+        return sketch
@@ -0,0 +1,324 @@
+"""
+Write-behind persistence.
+
+When ``DJANGO_SONAR['write_behind']`` is enabled the middleware does not
+write to the database itself: it hands the captured snapshot to a bounded
+in-process queue and returns the response right away. A dedicated daemon
+thread drains the queue and persists snapshots in batched transactions.
+
+Settings (all optional):
+- write_behind: enable the writer (default False)
+- write_behind_queue_size: max snapshots waiting in memory (default 10000)
+- write_behind_batch_size: max snapshots per transaction (default 100)
+- write_behind_flush_interval: seconds to wait for a batch to fill (default 1.0)
+
+When the queue is full new snapshots are dropped (and counted) instead of
+blocking the request. Requests dropped by tail sampling are aggregated in
+memory (sample counters and route rollups) and written with the next
+batch. Pending snapshots are flushed on
+interpreter exit.
+
+Inline or batched, snapshots are written by the configured storage backend
+(see ``django_sonar.storage``).
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connections
+
+from django_sonar.storage import get_storage
+from django_sonar.utils import get_sonar_settings
+from .persistence import add_sample_count
+from .rollups import add_rollup, is_rollups_enabled
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+_writer = None
+_writer_config = None
+_writer_lock = threading.Lock()
+
+
+def store_snapshots(snapshots):
+    get_storage().save_snapshots(snapshots)
+
+
+def store_sample_counts(counts):
+    get_storage().save_sample_counts(counts)
+
+
+def store_rollups(deltas):
+    get_storage().save_rollups(deltas)
+
+
+class SonarWriter:
+    """Bounded queue drained by a background thread in batched transactions"""
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, persist=store_snapshots,
+                 persist_counts=store_sample_counts, persist_rollups=store_rollups):
+        """
+        Initialize the writer. The worker thread is started by ``start()``.
+
+        :param queue_size: Maximum number of snapshots waiting to be written
+        :param batch_size: Maximum number of snapshots written per transaction
+        :param flush_interval: Seconds to wait for a batch to fill up
+        :param persist: Callable persisting a list of snapshots
+        :param persist_counts: Callable persisting tail sampling counts
+        :param persist_rollups: Callable persisting the rollups of dropped requests
+        """
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.persist = persist
+        self.persist_counts = persist_counts
+        self.persist_rollups = persist_rollups
+        self.dropped = 0
+        self._sample_counts = {}
+        self._rollups = {}
+        self._counts_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._stop_event = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def start(self):
+        """Start the background worker thread (no-op if already running)."""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='django-sonar-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, snapshot):
+        """
+        Queue a snapshot for persistence without blocking.
+
+        :param snapshot: Snapshot dictionary built by the middleware
+        :return: True if queued, False if dropped because the queue is full
+        """
+        try:
+            self._queue.put_nowait(snapshot)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def count_dropped_request(self, summary):
+        """
+        Count a request dropped by tail sampling without touching the database.
+
+        :param summary: Summary dictionary built by the middleware
+        """
+        rollups_enabled = is_rollups_enabled()
+        with self._counts_lock:
+            add_sample_count(self._sample_counts, summary)
+            if rollups_enabled:
+                add_rollup(self._rollups, summary)
+
+    def flush(self):
+        """Synchronously write every queued snapshot in the calling thread."""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                break
+            self._write(batch)
+        self._write_counts()
+
+    def stop(self, timeout=None):
+        """
+        Stop the worker thread and flush whatever is still queued.
+
+        :param timeout: Seconds to wait for the worker thread to finish
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self._write_lock:
+            try:
+                self.persist(batch)
+            except Exception:
+                logger.exception('django-sonar writer failed to persist %d snapshot(s)', len(batch))
+
+    def _write_counts(self):
+        with self._counts_lock:
+            counts, self._sample_counts = self._sample_counts, {}
+            rollups, self._rollups = self._rollups, {}
+        if not counts:
+            return
+        with self._write_lock:
+            try:
+                self.persist_counts(counts)
+            except Exception:
+                logger.exception('django-sonar writer failed to persist sample counters')
+            if rollups:
+                try:
+                    self.persist_rollups(rollups)
+                except Exception:
+                    logger.exception('django-sonar writer failed to persist route rollups')
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                batch = self._next_batch()
+                if batch or self._sample_counts:
+                    close_old_connections()
+                if batch:
+                    self._write(batch)
+                self._write_counts()
+        finally:
+            connections.close_all()
+
+
+def is_write_behind_enabled():
+    return bool(get_sonar_settings().get('write_behind', False))
+
+
+def _get_writer_config():
+    sonar_settings = get_sonar_settings()
+    return (
+        sonar_settings.get('write_behind_queue_size', DEFAULT_QUEUE_SIZE),
+        sonar_settings.get('write_behind_batch_size', DEFAULT_BATCH_SIZE),
+        sonar_settings.get('write_behind_flush_interval', DEFAULT_FLUSH_INTERVAL),
+        os.getpid(),
+    )
+
+
+def get_writer():
+    """
+    Return the process-wide writer, (re)creating it when the settings or the
+    process (e.g. after a fork) changed.
+
+    :return: Running SonarWriter instance
+    """
+    global _writer, _writer_config
+
+    config = _get_writer_config()
+    with _writer_lock:
+        if _writer is None or _writer_config != config:
+            if _writer is not None and _writer_config[-1] == config[-1]:
+                _writer.stop()
+            queue_size, batch_size, flush_interval, _pid = config
+            _writer = SonarWriter(queue_size, batch_size, flush_interval)
+            _writer_config = config
+        _writer.start()
+        return _writer
+
+
+def shutdown_writer(timeout=5.0):
+    """
+    Stop the process-wide writer, flushing pending snapshots.
+
+    :param timeout: Seconds to wait for the worker thread to finish
+    """
+    global _writer, _writer_config
+
+    with _writer_lock:
+        writer, _writer, _writer_config = _writer, None, None
+    if writer is not None:
+        writer.stop(timeout)
+
+
+def save_snapshot(snapshot):
+    """
+    Persist a snapshot inline, or queue it when write-behind is enabled.
+
+    :param snapshot: Snapshot dictionary built by the middleware
+    """
+    if is_write_behind_enabled():
+        get_writer().submit(snapshot)
+    else:
+        store_snapshots([snapshot])
+
+
+async def asave_snapshot(snapshot):
+    """
+    Async counterpart of save_snapshot(): queueing never blocks, and inline
+    persistence runs in a worker thread instead of the event loop.
+
+    :param snapshot: Snapshot dictionary built by the middleware
+    """
+    if is_write_behind_enabled():
+        get_writer().submit(snapshot)
+    else:
+        await sync_to_async(store_snapshots)([snapshot])
+
+
+def save_dropped_request(summary):
+    """
+    Count a request dropped by tail sampling, inline or through the writer.
+
+    :param summary: Summary dictionary built by the middleware
+    """
+    if is_write_behind_enabled():
+        get_writer().count_dropped_request(summary)
+    else:
+        counts = {}
+        add_sample_count(counts, summary)
+        store_sample_counts(counts)
+        if is_rollups_enabled():
+            rollups = {}
+            add_rollup(rollups, summary)
+            store_rollups(rollups)
+
+
+async def asave_dropped_request(summary):
+    """
+    Async counterpart of save_dropped_request().
+
+    :param summary: Summary dictionary built by the middleware
+    """
+    if is_write_behind_enabled():
+        get_writer().count_dropped_request(summary)
+    else:
+        await sync_to_async(save_dropped_request)(summary)
+
+
+atexit.register(shutdown_writer)
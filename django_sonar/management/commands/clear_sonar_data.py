@@ -1,10 +1,16 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, router
+from django.utils import timezone
+
+from django_sonar.core.clear import SonarCleaner, flush_sonar_tables, optimize_sonar_tables
 from django_sonar.models import SonarRequest, SonarData
+from django_sonar.storage import get_storage
 
 
 class Command(BaseCommand):
-    help = 'Clear all DjangoSonar data from the database'
+    help = 'Clear DjangoSonar data, entirely or only the selected requests or entries'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -12,11 +18,59 @@ class Command(BaseCommand):
             action='store_true',
             help='Skip confirmation prompt'
         )
+        parser.add_argument(
+            '--older-than',
+            type=float,
+            metavar='DAYS',
+            help='Only clear requests (or entries) older than this many days'
+        )
+        parser.add_argument(
+            '--path-prefix',
+            action='append',
+            default=[],
+            help='Only clear requests whose path starts with this prefix, e.g. /static/ (repeatable)'
+        )
+        parser.add_argument(
+            '--status',
+            action='append',
+            default=[],
+            help='Only clear requests with this status code or class, e.g. 404 or 2xx (repeatable)'
+        )
+        parser.add_argument(
+            '--category',
+            action='append',
+            default=[],
+            help='Only clear the entries of this category, keeping the requests (repeatable)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Rows deleted per chunk of a selective clear (default: retention_batch_size setting)'
+        )
+        parser.add_argument(
+            '--vacuum',
+            action='store_true',
+            help='Reclaim the freed space afterwards (VACUUM, OPTIMIZE TABLE on MySQL)'
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Refresh the planner statistics of the Sonar tables afterwards (ANALYZE)'
+        )
 
     def handle(self, *args, **options):
+        selective = bool(options['path_prefix'] or options['status'] or options['category'])
+        selective = selective or options['older_than'] is not None
+        storage = get_storage()
+        if not storage.database and (options['path_prefix'] or options['status'] or options['category']):
+            raise CommandError(
+                f'The {storage.__class__.__name__} backend only supports clearing everything or --older-than.'
+            )
+
         if not options['no_input']:
+            target = 'the selected DjangoSonar data' if selective else 'all DjangoSonar data'
             confirm = input(
-                'This will permanently delete all DjangoSonar data. '
+                f'This will permanently delete {target}. '
                 'Are you sure? Type "yes" to continue: '
             )
             if confirm.lower() != 'yes':
@@ -24,30 +78,55 @@ class Command(BaseCommand):
                 return
 
         try:
-            sonar_data_count = SonarData.objects.count()
-            sonar_request_count = SonarRequest.objects.count()
-            
-            # Database-agnostic truncate using QuerySet methods
-            SonarData.objects.all()._raw_delete(SonarData.objects.db)
-            SonarRequest.objects.all()._raw_delete(SonarRequest.objects.db)
-            
-            # Reset sequences (PostgreSQL/MySQL)
-            from django.core.management.color import no_style
-            from django.db import connection
-            
-            style = no_style()
-            sql = connection.ops.sql_flush(style, [SonarData._meta.db_table, SonarRequest._meta.db_table])
-            with connection.cursor() as cursor:
-                for query in sql:
-                    cursor.execute(query)
-            
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'Successfully truncated {sonar_data_count} SonarData entries '
-                    f'and {sonar_request_count} SonarRequest entries. IDs reset.'
-                )
+            if selective:
+                self._clear_selection(options)
+            else:
+                self._clear_all()
+
+            # Requests written to another storage backend (e.g. segment files)
+            if not storage.database:
+                if options['older_than'] is None:
+                    storage.clear()
+                else:
+                    pruned = storage.prune(timezone.now() - timedelta(days=options['older_than']))
+                    self.stdout.write(f"Deleted {pruned['rows']} requests from {storage.__class__.__name__}.")
+
+            if options['vacuum'] or options['analyze']:
+                statements = optimize_sonar_tables(vacuum=options['vacuum'], analyze=options['analyze'])
+                if statements:
+                    self.stdout.write(f'Ran {len(statements)} maintenance statements ({statements[0]}...).')
+                else:
+                    self.stdout.write(self.style.WARNING('VACUUM/ANALYZE is not supported by this database.'))
+        except DatabaseError as e:
+            raise CommandError(f'Error clearing DjangoSonar data: {e}') from e
+
+    def _clear_all(self):
+        # Count on the database flushed below, not on a read replica
+        sonar_data_count = SonarData.objects.using(router.db_for_write(SonarData)).count()
+        sonar_request_count = SonarRequest.objects.using(router.db_for_write(SonarRequest)).count()
+        flush_sonar_tables()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully truncated {sonar_data_count} SonarData entries '
+                f'and {sonar_request_count} SonarRequest entries. IDs reset.'
             )
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f'Error truncating tables: {e}')
-            )
\ No newline at end of file
+        )
+
+    def _clear_selection(self, options):
+        cleaner = SonarCleaner(
+            older_than=options['older_than'],
+            path_prefixes=options['path_prefix'],
+            statuses=options['status'],
+            categories=options['category'],
+            batch_size=options['batch_size'],
+            progress=lambda result: self.stdout.write(
+                f"  ... {result['requests']} requests and {result['entries']} entries deleted so far"
+            ),
+        )
+        result = cleaner.clear()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {result['requests']} requests, {result['entries']} entries "
+                f"and {result['blobs']} unreferenced blobs."
+            )
+        )
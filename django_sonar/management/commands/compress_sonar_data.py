@@ -0,0 +1,86 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.template.defaultfilters import filesizeformat
+
+from django_sonar.compression import decompress_payload, encode_payload, serialize_payload
+from django_sonar.models import SonarData
+
+
+class Command(BaseCommand):
+    help = 'Compress existing DjangoSonar payloads (or decompress them with --decompress), in small chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows converted per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between chunks (default: 0)'
+        )
+        parser.add_argument(
+            '--decompress',
+            action='store_true',
+            help='Store every compressed payload back as plain JSON'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        decompress = options['decompress']
+        # Read the chunks from the database they are rewritten on, not from a read replica
+        database = router.db_for_write(SonarData)
+        entries = SonarData.objects.using(database)
+        queryset = entries.filter(data_blob__isnull=not decompress).order_by('pk')
+
+        converted = 0
+        size_before = 0
+        size_after = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=last_pk).values_list('pk', 'data', 'data_blob')[:batch_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            with transaction.atomic(using=database):
+                for pk, data, blob in rows:
+                    if decompress:
+                        data = decompress_payload(blob)
+                        size_before += len(blob)
+                        size_after += len(serialize_payload(data))
+                        entries.filter(pk=pk).update(data=data, data_blob=None)
+                        converted += 1
+                        continue
+
+                    blob = encode_payload(data, force=True)
+                    if blob is None:
+                        continue
+                    size_before += len(serialize_payload(data))
+                    size_after += len(blob)
+                    entries.filter(pk=pk).update(data=None, data_blob=blob)
+                    converted += 1
+
+            if len(rows) < batch_size:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        verb = 'Decompressed' if decompress else 'Compressed'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{verb} {converted} SonarData entries: '
+                f'{self._format_bytes(size_before)} -> {self._format_bytes(size_after)}.'
+            )
+        )
+
+    @staticmethod
+    def _format_bytes(size):
+        return str(filesizeformat(size)).replace('\xa0', ' ')
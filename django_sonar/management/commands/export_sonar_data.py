@@ -0,0 +1,160 @@
+import gzip
+import io
+import sys
+from datetime import datetime, time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from django_sonar.core.exports import DEFAULT_CHUNK_SIZE, dump_export_line, iter_export
+from django_sonar.core.parquet import DEFAULT_PARQUET_CHUNK_SIZE, PARQUET_COMPRESSIONS, export_parquet
+from django_sonar.storage import get_storage
+
+
+def parse_datetime_option(value):
+    """
+    Parse an ISO date or datetime given on the command line.
+
+    :param value: e.g. '2024-05-01' or '2024-05-01T12:30:00+02:00'
+    :return: Aware datetime (naive values are in the current time zone)
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD or an ISO datetime.')
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Stream DjangoSonar requests and their entries as NDJSON, one request per line, or as Parquet tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=['ndjson', 'parquet'],
+            default='ndjson',
+            help='ndjson (default), or parquet: date-partitioned requests, queries and headers tables'
+        )
+        parser.add_argument(
+            '--output', '-o',
+            default='-',
+            help='File to write, "-" for stdout (default: stdout); the root directory of the tables for parquet'
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the output (implied by an --output ending with .gz)'
+        )
+        parser.add_argument(
+            '--since',
+            help='Only export requests created at or after this date or datetime'
+        )
+        parser.add_argument(
+            '--until',
+            help='Only export requests created before this date or datetime'
+        )
+        parser.add_argument(
+            '--route',
+            action='append',
+            default=[],
+            help='Only export requests of this route, e.g. "books/<int:pk>/" (repeatable)'
+        )
+        parser.add_argument(
+            '--status',
+            action='append',
+            default=[],
+            help='Only export requests with this status code or class, e.g. 404 or 5xx (repeatable)'
+        )
+        parser.add_argument(
+            '--category',
+            action='append',
+            default=[],
+            help='Only export entries of this category, and requests having some (repeatable)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help=(
+                f'Requests read per page (default: {DEFAULT_CHUNK_SIZE}, '
+                f'{DEFAULT_PARQUET_CHUNK_SIZE} for parquet where a page is a row group)'
+            )
+        )
+        parser.add_argument(
+            '--compression',
+            choices=PARQUET_COMPRESSIONS,
+            default='snappy',
+            help='Parquet compression codec (default: snappy)'
+        )
+
+    def handle(self, *args, **options):
+        if not get_storage().database:
+            raise CommandError('export_sonar_data reads the Sonar tables: set the storage setting to "database".')
+
+        since = parse_datetime_option(options['since']) if options['since'] else None
+        until = parse_datetime_option(options['until']) if options['until'] else None
+        if options['format'] == 'parquet':
+            return self._export_parquet(since, until, options)
+
+        records = iter_export(
+            since=since,
+            until=until,
+            routes=options['route'],
+            statuses=options['status'],
+            categories=options['category'],
+            chunk_size=options['chunk_size'] or DEFAULT_CHUNK_SIZE,
+        )
+
+        output = options['output']
+        compress = options['gzip'] or output.endswith('.gz')
+        if output == '-' and not compress:
+            requests, entries = self._write(records, self.stdout.write)
+        elif output == '-':
+            with gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb') as compressed:
+                with io.TextIOWrapper(compressed, encoding='utf-8') as stream:
+                    requests, entries = self._write(records, lambda line: stream.write(line + '\n'))
+        else:
+            opener = gzip.open if compress else open
+            with opener(output, 'wt', encoding='utf-8') as stream:
+                requests, entries = self._write(records, lambda line: stream.write(line + '\n'))
+
+        # Keep stdout for the data
+        self.stderr.write(self.style.SUCCESS(f'Exported {requests} requests with {entries} entries.'))
+
+    def _export_parquet(self, since, until, options):
+        if options['output'] == '-':
+            raise CommandError('--format parquet writes a directory: set it with --output.')
+        if options['gzip'] or options['category']:
+            raise CommandError('--gzip and --category only apply to --format ndjson.')
+        try:
+            counts = export_parquet(
+                options['output'],
+                since=since,
+                until=until,
+                routes=options['route'],
+                statuses=options['status'],
+                chunk_size=options['chunk_size'] or DEFAULT_PARQUET_CHUNK_SIZE,
+                compression=options['compression'],
+            )
+        except ImproperlyConfigured as exc:
+            raise CommandError(f'{exc} Install it with: pip install django-sonar[parquet]') from exc
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Exported {counts['requests']} requests, {counts['queries']} queries and "
+                f"{counts['headers']} headers to {options['output']}."
+            )
+        )
+
+    @staticmethod
+    def _write(records, write):
+        requests = entries = 0
+        for record in records:
+            write(dump_export_line(record))
+            requests += 1
+            entries += len(record['entries'])
+        return requests, entries
@@ -0,0 +1,68 @@
+import gzip
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_sonar.core.imports import DEFAULT_BATCH_SIZE, SonarImporter, read_ndjson
+from django_sonar.storage import get_storage
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class Command(BaseCommand):
+    help = 'Load DjangoSonar requests exported by export_sonar_data, skipping those already present'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='+',
+            metavar='PATH',
+            help='NDJSON files to import, optionally gzip-compressed, "-" for stdin'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Requests written per transaction (default: {DEFAULT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--no-validate',
+            action='store_true',
+            help='Skip model validation of every row (faster, for trusted exports)'
+        )
+
+    def handle(self, *args, **options):
+        if not get_storage().database:
+            raise CommandError('import_sonar_data writes the Sonar tables: set the storage setting to "database".')
+
+        importer = SonarImporter(
+            batch_size=options['batch_size'],
+            validate=not options['no_validate'],
+        )
+        for path in options['paths']:
+            importer.on_error = lambda line_number, exc, path=path: self.stderr.write(
+                self.style.WARNING(f'{path}:{line_number}: skipped invalid request ({exc})')
+            )
+            with self._open(path) as lines:
+                importer.run(read_ndjson(lines))
+
+        result = importer.result
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result['requests']} requests with {result['entries']} entries, "
+                f"skipped {result['skipped']} already present and {result['invalid']} invalid."
+            )
+        )
+
+    @staticmethod
+    def _open(path):
+        try:
+            stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(f'Unable to read "{path}": {exc}') from exc
+        stream = io.BufferedReader(stream) if not hasattr(stream, 'peek') else stream
+        if stream.peek(2)[:2] == GZIP_MAGIC:
+            stream = gzip.GzipFile(fileobj=stream)
+        return io.TextIOWrapper(stream, encoding='utf-8')
@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from django_sonar.core.partitions import (
+    PARTITIONED_MODELS, PartitioningUnsupported, check_supported, convert_to_partitioned, create_partitions,
+    drop_partitions, is_partitioned,
+)
+
+
+class Command(BaseCommand):
+    help = 'Manage the daily partitions of the DjangoSonar tables (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Recreate sonar_requests/sonar_data as partitioned tables, copying existing rows'
+        )
+        parser.add_argument(
+            '--days-ahead',
+            type=int,
+            default=7,
+            help='Create the partitions of today and of the next N days (default: 7)'
+        )
+        parser.add_argument(
+            '--drop-older-than',
+            type=float,
+            metavar='DAYS',
+            help='Drop the partitions of the days older than DAYS'
+        )
+        parser.add_argument(
+            '--no-input',
+            action='store_true',
+            help='Skip confirmation prompt of --convert'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            check_supported()
+            if options['convert']:
+                if not options['no_input']:
+                    confirm = input(
+                        'This will rebuild the DjangoSonar tables and lock them while rows are copied. '
+                        'Are you sure? Type "yes" to continue: '
+                    )
+                    if confirm.lower() != 'yes':
+                        self.stdout.write('Operation cancelled.')
+                        return
+                created = convert_to_partitioned()
+                self.stdout.write(f'Converted the DjangoSonar tables, {len(created)} partitions created for existing rows.')
+            elif not all(is_partitioned(model) for model in PARTITIONED_MODELS):
+                raise CommandError('The DjangoSonar tables are not partitioned, run with --convert first.')
+
+            # UTC date with USE_TZ, like the database session, local date otherwise
+            today = timezone.now().date()
+            created = create_partitions(today, options['days_ahead'] + 1)
+            for name in created:
+                self.stdout.write(f'Created partition {name}')
+
+            if options['drop_older_than'] is not None:
+                cutoff = timezone.now() - timedelta(days=options['drop_older_than'])
+                for partition in drop_partitions(cutoff.date()):
+                    self.stdout.write(
+                        f"Dropped partition {partition['name']} (~{partition['rows']} rows, {partition['bytes']} bytes)"
+                    )
+        except PartitioningUnsupported as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS('DjangoSonar partitions are up to date.'))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from django_sonar.core.retention import get_retention_policy, prune_sonar_data
+
+
+class Command(BaseCommand):
+    help = 'Delete DjangoSonar data older than the retention policy, in small chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep',
+            action='append',
+            default=[],
+            metavar='KEY=DAYS',
+            help='Retention in days for a category or for requests/sample_counters/query_stats/rollups '
+                 '(repeatable, overrides the retention setting)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Rows deleted per chunk (default: retention_batch_size setting)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            help='Seconds to pause between chunks (default: retention_sleep setting)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be deleted'
+        )
+
+    def handle(self, *args, **options):
+        policy = get_retention_policy()
+        for item in options['keep']:
+            key, _sep, days = item.partition('=')
+            try:
+                policy[key.strip()] = float(days)
+            except ValueError:
+                raise CommandError(f'Invalid --keep value "{item}", expected KEY=DAYS.')
+
+        if not policy:
+            self.stdout.write('No retention policy configured, nothing to prune.')
+            return
+
+        report = prune_sonar_data(
+            dry_run=options['dry_run'],
+            policy=policy,
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+        )
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        for key, result in report.items():
+            label = f'{key} (older than {policy[key]:g} days)' if key in policy else f'{key} (unreferenced)'
+            self.stdout.write(
+                f"{label}: {verb.lower()} {result['rows']} rows, {self._format_bytes(result['bytes'])}"
+            )
+
+        total_rows = sum(result['rows'] for result in report.values())
+        total_bytes = sum(result['bytes'] for result in report.values())
+        self.stdout.write(
+            self.style.SUCCESS(f'{verb} {total_rows} rows, {self._format_bytes(total_bytes)} of captured data.')
+        )
+
+    @staticmethod
+    def _format_bytes(size):
+        return str(filesizeformat(size)).replace('\xa0', ' ')
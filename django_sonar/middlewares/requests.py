@@ -1,152 +1,320 @@
 import socket
 import time
 import traceback
-import tracemalloc
-from datetime import datetime
+import uuid
 from urllib.parse import urlencode
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
-from django.db import connection
-from django.urls import resolve
-from django.utils.timezone import make_aware
+from django.urls import Resolver404, resolve
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django_sonar import utils
-from django_sonar.models import SonarRequest
-from django_sonar.core import RequestParser, DataCollector, PathFilter, SensitiveDataFilter
+from django_sonar.core import RequestParser, PathFilter, SensitiveDataFilter
+from django_sonar.core.profiling import MemoryProfiler
+from django_sonar.core.queries import start_query_capture, stop_query_capture
+from django_sonar.core.retention import ensure_retention_scheduler
+from django_sonar.core.rollups import get_route
+from django_sonar.core.sampling import RequestSampler, TailSampler
+from django_sonar.core.writer import (
+    asave_dropped_request, asave_snapshot, save_dropped_request, save_snapshot,
+)
 
 class RequestsMiddleware:
+    """
+    Capture requests and persist them to Sonar.
+
+    Works both as sync (WSGI) and async (ASGI) middleware. Per-request state
+    lives in context variables (see ``django_sonar.utils``), never on the
+    middleware instance, so concurrent requests do not share buffers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.sonar_request_uuid = None
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
         self.path_filter = PathFilter()
+        self.sampler = RequestSampler()
+        self.tail_sampler = TailSampler()
         self.sensitive_filter = SensitiveDataFilter()
         self.parser = RequestParser()
-        tracemalloc.start()  # Start tracing memory allocation    
+        self.memory_profiler = MemoryProfiler()
+
+    @property
+    def sonar_request_uuid(self):
+        """UUID of the last request captured in the current context."""
+        return utils.get_sonar_request_uuid()
 
     def __call__(self, request):
-        # Check if the request path is excluded
+        if self.async_mode:
+            return self.__acall__(request)
+
+        # Check if the request path is excluded or not sampled
+        sampled, resolved = self._sample(request)
+        if not sampled:
+            response = self.get_response(request)
+            # Drop the dumps/exceptions recorded while the request ran
+            self._discard_capture()
+            return response
+
+        capture = self._start_capture(request, dict(request.session), resolved)
+
+        # Process the request
+        response = self.get_response(request)
+
+        # Tail sampling: dropped requests are only counted
+        summary = self._summarize(request, response, capture)
+        if not self.tail_sampler.should_keep(request, response, summary):
+            self._discard_capture()
+            save_dropped_request(summary)
+            return response
+
+        snapshot = self._build_snapshot(request, response, capture, summary, self._get_user_info(request.user))
+
+        # Persist inline, or hand over to the write-behind queue
+        save_snapshot(snapshot)
+
+        return response
+
+    async def __acall__(self, request):
+        # Check if the request path is excluded or not sampled
+        sampled, resolved = self._sample(request)
+        if not sampled:
+            response = await self.get_response(request)
+            # Drop the dumps/exceptions recorded while the request ran
+            self._discard_capture()
+            return response
+
+        capture = self._start_capture(request, await self._aget_session_data(request), resolved)
+
+        # Process the request
+        response = await self.get_response(request)
+
+        # Tail sampling: dropped requests are only counted
+        summary = self._summarize(request, response, capture)
+        if not self.tail_sampler.should_keep(request, response, summary):
+            self._discard_capture()
+            await asave_dropped_request(summary)
+            return response
+
+        snapshot = self._build_snapshot(request, response, capture, summary, await self._aget_user_info(request))
+
+        # Persist without blocking the event loop
+        await asave_snapshot(snapshot)
+
+        return response
+
+    def _sample(self, request):
+        """
+        Take the head sampling decision before any capture work is done.
+
+        Unsampled requests cost a path check and, only when URL-name
+        rates are configured, one resolve().
+
+        :param request: Django request object
+        :return: Tuple (sampled, resolved) where resolved is a ResolverMatch or None
+        """
         if self.path_filter.should_exclude(request.path):
-            return self.get_response(request)
+            return False, None
 
-        # Ensure request-scoped event/log buffers start clean.
-        utils.reset_sonar_events()
-        utils.reset_sonar_logs()
+        resolved = None
+        if self.sampler.needs_resolve:
+            resolved = self._resolve(request)
 
-        # Reset query log at the beginning of the request
-        connection.queries_log.clear()
+        return self.sampler.should_sample(request, resolved), resolved
 
-        # Start timer
-        start_time = time.time()
+    @staticmethod
+    def _resolve(request):
+        try:
+            return resolve(request.path)
+        except Resolver404:
+            return None
 
-        start_memory_usage = tracemalloc.get_traced_memory()[0]  # Get current memory usage
+    def _start_capture(self, request, session_data, resolved=None):
+        """
+        Reset request-scoped buffers and capture everything known before the view runs.
+
+        Data is kept raw here: filtering is deferred to _build_snapshot() so
+        requests dropped by tail sampling never pay for it.
+
+        :param request: Django request object
+        :param session_data: Dictionary with the session data
+        :param resolved: ResolverMatch already computed by sampling, if any
+        :return: Dictionary with the captured request state
+        """
+        # Start the retention scheduler of this process (no-op once started or when disabled)
+        ensure_retention_scheduler()
+
+        # Ensure request-scoped buffers belong to this context and events/logs start clean.
+        utils.start_request_buffers()
+
+        request_uuid = uuid.uuid4()
+        utils.set_sonar_request_uuid(request_uuid)
 
         # Resolve view function
-        resolved = resolve(request.path)
-        view_func = f"{resolved.func.__module__}.{resolved.func.__name__}"
+        if resolved is None:
+            resolved = self._resolve(request)
+        view_func = f"{resolved.func.__module__}.{resolved.func.__name__}" if resolved else None
+        route = get_route(resolved)
 
         # Capture request headers
         request_headers = {k: v for k, v in request.headers.items()}
 
-        # Capture session data
-        session_data = dict(request.session)
-
         # Capture GET/POST data
         get_payload = request.GET.dict()
         post_payload = self.parser.get_body_payload(request)
-        
-        # Filter sensitive data from all captured data
-        request_headers = self.sensitive_filter.filter_dict(request_headers)
-        session_data = self.sensitive_filter.filter_dict(session_data)
-        get_payload = self.sensitive_filter.filter_dict(get_payload)
-        post_payload = self.sensitive_filter.filter_dict(post_payload)
 
-        # Process the request
-        response = self.get_response(request)
+        # Memory profiling is opt-in: tracemalloc only runs for profiled requests
+        memory_state = self.memory_profiler.start() if self.memory_profiler.should_profile(request) else None
+
+        # Record SQL from here on, without relying on DEBUG / queries_log
+        start_query_capture()
 
+        return {
+            'uuid': request_uuid,
+            'start_time': time.time(),
+            'memory_state': memory_state,
+            'view_func': view_func,
+            'route': route,
+            'headers': request_headers,
+            'session': session_data,
+            'get_payload': get_payload,
+            'post_payload': post_payload,
+        }
+
+    def _summarize(self, request, response, capture):
+        """
+        Collect the cheap facts the tail sampling decision is based on.
+
+        :param request: Django request object
+        :param response: Django response object
+        :param capture: State returned by _start_capture()
+        :return: Summary dictionary
+        """
         # Stop timer / duration
-        end_time = time.time()
-        duration = (end_time - start_time) * 1000  # Convert to milliseconds
+        duration = (time.time() - capture['start_time']) * 1000  # Convert to milliseconds
 
-        # memory used
-        end_memory_usage = tracemalloc.get_traced_memory()[0]  # End memory usage
-        memory_diff = (end_memory_usage - start_memory_usage) / 1024 / 1024  # Convert to MB
+        # memory used, when profiled
+        memory_state = capture.pop('memory_state')
+        capture['memory_profile'] = self.memory_profiler.stop(memory_state) if memory_state else None
 
-        # Ensure the response has a content attribute and is not a streaming response
-        response_content = None
-        if hasattr(response, 'content'):
-            response_content = response.content
+        # Stop recording queries, so persisting the request is not captured
+        capture['queries'] = stop_query_capture()
 
-        # log all queries
-        executed_queries = connection.queries
-        query_count = len(executed_queries)
+        return {
+            'verb': request.method,
+            'route': capture['route'],
+            'status': response.status_code,
+            'duration': duration,
+            'query_count': capture['queries'].count,
+            'db_time': capture['queries'].time,
+            'has_exception': bool(utils.get_sonar_exceptions()),
+            'hostname': socket.gethostname(),
+            'created_at': timezone.now(),
+        }
 
-        # Capture request details
-        http_verb = request.method
-        url_path = request.path
-        query_string = urlencode(get_payload)
-        http_status = response.status_code
+    @staticmethod
+    def _discard_capture():
+        """Drop whatever the request buffered without persisting it."""
+        utils.reset_sonar_events()
+        utils.reset_sonar_logs()
+        utils.reset_sonar_dump()
+        utils.reset_sonar_exceptions()
 
-        # logged user
-        user_info = None
-        # get user info if user is authenticated
-        User = get_user_model()
-        if request.user.is_authenticated:
-            # use get_username() instead of username to support custom user models
-            # use get_email_field_name() instead of email to support custom user models
-            user_info = {
-                "user_id": request.user.id,
-                "username": request.user.get_username(),
-                "email": getattr(request.user, User.get_email_field_name(), 'No email provided'),
-                }
-
-        # Additional details
-        is_ajax = self.parser.is_ajax(request)
-        timestamp = make_aware(datetime.now())  # Make sure the timestamp is timezone-aware
-        hostname = socket.gethostname()
-        ip_address = self.parser.get_client_ip(request)
-        middlewares_used = settings.MIDDLEWARE
+    def _build_snapshot(self, request, response, capture, summary, user_info):
+        """
+        Build the snapshot of a processed request and drain request-scoped buffers.
+
+        :param request: Django request object
+        :param response: Django response object
+        :param capture: State returned by _start_capture()
+        :param summary: Summary returned by _summarize()
+        :param user_info: Dictionary with user information or None
+        :return: Snapshot dictionary (see core.persistence)
+        """
+        memory_profile = capture['memory_profile']
+
+        # Filter sensitive data from all captured data
+        get_payload = self.sensitive_filter.filter_dict(capture['get_payload'])
 
         # if there is a querystring add it to the full url
+        query_string = urlencode(get_payload)
         if query_string:
-            full_url = f"{url_path}?{query_string}"
+            full_url = f"{request.path}?{query_string}"
         else:
-            full_url = url_path
-
-        # Create a SonarRequest object
-        sonar_request = SonarRequest.objects.create(
-            verb=http_verb,
-            path=full_url,
-            status=http_status,
-            duration=duration,
-            query_count=query_count,
-            ip_address=ip_address,
-            hostname=hostname,
-            is_ajax=is_ajax,
-            created_at=timestamp,
-        )
-
-        # saves request's uuid
-        self.sonar_request_uuid = sonar_request.uuid
-
-        # Initialize data collector for this request
-        collector = DataCollector(self.sonar_request_uuid)
-
-        # Save all collected data
-        collector.save_details(user_info, view_func, middlewares_used, memory_diff)
-        collector.save_payload(get_payload, post_payload)
-        collector.save_queries(executed_queries)
-        collector.save_headers(request_headers)
-        collector.save_session(session_data)
-        collector.save_events()
-        collector.save_logs()
-        collector.save_dumps()
-        collector.save_exceptions()
+            full_url = request.path
 
-        return response
+        snapshot = {
+            'uuid': capture['uuid'],
+            'verb': request.method,
+            'path': full_url,
+            'route': summary['route'],
+            'status': summary['status'],
+            'duration': summary['duration'],
+            'query_count': summary['query_count'],
+            'db_time': summary['db_time'],
+            'ip_address': self.parser.get_client_ip(request),
+            'hostname': summary['hostname'],
+            'is_ajax': self.parser.is_ajax(request),
+            'created_at': summary['created_at'],
+            'user_info': user_info,
+            'view_func': capture['view_func'],
+            'middlewares_used': settings.MIDDLEWARE,
+            'memory_used': memory_profile['memory_used'] if memory_profile else None,
+            'memory_profile': memory_profile,
+            'get_payload': get_payload,
+            'post_payload': self.sensitive_filter.filter_dict(capture['post_payload']),
+            'queries': capture['queries'].as_list(),
+            'query_aliases': capture['queries'].get_alias_stats(),
+            'headers': self.sensitive_filter.filter_dict(capture['headers']),
+            'session': self.sensitive_filter.filter_dict(capture['session']),
+            'events': utils.get_sonar_events(),
+            'logs': utils.get_sonar_logs(),
+            'dumps': utils.get_sonar_dump(),
+            'exceptions': utils.get_sonar_exceptions(),
+        }
+        self._discard_capture()
+        return snapshot
+
+    @staticmethod
+    def _get_user_info(user):
+        """
+        Get user info if user is authenticated.
+
+        :param user: User instance (or AnonymousUser)
+        :return: Dictionary with user information or None
+        """
+        if not user.is_authenticated:
+            return None
+
+        User = get_user_model()
+        # use get_username() instead of username to support custom user models
+        # use get_email_field_name() instead of email to support custom user models
+        return {
+            "user_id": user.id,
+            "username": user.get_username(),
+            "email": getattr(user, User.get_email_field_name(), 'No email provided'),
+        }
+
+    async def _aget_user_info(self, request):
+        # request.user may be a lazy object backed by a DB query
+        if hasattr(request, 'auser'):
+            return self._get_user_info(await request.auser())
+        return await sync_to_async(self._get_user_info)(request.user)
+
+    async def _aget_session_data(self, request):
+        # Session loading may hit the DB/cache backend
+        if hasattr(request.session, 'aitems'):
+            return dict(await request.session.aitems())
+        return await sync_to_async(dict)(request.session)
 
     def process_exception(self, request, exception):
         """
-        Process exceptions and store them in thread-local storage.
+        Process exceptions and store them in request-scoped storage.
         
         This method is called by Django when an exception occurs during request processing.
         The exception data is stored temporarily and will be saved to the database
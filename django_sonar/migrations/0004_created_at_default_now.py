@@ -0,0 +1,24 @@
+# Generated migration for making created_at assignable (write-behind snapshots keep capture time)
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_sonar', '0003_alter_sonarrequest_path'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sonardata',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created'),
+        ),
+        migrations.AlterField(
+            model_name='sonarrequest',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated migration for the tail sampling summary counters
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_sonar', '0004_created_at_default_now'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SonarSampleCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(verbose_name='Bucket')),
+                ('hostname', models.CharField(blank=True, default='', max_length=255, verbose_name='Hostname')),
+                ('dropped', models.PositiveIntegerField(default=0, verbose_name='Dropped')),
+                ('total_duration', models.FloatField(default=0, verbose_name='Total Duration')),
+            ],
+            options={
+                'db_table': 'sonar_sample_counters',
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'hostname'), name='sonar_sample_counter_bucket_host')],
+            },
+        ),
+    ]
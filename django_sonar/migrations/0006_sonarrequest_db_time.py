@@ -0,0 +1,18 @@
+# Generated migration for per-request total database time
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_sonar', '0005_sonarsamplecounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sonarrequest',
+            name='db_time',
+            field=models.FloatField(default=0, verbose_name='DB Time'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated migration for per-fingerprint query statistics
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_sonar', '0006_sonarrequest_db_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SonarQueryStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=32, unique=True, verbose_name='Fingerprint')),
+                ('sql', models.TextField(verbose_name='Normalized SQL')),
+                ('alias', models.CharField(blank=True, default='', max_length=255, verbose_name='Database Alias')),
+                ('calls', models.PositiveBigIntegerField(default=0, verbose_name='Calls')),
+                ('total_time', models.FloatField(default=0, verbose_name='Total Time')),
+                ('max_time', models.FloatField(default=0, verbose_name='Max Time')),
+                ('p50', models.FloatField(default=0, verbose_name='P50')),
+                ('p95', models.FloatField(default=0, verbose_name='P95')),
+                ('p99', models.FloatField(default=0, verbose_name='P99')),
+                ('sketch', models.JSONField(default=dict, verbose_name='Latency Sketch')),
+                ('example_requests', models.JSONField(default=list, verbose_name='Example Requests')),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now, verbose_name='First Seen')),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Last Seen')),
+            ],
+            options={
+                'db_table': 'sonar_query_stats',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated migration for storing EXPLAIN plans per query fingerprint
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_sonar', '0007_sonarquerystat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sonarquerystat',
+            name='explain_plan',
+            field=models.TextField(blank=True, default='', verbose_name='Query Plan'),
+        ),
+        migrations.AddField(
+            model_name='sonarquerystat',
+            name='explain_sql',
+            field=models.TextField(blank=True, default='', verbose_name='Explained SQL'),
+        ),
+        migrations.AddField(
+            model_name='sonarquerystat',
+            name='explained_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Explained'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated migration adding indexes for the dashboard access paths
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_sonar', '0008_sonarquerystat_explain'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sonardata',
+            index=models.Index(fields=['category', '-created_at'], name='sonar_data_category_created'),
+        ),
+        migrations.AddIndex(
+            model_name='sonardata',
+            index=models.Index(fields=['sonar_request', 'category', '-created_at'], name='sonar_data_request_category'),
+        ),
+        migrations.AddIndex(
+            model_name='sonarrequest',
+            index=models.Index(fields=['-created_at'], name='sonar_requests_created'),
+        ),
+        migrations.AddIndex(
+            model_name='sonarrequest',
+            index=models.Index(fields=['verb', '-created_at'], name='sonar_requests_verb_created'),
+        ),
+        migrations.AddIndex(
+            model_name='sonarrequest',
+            index=models.Index(fields=['status', '-created_at'], name='sonar_requests_status_created'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated migration adding compressed payload storage to SonarData
+
+import django_sonar.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_sonar', '0009_dashboard_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sonardata',
+            name='data_blob',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Compressed Data'),
+        ),
+        migrations.AlterField(
+            model_name='sonardata',
+            name='data',
+            field=django_sonar.models.fields.CompressedJSONField(null=True, verbose_name='Data'),
+        ),
+    ]
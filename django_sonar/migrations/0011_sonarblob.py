@@ -0,0 +1,39 @@
+# Generated migration adding deduplicated payload blobs
+
+import django.db.models.deletion
+import django.utils.timezone
+import django_sonar.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_sonar', '0010_sonardata_data_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SonarBlob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Hash')),
+                ('data', django_sonar.models.fields.CompressedJSONField(null=True, verbose_name='Data')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='Size')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created')),
+                ('data_blob', models.BinaryField(blank=True, null=True, verbose_name='Compressed Data')),
+            ],
+            options={
+                'db_table': 'sonar_blobs',
+            },
+        ),
+        migrations.AlterField(
+            model_name='sonardata',
+            name='data',
+            field=django_sonar.models.fields.CompressedJSONField(null=True, ref_field='blob', verbose_name='Data'),
+        ),
+        migrations.AddField(
+            model_name='sonardata',
+            name='blob',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='django_sonar.sonarblob', verbose_name='Blob'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated migration adding per-route rollups and SonarRequest.route
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_sonar', '0011_sonarblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sonarrequest',
+            name='route',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Route'),
+        ),
+        migrations.CreateModel(
+            name='SonarRouteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=8, verbose_name='Resolution')),
+                ('bucket', models.DateTimeField(verbose_name='Bucket')),
+                ('route', models.CharField(blank=True, default='', max_length=255, verbose_name='Route')),
+                ('verb', models.CharField(max_length=16, verbose_name='Verb')),
+                ('status_class', models.CharField(max_length=3, verbose_name='Status Class')),
+                ('hostname', models.CharField(blank=True, default='', max_length=255, verbose_name='Hostname')),
+                ('count', models.PositiveBigIntegerField(default=0, verbose_name='Count')),
+                ('error_count', models.PositiveBigIntegerField(default=0, verbose_name='Errors')),
+                ('total_duration', models.FloatField(default=0, verbose_name='Total Duration')),
+                ('max_duration', models.FloatField(default=0, verbose_name='Max Duration')),
+                ('sketch', models.JSONField(default=dict, verbose_name='Latency Sketch')),
+            ],
+            options={
+                'db_table': 'sonar_route_rollups',
+                'constraints': [models.UniqueConstraint(fields=('resolution', 'bucket', 'route', 'verb', 'status_class', 'hostname'), name='sonar_route_rollup_key')],
+            },
+        ),
+    ]
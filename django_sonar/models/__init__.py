@@ -1,2 +1,6 @@
 from .sonar_request import SonarRequest
+from .sonar_blob import SonarBlob
 from .sonar_data import SonarData
+from .sonar_sample_counter import SonarSampleCounter
+from .sonar_query_stat import SonarQueryStat
+from .sonar_route_rollup import SonarRouteRollup
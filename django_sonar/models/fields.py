@@ -0,0 +1,80 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from django_sonar.compression import decompress_payload, encode_payload
+
+
+class CompressedDataDescriptor(DeferredAttribute):
+    """Return the JSON value, decoding the companion blob on first access."""
+
+    def __set__(self, instance, value):
+        # A data descriptor, so __get__ runs even once the value is in __dict__
+        instance.__dict__[self.field.attname] = value
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        data = super().__get__(instance, cls)
+        if data is None:
+            blob = getattr(instance, self.field.blob_field)
+            if blob is not None:
+                data = instance.__dict__[self.field.attname] = decompress_payload(blob)
+            elif self.field.ref_field is not None:
+                data = self._get_referenced(instance)
+        return data
+
+    def _get_referenced(self, instance):
+        ref_field = instance._meta.get_field(self.field.ref_field)
+        if getattr(instance, ref_field.attname) is None:
+            return None
+        try:
+            # Cached by the foreign key descriptor, not copied to the instance
+            return getattr(instance, ref_field.name).data
+        except ObjectDoesNotExist:
+            return None
+
+
+class CompressedJSONField(models.JSONField):
+    """
+    JSONField whose large values are stored compressed in a binary companion
+    field (see ``django_sonar.compression``). The companion field must be
+    declared after this one on the model.
+
+    With ref_field, a NULL value is read from the ``data`` of the object
+    referenced by that foreign key (see ``core.blobs``).
+    """
+
+    descriptor_class = CompressedDataDescriptor
+    # Storage routing is done in Python: changing it needs no schema change
+    non_db_attrs = models.JSONField.non_db_attrs + ('blob_field', 'ref_field')
+
+    def __init__(self, *args, blob_field='data_blob', ref_field=None, **kwargs):
+        self.blob_field = blob_field
+        self.ref_field = ref_field
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.blob_field != 'data_blob':
+            kwargs['blob_field'] = self.blob_field
+        if self.ref_field is not None:
+            kwargs['ref_field'] = self.ref_field
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        # Runs before the companion field is read, on save() and bulk_create() alike
+        if self._is_referenced(model_instance):
+            setattr(model_instance, self.blob_field, None)
+            return None
+        value = super().pre_save(model_instance, add)
+        blob = encode_payload(value)
+        setattr(model_instance, self.blob_field, blob)
+        return None if blob is not None else value
+
+    def _is_referenced(self, model_instance):
+        # The descriptor would resolve the reference: check the raw value
+        if self.ref_field is None or model_instance.__dict__.get(self.attname) is not None:
+            return False
+        ref_field = model_instance._meta.get_field(self.ref_field)
+        return getattr(model_instance, ref_field.attname) is not None
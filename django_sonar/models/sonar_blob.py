@@ -0,0 +1,23 @@
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from .fields import CompressedJSONField
+
+
+class SonarBlob(models.Model):
+    """Payload shared by many SonarData rows, keyed by the hash of its canonical JSON."""
+
+    hash = models.CharField(primary_key=True, max_length=64, verbose_name=_('Hash'))
+    data = CompressedJSONField(verbose_name=_('Data'), null=True)
+    size = models.PositiveIntegerField(verbose_name=_('Size'), default=0)
+    created_at = models.DateTimeField(default=timezone.now, verbose_name=_('Created'))
+    # Compressed payload, set instead of data for large payloads (see django_sonar.compression)
+    data_blob = models.BinaryField(verbose_name=_('Compressed Data'), blank=True, null=True)
+
+    def __str__(self):
+        return self.hash
+
+    class Meta:
+        app_label = 'django_sonar'
+        db_table = 'sonar_blobs'
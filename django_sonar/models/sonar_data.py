@@ -1,12 +1,22 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .fields import CompressedJSONField
+
 
 class SonarData(models.Model):
     sonar_request = models.ForeignKey('SonarRequest', on_delete=models.CASCADE, to_field='uuid', verbose_name=_('Request UUID'))
     category = models.CharField(max_length=255, verbose_name=_('Category'))
-    data = models.JSONField(verbose_name=_('Data'))
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Created'))
+    data = CompressedJSONField(verbose_name=_('Data'), null=True, ref_field='blob')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name=_('Created'))
+    # Compressed payload, set instead of data for large payloads (see django_sonar.compression)
+    data_blob = models.BinaryField(verbose_name=_('Compressed Data'), blank=True, null=True)
+    # Shared payload, set instead of data for deduplicated categories (see core.blobs)
+    blob = models.ForeignKey(
+        'SonarBlob', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+        blank=True, null=True, verbose_name=_('Blob')
+    )
 
     def __str__(self):
         return f"Dump {self.id} for Request {self.sonar_request}"
@@ -14,3 +24,9 @@ class SonarData(models.Model):
     class Meta:
         app_label = 'django_sonar'
         db_table = 'sonar_data'
+        indexes = [
+            # Panel lists: filter by category, newest first
+            models.Index(fields=['category', '-created_at'], name='sonar_data_category_created'),
+            # Request detail tabs: one category of one request, latest first
+            models.Index(fields=['sonar_request', 'category', '-created_at'], name='sonar_data_request_category'),
+        ]
@@ -0,0 +1,35 @@
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class SonarQueryStat(models.Model):
+    """Aggregated statistics of one query fingerprint, updated at write time."""
+
+    fingerprint = models.CharField(max_length=32, unique=True, verbose_name=_('Fingerprint'))
+    sql = models.TextField(verbose_name=_('Normalized SQL'))
+    alias = models.CharField(max_length=255, verbose_name=_('Database Alias'), blank=True, default='')
+    calls = models.PositiveBigIntegerField(verbose_name=_('Calls'), default=0)
+    total_time = models.FloatField(verbose_name=_('Total Time'), default=0)
+    max_time = models.FloatField(verbose_name=_('Max Time'), default=0)
+    p50 = models.FloatField(verbose_name=_('P50'), default=0)
+    p95 = models.FloatField(verbose_name=_('P95'), default=0)
+    p99 = models.FloatField(verbose_name=_('P99'), default=0)
+    sketch = models.JSONField(verbose_name=_('Latency Sketch'), default=dict)
+    example_requests = models.JSONField(verbose_name=_('Example Requests'), default=list)
+    first_seen = models.DateTimeField(default=timezone.now, verbose_name=_('First Seen'))
+    last_seen = models.DateTimeField(default=timezone.now, verbose_name=_('Last Seen'))
+    explain_plan = models.TextField(verbose_name=_('Query Plan'), blank=True, default='')
+    explain_sql = models.TextField(verbose_name=_('Explained SQL'), blank=True, default='')
+    explained_at = models.DateTimeField(verbose_name=_('Explained'), blank=True, null=True)
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.calls if self.calls else 0
+
+    def __str__(self):
+        return f"{self.fingerprint} ({self.calls} calls)"
+
+    class Meta:
+        app_label = 'django_sonar'
+        db_table = 'sonar_query_stats'
@@ -0,0 +1,39 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class SonarRouteRollup(models.Model):
+    """Per-minute or per-hour aggregate of the requests of one route, updated at write time."""
+
+    MINUTE = 'minute'
+    HOUR = 'hour'
+    RESOLUTIONS = (
+        (MINUTE, _('Minute')),
+        (HOUR, _('Hour')),
+    )
+
+    resolution = models.CharField(max_length=8, choices=RESOLUTIONS, verbose_name=_('Resolution'))
+    bucket = models.DateTimeField(verbose_name=_('Bucket'))
+    route = models.CharField(max_length=255, verbose_name=_('Route'), blank=True, default='')
+    verb = models.CharField(max_length=16, verbose_name=_('Verb'))
+    status_class = models.CharField(max_length=3, verbose_name=_('Status Class'))
+    hostname = models.CharField(max_length=255, verbose_name=_('Hostname'), blank=True, default='')
+    count = models.PositiveBigIntegerField(verbose_name=_('Count'), default=0)
+    error_count = models.PositiveBigIntegerField(verbose_name=_('Errors'), default=0)
+    total_duration = models.FloatField(verbose_name=_('Total Duration'), default=0)
+    max_duration = models.FloatField(verbose_name=_('Max Duration'), default=0)
+    sketch = models.JSONField(verbose_name=_('Latency Sketch'), default=dict)
+
+    def __str__(self):
+        return f"{self.verb} {self.route or '-'} {self.status_class} at {self.bucket:%Y-%m-%d %H:%M} ({self.count})"
+
+    class Meta:
+        app_label = 'django_sonar'
+        db_table = 'sonar_route_rollups'
+        constraints = [
+            # Also serves the Endpoints panel scans of a time window
+            models.UniqueConstraint(
+                fields=['resolution', 'bucket', 'route', 'verb', 'status_class', 'hostname'],
+                name='sonar_route_rollup_key',
+            ),
+        ]
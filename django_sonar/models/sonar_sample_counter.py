@@ -0,0 +1,21 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class SonarSampleCounter(models.Model):
+    """Per-minute summary of the requests dropped by tail sampling."""
+
+    bucket = models.DateTimeField(verbose_name=_('Bucket'))
+    hostname = models.CharField(max_length=255, verbose_name=_('Hostname'), blank=True, default='')
+    dropped = models.PositiveIntegerField(verbose_name=_('Dropped'), default=0)
+    total_duration = models.FloatField(verbose_name=_('Total Duration'), default=0)
+
+    def __str__(self):
+        return f"{self.dropped} dropped at {self.bucket:%Y-%m-%d %H:%M} on {self.hostname}"
+
+    class Meta:
+        app_label = 'django_sonar'
+        db_table = 'sonar_sample_counters'
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'hostname'], name='sonar_sample_counter_bucket_host'),
+        ]
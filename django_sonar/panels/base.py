@@ -1,8 +1,12 @@
+from datetime import timedelta
+
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.urls import reverse
+from django.utils import timezone
 
-from django_sonar.models import SonarData
+from django_sonar.storage import get_storage
+from django_sonar.utils import get_sonar_settings
 
 
 class SonarPanel:
@@ -69,16 +73,39 @@ class SonarPanel:
     @classmethod
     def get_queryset(cls, request):
         """Return base queryset for the panel."""
+        entries = get_storage().entries()
         if not cls.category:
-            return SonarData.objects.none()
+            return entries.none()
+
+        return entries.filter(category=cls.category)
+
+    @classmethod
+    def get_window_start(cls):
+        """
+        Oldest created_at shown by list views, from the dashboard_window_days setting.
 
-        return SonarData.objects.filter(category=cls.category).order_by('-created_at').all()
+        A time bound lets PostgreSQL skip old partitions of the Sonar tables.
+
+        :return: datetime, or None when lists are not time-bounded
+        """
+        window_days = get_sonar_settings().get('dashboard_window_days')
+        if not window_days:
+            return None
+        return timezone.now() - timedelta(days=window_days)
+
+    @classmethod
+    def apply_window(cls, queryset):
+        """Restrict a list queryset to the dashboard time window."""
+        window_start = cls.get_window_start()
+        if window_start is None:
+            return queryset
+        return queryset.filter(created_at__gte=window_start)
 
     @classmethod
     def get_list_context(cls, request):
         """Build context for list rendering."""
         return {
-            cls.list_context_name: cls.get_queryset(request),
+            cls.list_context_name: cls.apply_window(cls.get_queryset(request)),
         }
 
     @classmethod
@@ -1,9 +1,38 @@
+from datetime import timedelta
+
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Sum
+from django.utils import timezone
 
-from django_sonar.models import SonarRequest
+from django_sonar.core.callsite import group_by_call_site
+from django_sonar.core.query_stats import is_query_stats_enabled
+from django_sonar.core.rollups import (
+    get_latency_series,
+    get_slow_requests_filter,
+    is_rollups_enabled,
+    summarize_rollups,
+    truncate_bucket,
+)
+from django_sonar.models import SonarQueryStat, SonarRouteRollup, SonarSampleCounter
+from django_sonar.storage import get_storage, get_storage_class
 from .base import SonarPanel
 
 
+def uses_database_storage(sonar_settings):
+    """Panels reading the database aggregates only exist with the database storage."""
+    return get_storage_class(sonar_settings or {}).database
+
+
+def uses_query_stats(sonar_settings):
+    """The Top Queries panel lists the statistics rows, only updated with the query_stats setting."""
+    return is_query_stats_enabled() and uses_database_storage(sonar_settings)
+
+
+def uses_rollups(sonar_settings):
+    """The Endpoints panel lists the route rollups, only updated with the rollups setting."""
+    return is_rollups_enabled() and uses_database_storage(sonar_settings)
+
+
 class RequestsPanel(SonarPanel):
     key = 'requests'
     label = 'Requests'
@@ -12,18 +41,27 @@ class RequestsPanel(SonarPanel):
     list_url_name = 'sonar_requests'
     order = 10
     paginate_by = 25
+    # Percentile filter: requests slower than the quantile of their endpoint (from the rollups)
+    percentiles = {'50': 0.5, '90': 0.9, '95': 0.95, '99': 0.99}
+    percentile_window = timedelta(days=7)
+    sparkline_window = timedelta(hours=1)
 
     @classmethod
     def get_list_context(cls, request):
         verb_filter = request.GET.get('verb', '')
         path_filter = request.GET.get('path', '')
         status_filter = request.GET.get('status', '')
+        percentile_filter = request.GET.get('percentile', '')
+        if percentile_filter not in cls.percentiles:
+            percentile_filter = ''
         page = request.GET.get('page', 1)
 
-        sonar_requests = SonarRequest.objects.all()
+        storage = get_storage()
+        sonar_requests = cls.apply_window(storage.requests())
 
         if verb_filter:
-            sonar_requests = sonar_requests.filter(verb__iexact=verb_filter)
+            # Verbs are stored upper-case: an exact match can use the index
+            sonar_requests = sonar_requests.filter(verb=verb_filter.upper())
 
         if path_filter:
             sonar_requests = sonar_requests.filter(path__icontains=path_filter)
@@ -31,6 +69,17 @@ class RequestsPanel(SonarPanel):
         if status_filter:
             sonar_requests = sonar_requests.filter(status=status_filter)
 
+        # Percentiles and sparklines come from the route rollups, sampling counters from the database
+        rollups = storage.database and is_rollups_enabled()
+        if not rollups:
+            percentile_filter = ''
+
+        if percentile_filter:
+            slow_requests = get_slow_requests_filter(
+                cls.percentiles[percentile_filter], timezone.now() - cls.percentile_window
+            )
+            sonar_requests = sonar_requests.filter(slow_requests) if slow_requests else sonar_requests.none()
+
         sonar_requests = sonar_requests.order_by('-created_at')
 
         paginator = Paginator(sonar_requests, cls.paginate_by)
@@ -45,12 +94,34 @@ class RequestsPanel(SonarPanel):
             'verb': verb_filter,
             'path': path_filter,
             'status': status_filter,
+            'percentile': percentile_filter,
         }
 
+        # Requests dropped by tail sampling are only counted
+        dropped_requests = 0
+        if storage.database:
+            dropped_requests = SonarSampleCounter.objects.aggregate(total=Sum('dropped'))['total'] or 0
+
         return {
             'sonar_requests': sonar_requests_page,
             'page_obj': sonar_requests_page,
             'filters': filters,
+            'dropped_requests': dropped_requests,
+            'latency': cls.get_latency_context() if rollups else None,
+        }
+
+    @classmethod
+    def get_latency_context(cls):
+        """Build the per-minute traffic and p95 sparklines of the last hour from the rollups."""
+        series = get_latency_series(timezone.now() - cls.sparkline_window, q=0.95)
+        total = sum(point['count'] for point in series)
+        if not total:
+            return None
+        return {
+            'counts': [point['count'] for point in series],
+            'p95': [point['quantile'] for point in series],
+            'total': total,
+            'latest_p95': next((point['quantile'] for point in reversed(series) if point['count']), None),
         }
 
 
@@ -88,7 +159,7 @@ class QueriesPanel(SonarPanel):
 
     @classmethod
     def get_list_context(cls, request):
-        queries = cls.get_queryset(request)
+        queries = cls.apply_window(cls.get_queryset(request))
         executed = []
 
         for query in queries:
@@ -100,8 +171,13 @@ class QueriesPanel(SonarPanel):
                 row['index'] = index
                 executed.append(row)
 
+        # Optionally group every listed query by the line of code that issued it
+        group = request.GET.get('group', '')
+
         return {
             'queries': executed,
+            'group': group,
+            'call_sites': group_by_call_site(executed) if group == 'call_site' else [],
         }
 
 
@@ -136,6 +212,85 @@ class LogsPanel(SonarPanel):
     order = 60
 
 
+class TopQueriesPanel(SonarPanel):
+    key = 'top_queries'
+    label = 'Top Queries'
+    icon = 'bi-bar-chart'
+    list_template = 'django_sonar/top_queries/index.html'
+    list_context_name = 'query_stats'
+    order = 80
+    enabled = uses_query_stats
+    limit = 50
+    sort_fields = {
+        'total_time': '-total_time',
+        'calls': '-calls',
+        'max_time': '-max_time',
+        'p95': '-p95',
+    }
+
+    @classmethod
+    def get_list_context(cls, request):
+        sort = request.GET.get('sort', 'total_time')
+        if sort not in cls.sort_fields:
+            sort = 'total_time'
+
+        query_stats = SonarQueryStat.objects.defer('sketch').order_by(cls.sort_fields[sort])[:cls.limit]
+
+        return {
+            'query_stats': query_stats,
+            'sort': sort,
+        }
+
+
+class EndpointsPanel(SonarPanel):
+    key = 'endpoints'
+    label = 'Endpoints'
+    icon = 'bi-signpost-split'
+    list_template = 'django_sonar/endpoints/index.html'
+    list_context_name = 'endpoints'
+    order = 90
+    enabled = uses_rollups
+    limit = 50
+    # Window: (rollup resolution, length)
+    windows = {
+        '1h': (SonarRouteRollup.MINUTE, timedelta(hours=1)),
+        '24h': (SonarRouteRollup.HOUR, timedelta(hours=24)),
+        '7d': (SonarRouteRollup.HOUR, timedelta(days=7)),
+    }
+    sort_fields = {
+        'total_time': 'total_duration',
+        'count': 'count',
+        'errors': 'error_count',
+        'p95': 'p95',
+        'max_time': 'max_duration',
+    }
+
+    @classmethod
+    def get_list_context(cls, request):
+        sort = request.GET.get('sort', 'total_time')
+        if sort not in cls.sort_fields:
+            sort = 'total_time'
+        window = request.GET.get('window', '1h')
+        if window not in cls.windows:
+            window = '1h'
+
+        # Only reads rollups: the cost depends on routes x buckets, not on raw requests
+        resolution, length = cls.windows[window]
+        rollups = SonarRouteRollup.objects.filter(
+            resolution=resolution,
+            bucket__gte=truncate_bucket(timezone.now() - length, resolution),
+        )
+        endpoints = summarize_rollups(rollups)
+        endpoints.sort(key=lambda endpoint: endpoint[cls.sort_fields[sort]] or 0, reverse=True)
+
+        return {
+            'endpoints': endpoints[:cls.limit],
+            'sort': sort,
+            'window': window,
+            'windows': list(cls.windows),
+        }
+
+
 def get_builtin_panels():
     """Return built-in panel classes in sidebar order."""
     return [
@@ -146,4 +301,6 @@ def get_builtin_panels():
         EventsPanel,
         LogsPanel,
         SignalsPanel,
+        TopQueriesPanel,
+        EndpointsPanel,
     ]
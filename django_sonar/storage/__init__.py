@@ -0,0 +1,94 @@
+"""
+Pluggable storage of the captured requests.
+
+The ``storage`` setting selects where the middleware, the collectors and
+the dashboard write and read captured requests:
+- 'database' (default): the Sonar tables (see ``storage.database``)
+- 'segments': append-only segment files on local disk, for deployments
+  where Sonar must not write to the database at full traffic (see
+  ``storage.segments``)
+- 'memory': a bounded ring buffer in each process, for development and
+  test runs (see ``storage.memory``)
+- the dotted path of a SonarStorage subclass
+
+One storage instance is kept per process and per backend configuration.
+"""
+
+import os
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from django_sonar.utils import get_sonar_settings
+from .base import SonarStorage
+
+
+BACKENDS = {
+    'database': 'django_sonar.storage.database.DatabaseStorage',
+    'segments': 'django_sonar.storage.segments.SegmentStorage',
+    'memory': 'django_sonar.storage.memory.MemoryStorage',
+}
+
+_storage = None
+_storage_key = None
+_storage_lock = threading.Lock()
+
+
+def get_storage_path(sonar_settings=None):
+    """
+    Return the dotted path of the configured storage backend.
+
+    :param sonar_settings: DJANGO_SONAR dictionary (default: the current settings)
+    :return: dotted path of a SonarStorage subclass
+    """
+    if sonar_settings is None:
+        sonar_settings = get_sonar_settings()
+    backend = sonar_settings.get('storage', 'database')
+    return BACKENDS.get(backend, backend)
+
+
+def get_storage_class(sonar_settings=None):
+    """
+    Return the configured storage backend class, without instantiating it.
+
+    :param sonar_settings: DJANGO_SONAR dictionary (default: the current settings)
+    :return: SonarStorage subclass
+    """
+    return _import_storage(get_storage_path(sonar_settings))
+
+
+def _import_storage(path):
+    try:
+        storage_class = import_string(path)
+    except ImportError as exc:
+        raise ImproperlyConfigured(f'Unable to import Sonar storage "{path}": {exc}') from exc
+    if not isinstance(storage_class, type) or not issubclass(storage_class, SonarStorage):
+        raise ImproperlyConfigured(f'Sonar storage "{path}" must be a SonarStorage subclass.')
+    return storage_class
+
+
+def get_storage():
+    """
+    Return the storage backend of this process, (re)creating it when the
+    setting or the process (e.g. after a fork) changed.
+
+    :return: SonarStorage instance
+    """
+    global _storage, _storage_key
+
+    path = get_storage_path()
+    storage_class = _import_storage(path)
+
+    options = storage_class.get_options()
+    key = (path, os.getpid(), tuple(sorted(options.items())))
+    with _storage_lock:
+        if _storage is None or _storage_key != key:
+            if _storage is not None and _storage_key[1] == key[1]:
+                _storage.close()
+            _storage = storage_class(**options)
+            _storage_key = key
+        return _storage
+
+
+__all__ = ['SonarStorage', 'get_storage', 'get_storage_class']
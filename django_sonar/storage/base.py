@@ -0,0 +1,87 @@
+class SonarStorage:
+    """
+    Where captured requests are written and read back from.
+
+    Readers return QuerySet-like collections: the database backend returns
+    real querysets, other backends a RecordSet (see ``storage.records``)
+    supporting ``filter()`` with keyword lookups, ``get()``, ``first()``,
+    ``exists()``, ``count()``, ``none()``, ``order_by()``, iteration and
+    slicing, which is all the dashboard uses.
+    """
+
+    # Whether requests live in the Sonar tables, with the aggregates derived
+    # from them (query statistics, route rollups, tail sampling counters)
+    database = False
+
+    @classmethod
+    def get_options(cls):
+        """
+        Read the keyword arguments of the backend from the settings.
+
+        :return: Dictionary of hashable values
+        """
+        return {}
+
+    def close(self):
+        """Release open files or connections, before the backend is replaced."""
+
+    def save_snapshots(self, snapshots):
+        """
+        Persist a batch of snapshots (see ``core.persistence``).
+
+        :param snapshots: List of snapshot dictionaries
+        """
+        raise NotImplementedError
+
+    def save_entries(self, entries, blobs=None, sonar_request=None, batch_size=None):
+        """
+        Persist SonarData entries built by a DataCollector.
+
+        :param entries: List of unsaved SonarData instances
+        :param blobs: Dictionary {hash: SonarBlob} referenced by deduplicated entries
+        :param sonar_request: Optional unsaved SonarRequest written with the entries
+        :param batch_size: Max rows per INSERT, for backends writing rows
+        """
+        raise NotImplementedError
+
+    def save_sample_counts(self, counts):
+        """
+        Persist the counts of requests dropped by tail sampling.
+
+        :param counts: Dictionary {(bucket, hostname): [dropped, total_duration]}
+        """
+
+    def save_rollups(self, deltas):
+        """
+        Persist the route rollups of requests dropped by tail sampling.
+
+        :param deltas: Dictionary built with core.rollups.add_rollup()
+        """
+
+    def requests(self):
+        """
+        Return every captured request, newest first.
+
+        Requests are SonarRequest instances with a ``has_n_plus_one`` attribute.
+        """
+        raise NotImplementedError
+
+    def entries(self):
+        """Return every SonarData entry, newest first."""
+        raise NotImplementedError
+
+    def mark_read(self, sonar_request):
+        """Flag a request as read in the dashboard."""
+
+    def prune(self, before):
+        """
+        Delete the requests created before a date.
+
+        :param before: Datetime cutoff
+        :return: Dictionary {'rows': int, 'bytes': int}
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """Delete every captured request with its entries (the database aggregates are kept)."""
+        raise NotImplementedError
@@ -0,0 +1,60 @@
+"""
+Database storage: captured requests live in the Sonar tables.
+
+This is the default backend. Writes are the batched transactions of
+``core.persistence``; reads are plain querysets, so panels may use any
+QuerySet feature (annotations, expressions, indexes).
+"""
+
+from django.db import router, transaction
+from django.db.models import Exists, OuterRef
+
+from django_sonar.core.blobs import write_blobs
+from django_sonar.core.clear import RAW_MODELS, flush_sonar_tables
+from django_sonar.core.persistence import persist_rollups, persist_sample_counts, persist_snapshots
+from django_sonar.core.retention import RetentionPruner
+from django_sonar.models import SonarData, SonarRequest
+from .base import SonarStorage
+
+
+class DatabaseStorage(SonarStorage):
+    """Store captured requests in the Sonar tables"""
+
+    database = True
+
+    def save_snapshots(self, snapshots):
+        persist_snapshots(snapshots)
+
+    def save_entries(self, entries, blobs=None, sonar_request=None, batch_size=None):
+        with transaction.atomic(using=router.db_for_write(SonarData)):
+            if sonar_request is not None:
+                sonar_request.save(force_insert=True)
+            write_blobs(blobs, batch_size=batch_size)
+            if entries:
+                SonarData.objects.bulk_create(entries, batch_size=batch_size)
+
+    def save_sample_counts(self, counts):
+        persist_sample_counts(counts)
+
+    def save_rollups(self, deltas):
+        persist_rollups(deltas)
+
+    def requests(self):
+        # Flag requests with an N+1 finding without loading the findings
+        n_plus_one = SonarData.objects.filter(sonar_request=OuterRef('uuid'), category='n_plus_one')
+        return SonarRequest.objects.annotate(has_n_plus_one=Exists(n_plus_one)).order_by('-created_at')
+
+    def entries(self):
+        # Entries of one request share its created_at: the primary key keeps their capture order
+        return SonarData.objects.order_by('-created_at', '-pk')
+
+    def mark_read(self, sonar_request):
+        sonar_request.is_read = True
+        sonar_request.save()
+
+    def prune(self, before):
+        return RetentionPruner(policy={}, now=before).prune_requests(0)
+
+    def clear(self):
+        # Query statistics, rollups and sampling counters outlive the raw data
+        flush_sonar_tables(RAW_MODELS)
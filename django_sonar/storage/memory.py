@@ -0,0 +1,258 @@
+"""
+In-memory storage: the last captured requests in a process-local ring buffer.
+
+Meant for local development and test runs: captured requests cost no
+database write and need no migration. The buffer keeps at most
+``memory_max_requests`` requests and ``memory_max_bytes`` of encoded
+entries; the oldest requests are evicted first, one O(1) deque pop each.
+
+A request is a slotted record holding its columns as a tuple and its
+entries encoded like in segment files (see ``storage.segments``), decoded
+only when the dashboard shows them. Each process has its own buffer: the dashboard
+only sees the requests captured by the process serving it (e.g.
+``runserver``). Like the segment storage, the database aggregates (query
+statistics, route rollups, tail sampling counters) are not maintained.
+
+Settings (all optional):
+- memory_max_requests: requests kept (default 1000)
+- memory_max_bytes: encoded bytes kept (default 32 MiB)
+"""
+
+import threading
+import uuid
+from collections import deque
+
+from django_sonar.core.persistence import build_snapshot_rows
+from django_sonar.models import SonarData, SonarRequest
+from django_sonar.utils import get_sonar_settings
+from .base import SonarStorage
+from .records import RecordSet
+from .segments import (
+    CATEGORY_BITS,
+    REQUEST_FIELDS,
+    build_entries,
+    decode_rows,
+    encode_rows,
+    get_category_bits,
+    get_rows_categories,
+    group_rows,
+)
+
+
+DEFAULT_MAX_REQUESTS = 1000
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# Rough size of a record and its request columns, besides the encoded entries
+RECORD_OVERHEAD = 512
+
+
+class MemoryRecord:
+    """One captured request: columns, entry categories and encoded entries"""
+
+    __slots__ = ('uuid', 'created_at', 'fields', 'categories', 'bodies', 'size', 'is_read')
+
+    def __init__(self, request_uuid, created_at, fields, rows):
+        """
+        Initialize a record.
+
+        :param request_uuid: UUID of the request
+        :param created_at: Creation datetime, ordering the buffer
+        :param fields: Tuple of SonarRequest column values, or None for entries saved without their request
+        :param rows: List of (category, created_at, data) entries
+        """
+        self.uuid = request_uuid
+        self.created_at = created_at
+        self.fields = fields
+        self.categories = 0
+        self.bodies = ()
+        self.size = RECORD_OVERHEAD
+        self.is_read = False
+        self.add_rows(rows)
+
+    def add_rows(self, rows):
+        if not rows:
+            return
+        body = encode_rows(rows)
+        self.bodies += (body,)
+        self.categories |= get_rows_categories(rows)
+        self.size += len(body)
+
+
+class MemoryStorage(SonarStorage):
+    """Keep the last captured requests in a bounded process-local buffer"""
+
+    def __init__(self, max_requests=DEFAULT_MAX_REQUESTS, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initialize an empty buffer.
+
+        :param max_requests: Requests kept
+        :param max_bytes: Encoded bytes kept
+        """
+        self.max_requests = max(1, int(max_requests))
+        self.max_bytes = max(1, int(max_bytes))
+        self.size = 0
+        self.evicted = 0
+        # Oldest record first, and the same records by UUID
+        self._records = deque()
+        self._by_uuid = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_options(cls):
+        sonar_settings = get_sonar_settings()
+        return {
+            'max_requests': int(sonar_settings.get('memory_max_requests', DEFAULT_MAX_REQUESTS)),
+            'max_bytes': int(sonar_settings.get('memory_max_bytes', DEFAULT_MAX_BYTES)),
+        }
+
+    def __len__(self):
+        return len(self._records)
+
+    #
+    # Writing
+    #
+
+    def save_snapshots(self, snapshots):
+        sonar_requests, entries, blobs = build_snapshot_rows(snapshots)
+        rows = group_rows(entries, blobs)
+        with self._lock:
+            for sonar_request in sonar_requests:
+                self._add_request(sonar_request, rows.pop(sonar_request.uuid, []))
+
+    def save_entries(self, entries, blobs=None, sonar_request=None, batch_size=None):
+        rows = group_rows(entries, blobs)
+        with self._lock:
+            if sonar_request is not None:
+                self._add_request(sonar_request, rows.pop(sonar_request.uuid, []))
+            for request_uuid, request_rows in rows.items():
+                if not isinstance(request_uuid, uuid.UUID):
+                    request_uuid = uuid.UUID(str(request_uuid))
+                record = self._by_uuid.get(request_uuid)
+                if record is None:
+                    self._push(MemoryRecord(request_uuid, request_rows[0][1], None, request_rows))
+                else:
+                    # Entries saved one by one join the record of their request
+                    self.size -= record.size
+                    record.add_rows(request_rows)
+                    self.size += record.size
+                    self._evict()
+
+    def _add_request(self, sonar_request, rows):
+        fields = tuple(field.value_from_object(sonar_request) for field in REQUEST_FIELDS.values())
+        record = self._by_uuid.get(sonar_request.uuid)
+        if record is not None and record.fields is None:
+            # The entries were saved before their request
+            record.fields = fields
+            self.size -= record.size
+            record.add_rows(rows)
+            self.size += record.size
+            self._evict()
+            return
+        self._push(MemoryRecord(sonar_request.uuid, sonar_request.created_at, fields, rows))
+
+    def _push(self, record):
+        if record.size > self.max_bytes:
+            # Would evict the whole buffer on its own
+            self.evicted += 1
+            return
+        self._records.append(record)
+        self._by_uuid[record.uuid] = record
+        self.size += record.size
+        self._evict()
+
+    def _evict(self):
+        while len(self._records) > self.max_requests or self.size > self.max_bytes:
+            record = self._records.popleft()
+            self.size -= record.size
+            self.evicted += 1
+            if self._by_uuid.get(record.uuid) is record:
+                del self._by_uuid[record.uuid]
+
+    #
+    # Reading
+    #
+
+    def requests(self):
+        return RecordSet(self, SonarRequest)
+
+    def entries(self):
+        return RecordSet(self, SonarData)
+
+    def mark_read(self, sonar_request):
+        sonar_request.is_read = True
+        record = self._by_uuid.get(sonar_request.uuid)
+        if record is not None:
+            record.is_read = True
+
+    def _select(self, model, lookups, descending):
+        uuid_field = 'uuid' if model is SonarRequest else 'sonar_request_id'
+        with self._lock:
+            for name, lookup, value in lookups:
+                if name == uuid_field and lookup == 'exact':
+                    record = self._by_uuid.get(value)
+                    records = [record] if record is not None else []
+                    break
+            else:
+                records = list(self._records)
+
+        if model is SonarRequest:
+            records = [record for record in records if record.fields is not None]
+        for name, lookup, value in lookups:
+            if name == 'category' and lookup in ('exact', 'in'):
+                categories = 0
+                for category in (value if lookup == 'in' else [value]):
+                    categories |= get_category_bits(category)
+                records = [record for record in records if record.categories & categories]
+        # Stable: records of the same instant keep their capture order
+        records.sort(key=lambda record: record.created_at, reverse=descending)
+        return records
+
+    def count_records(self, model, lookups):
+        if model is SonarRequest and not lookups:
+            with self._lock:
+                return sum(1 for record in self._records if record.fields is not None)
+        return None
+
+    def scan(self, model, lookups, descending=True):
+        """
+        Yield the instances of the buffered records matching the lookups on UUID and category.
+
+        :param model: SonarRequest or SonarData
+        :param lookups: Tuple of records.Lookup
+        :param descending: Newest records first
+        """
+        for record in self._select(model, lookups, descending):
+            if model is SonarRequest:
+                yield self._build_request(record)
+            else:
+                # Newest first like the database ordering (-created_at, -pk)
+                for body in (record.bodies[::-1] if descending else record.bodies):
+                    rows = decode_rows(body)
+                    yield from build_entries(record.uuid, rows[::-1] if descending else rows)
+
+    def _build_request(self, record):
+        sonar_request = SonarRequest(**dict(zip(REQUEST_FIELDS, record.fields)))
+        sonar_request._state.adding = False
+        sonar_request.is_read = record.is_read
+        sonar_request.has_n_plus_one = bool(record.categories & CATEGORY_BITS['n_plus_one'])
+        return sonar_request
+
+    #
+    # Retention
+    #
+
+    def prune(self, before):
+        with self._lock:
+            kept = deque(record for record in self._records if record.created_at >= before)
+            pruned = [record for record in self._records if record.created_at < before]
+            self._records = kept
+            self._by_uuid = {record.uuid: record for record in kept}
+            freed = sum(record.size for record in pruned)
+            self.size -= freed
+        return {'rows': sum(1 for record in pruned if record.fields is not None), 'bytes': freed}
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._by_uuid.clear()
+            self.size = 0
@@ -0,0 +1,207 @@
+"""
+QuerySet-like collections of the storage backends that do not use the database.
+
+A RecordSet holds keyword lookups and an ordering, and asks its backend for
+candidate instances when evaluated. Backends may use the lookups to skip
+records early (e.g. from an index); every lookup is checked again on the
+built instances, so skipping is only an optimization.
+"""
+
+import operator
+from collections import namedtuple
+from itertools import islice
+
+from django.core.exceptions import FieldDoesNotExist
+
+
+Lookup = namedtuple('Lookup', ['name', 'lookup', 'value'])
+
+
+def _icontains(value, needle):
+    return needle.lower() in str(value or '').lower()
+
+
+def _in(value, values):
+    return value in values
+
+
+LOOKUPS = {
+    'exact': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'in': _in,
+    'icontains': _icontains,
+}
+
+# Attributes filtered on besides the model fields, with their type
+EXTRA_ATTRIBUTES = {
+    'has_n_plus_one': bool,
+}
+
+
+def _compare(lookup, value, expected):
+    if value is None and lookup != 'exact':
+        return False
+    return LOOKUPS[lookup](value, expected)
+
+
+class RecordSet:
+    """Lazy, immutable subset of the QuerySet API over a storage backend"""
+
+    # Paginator warns about unordered object lists
+    ordered = True
+
+    def __init__(self, storage, model, lookups=(), ordering=('-created_at',), empty=False):
+        """
+        Initialize the collection.
+
+        :param storage: Backend implementing ``scan(model, lookups, descending)``
+            and ``count_records(model, lookups)``
+        :param model: SonarRequest or SonarData
+        :param lookups: Tuple of Lookup
+        :param ordering: Field names, '-' prefixed for descending order
+        :param empty: Whether the collection is known to be empty
+        """
+        self.storage = storage
+        self.model = model
+        self.lookups = tuple(lookups)
+        self.ordering = tuple(ordering)
+        self.empty = empty
+        self._result_cache = None
+
+    def _clone(self, **kwargs):
+        options = {
+            'lookups': self.lookups,
+            'ordering': self.ordering,
+            'empty': self.empty,
+        }
+        options.update(kwargs)
+        return RecordSet(self.storage, self.model, **options)
+
+    def _parse_lookup(self, key, value):
+        name, _, lookup = key.partition('__')
+        lookup = lookup or 'exact'
+        if lookup not in LOOKUPS:
+            raise NotImplementedError(f'Lookup "{key}" is not supported by this Sonar storage.')
+
+        if name in EXTRA_ATTRIBUTES:
+            to_python = EXTRA_ATTRIBUTES[name]
+        else:
+            if name == 'pk':
+                name = self.model._meta.pk.name
+            try:
+                field = self.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise NotImplementedError(f'Filtering on "{key}" is not supported by this Sonar storage.') from None
+            name = field.attname
+            to_python = field.to_python
+
+        if lookup == 'in':
+            value = frozenset(to_python(item) for item in value)
+        elif lookup == 'icontains':
+            value = str(value)
+        else:
+            value = to_python(value)
+        return Lookup(name, lookup, value)
+
+    def filter(self, **kwargs):
+        lookups = [self._parse_lookup(key, value) for key, value in kwargs.items()]
+        return self._clone(lookups=self.lookups + tuple(lookups))
+
+    def all(self):
+        return self._clone()
+
+    def none(self):
+        return self._clone(empty=True)
+
+    def order_by(self, *fields):
+        return self._clone(ordering=fields)
+
+    def matches(self, instance):
+        return all(
+            _compare(lookup.lookup, getattr(instance, lookup.name, None), lookup.value)
+            for lookup in self.lookups
+        )
+
+    def _sort_fields(self):
+        # The backends yield records by creation date: only other fields need sorting
+        return [field for field in self.ordering if field.lstrip('-') not in ('created_at', 'pk', 'id')]
+
+    def _iterate(self):
+        if self.empty:
+            return
+        descending = not self.ordering or self.ordering[0] != 'created_at'
+        instances = self.storage.scan(self.model, self.lookups, descending)
+        try:
+            for instance in instances:
+                if self.matches(instance):
+                    yield instance
+        finally:
+            instances.close()
+
+    def _fetch(self, limit=None):
+        if self._result_cache is not None:
+            return self._result_cache[:limit]
+        sort_fields = self._sort_fields()
+        if sort_fields:
+            results = list(self._iterate())
+            for field in reversed(sort_fields):
+                results.sort(key=operator.attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+            self._result_cache = results
+            return results[:limit]
+
+        iterator = self._iterate()
+        try:
+            results = list(islice(iterator, limit))
+        finally:
+            iterator.close()
+        if limit is None:
+            self._result_cache = results
+        return results
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def __len__(self):
+        return len(self._fetch())
+
+    def __bool__(self):
+        return self.exists()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if (key.start or 0) < 0 or (key.stop or 0) < 0 or key.step not in (None, 1):
+                raise ValueError('Negative indexing and steps are not supported.')
+            return self._fetch(key.stop)[key.start:]
+        results = self._fetch(key + 1)
+        if len(results) <= key:
+            raise IndexError('RecordSet index out of range')
+        return results[key]
+
+    def count(self):
+        if self.empty:
+            return 0
+        if self._result_cache is None:
+            count = self.storage.count_records(self.model, self.lookups)
+            if count is not None:
+                return count
+        return len(self._fetch())
+
+    def exists(self):
+        return bool(self._fetch(1))
+
+    def first(self):
+        results = self._fetch(1)
+        return results[0] if results else None
+
+    def get(self, **kwargs):
+        results = self.filter(**kwargs)._fetch(2)
+        if not results:
+            raise self.model.DoesNotExist(f'{self.model._meta.object_name} matching query does not exist.')
+        if len(results) > 1:
+            raise self.model.MultipleObjectsReturned(
+                f'get() returned more than one {self.model._meta.object_name}.'
+            )
+        return results[0]
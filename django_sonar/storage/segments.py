@@ -0,0 +1,538 @@
+"""
+Segment-file storage: captured requests appended to local files.
+
+Every process appends to its own segment file in ``segment_dir``, named
+``{creation ms}-{sequence}-{hostname}-{pid}.seg``, and starts a new one once
+it reaches ``segment_max_bytes``. A record holds one request with all its
+SonarData entries; it is prefixed with its length, so a segment can be read
+sequentially without anything else. Next to every segment a ``.idx``
+sidecar holds a fixed-size entry per record: creation timestamp, offset and
+length in the segment, request UUID, kind, status and a bitmask of the
+categories of its entries. Both files are only ever appended to.
+
+The dashboard reads the indexes (incrementally, caching what was already
+read), selects records by UUID, date, status or category from them, and
+only decodes the selected records from memory-mapped segments. A record
+starts with the request columns, so listing requests never decodes the
+entries. Entries are compressed like SonarData payloads (see
+``django_sonar.compression``); deduplicated payloads are stored inline.
+
+No database write happens: query statistics, route rollups and tail
+sampling counters, which are maintained in the database, are not updated,
+and requests are marked as read in the dashboard process only. Retention
+prunes whole segments whose newest record is older than the 'requests'
+retention.
+
+Settings (all optional):
+- segment_dir: directory of the segment files (default 'django-sonar' in
+  the temporary directory); share it between the workers and the dashboard
+- segment_max_bytes: size of a segment before rotating (default 64 MiB)
+"""
+
+import glob
+import json
+import mmap
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from django_sonar.compression import decompress_payload, encode_payload
+from django_sonar.core.persistence import build_snapshot_rows
+from django_sonar.models import SonarData, SonarRequest
+from django_sonar.utils import get_sonar_settings
+from .base import SonarStorage
+from .records import RecordSet
+
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+
+# Record: length, then head length, head JSON (request columns) and entries body
+RECORD_HEADER = struct.Struct('>I')
+HEAD_HEADER = struct.Struct('>I')
+JSON_MARKER = b'j'
+
+# Index entry: created_at timestamp, offset, length, UUID, kind, status, categories
+INDEX_ENTRY = struct.Struct('>dQI16sBHI')
+TIMESTAMP, OFFSET, LENGTH, UUID, KIND, STATUS, CATEGORIES = range(7)
+
+# A request with its entries, or entries saved without their request
+KIND_REQUEST = 1
+KIND_ENTRIES = 2
+
+CATEGORY_BITS = {
+    category: 1 << bit
+    for bit, category in enumerate((
+        'details', 'payload', 'queries', 'n_plus_one', 'headers',
+        'session', 'events', 'logs', 'dumps', 'exception',
+    ))
+}
+OTHER_CATEGORIES = 1 << 31
+
+REQUEST_FIELDS = {field.attname: field for field in SonarRequest._meta.concrete_fields if field.name != 'is_read'}
+
+
+class SegmentJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder keeping the microseconds of datetimes"""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _dumps(value):
+    return json.dumps(value, cls=SegmentJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def get_category_bits(category):
+    return CATEGORY_BITS.get(category, OTHER_CATEGORIES)
+
+
+def get_status_code(status):
+    status = str(status)
+    return int(status) if status.isdigit() and int(status) <= 0xFFFF else 0
+
+
+def group_rows(entries, blobs=None):
+    """
+    Group unsaved SonarData entries per request, resolving deduplicated payloads.
+
+    :param entries: List of SonarData instances built by a DataCollector
+    :param blobs: Dictionary {hash: SonarBlob} referenced by the entries
+    :return: Dictionary {request UUID: [(category, created_at, data)]}
+    """
+    rows = {}
+    for entry in entries:
+        # The raw value: the descriptor would look deduplicated payloads up in the database
+        data = entry.__dict__.get('data')
+        if data is None and entry.blob_id is not None:
+            blob = (blobs or {}).get(entry.blob_id)
+            data = blob.data if blob is not None else None
+        rows.setdefault(entry.sonar_request_id, []).append((entry.category, entry.created_at, data))
+    return rows
+
+
+def get_rows_categories(rows):
+    categories = 0
+    for category, _created_at, _data in rows:
+        categories |= get_category_bits(category)
+    return categories
+
+
+def encode_rows(rows):
+    """
+    Encode entries, compressed like SonarData payloads when compression applies.
+
+    :param rows: List of (category, created_at datetime, data) entries
+    :return: bytes
+    """
+    rows = [[category, created_at.isoformat(), data] for category, created_at, data in rows]
+    body = encode_payload(rows)
+    return body if body is not None else JSON_MARKER + _dumps(rows)
+
+
+def decode_rows(body):
+    """
+    Decode entries encoded by encode_rows().
+
+    :return: List of [category, created_at ISO string, data] entries
+    """
+    if body[:1] == JSON_MARKER:
+        return json.loads(body[1:])
+    return decompress_payload(body)
+
+
+def build_entries(request_uuid, rows):
+    """Build unsaved SonarData instances from decoded entries."""
+    created_at_field = SonarData._meta.get_field('created_at')
+    for category, created_at, data in rows:
+        yield SonarData(
+            sonar_request_id=request_uuid,
+            category=category,
+            data=data,
+            created_at=created_at_field.to_python(created_at),
+        )
+
+
+def encode_record(head, rows):
+    """
+    Encode a record body.
+
+    :param head: Dictionary of request columns (at least uuid and created_at)
+    :param rows: List of (category, created_at datetime, data) entries
+    :return: bytes
+    """
+    head = _dumps(head)
+    return HEAD_HEADER.pack(len(head)) + head + encode_rows(rows)
+
+
+def decode_head(record):
+    (length,) = HEAD_HEADER.unpack_from(record)
+    return json.loads(record[HEAD_HEADER.size:HEAD_HEADER.size + length])
+
+
+def decode_record_rows(record):
+    (length,) = HEAD_HEADER.unpack_from(record)
+    return decode_rows(record[HEAD_HEADER.size + length:])
+
+
+class SegmentReader:
+    """Memory-mapped segments opened during one read, closed together"""
+
+    def __init__(self):
+        self._maps = {}
+
+    def read(self, path, offset, length):
+        """
+        Read a record.
+
+        :return: bytes, or None when the segment was deleted or the record is not written yet
+        """
+        if path not in self._maps:
+            try:
+                with open(path, 'rb') as segment:
+                    size = os.fstat(segment.fileno()).st_size
+                    self._maps[path] = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            except FileNotFoundError:
+                self._maps[path] = None
+        mapped = self._maps[path]
+        if mapped is None or offset + length > len(mapped):
+            return None
+        return mapped[offset:offset + length]
+
+    def close(self):
+        for mapped in self._maps.values():
+            if mapped is not None:
+                mapped.close()
+        self._maps.clear()
+
+
+class SegmentStorage(SonarStorage):
+    """Append captured requests to local segment files"""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initialize the storage. Files are created on the first write.
+
+        :param directory: Directory of the segment files
+        :param max_bytes: Size of a segment before rotating
+        """
+        self.directory = directory
+        self.max_bytes = max(1, int(max_bytes))
+        self._path = None
+        self._data_file = None
+        self._index_file = None
+        self._sequence = 0
+        self._write_lock = threading.Lock()
+        # {segment path: (bytes of the index read, [index entries])}
+        self._indexes = {}
+        self._index_lock = threading.Lock()
+        self._read = set()
+
+    @classmethod
+    def get_options(cls):
+        sonar_settings = get_sonar_settings()
+        return {
+            'directory': sonar_settings.get('segment_dir') or os.path.join(tempfile.gettempdir(), 'django-sonar'),
+            'max_bytes': int(sonar_settings.get('segment_max_bytes', DEFAULT_MAX_BYTES)),
+        }
+
+    def close(self):
+        with self._write_lock:
+            self._close_segment()
+
+    #
+    # Writing
+    #
+
+    def save_snapshots(self, snapshots):
+        sonar_requests, entries, blobs = build_snapshot_rows(snapshots)
+        rows = group_rows(entries, blobs)
+        self._append([self._build_request_record(request, rows.pop(request.uuid, [])) for request in sonar_requests])
+
+    def save_entries(self, entries, blobs=None, sonar_request=None, batch_size=None):
+        rows = group_rows(entries, blobs)
+        records = []
+        if sonar_request is not None:
+            records.append(self._build_request_record(sonar_request, rows.pop(sonar_request.uuid, [])))
+        for request_uuid, request_rows in rows.items():
+            records.append(self._build_record(
+                KIND_ENTRIES, {'uuid': request_uuid, 'created_at': request_rows[0][1]}, request_rows, 0
+            ))
+        self._append(records)
+
+    def _build_request_record(self, sonar_request, rows):
+        head = {name: field.value_from_object(sonar_request) for name, field in REQUEST_FIELDS.items()}
+        return self._build_record(KIND_REQUEST, head, rows, get_status_code(sonar_request.status))
+
+    def _build_record(self, kind, head, rows, status):
+        categories = get_rows_categories(rows)
+        request_uuid = head['uuid'] if isinstance(head['uuid'], uuid.UUID) else uuid.UUID(str(head['uuid']))
+        meta = (head['created_at'].timestamp(), request_uuid.bytes, kind, status, categories)
+        return encode_record(head, rows), meta
+
+    def _append(self, records):
+        if not records:
+            return
+        with self._write_lock:
+            index = []
+            for record, (timestamp, request_uuid, kind, status, categories) in records:
+                size = RECORD_HEADER.size + len(record)
+                position = self._data_file.tell() if self._data_file is not None else 0
+                if self._data_file is None or (position and position + size > self.max_bytes):
+                    self._write_index(index)
+                    self._open_segment()
+                    position = 0
+                self._data_file.write(RECORD_HEADER.pack(len(record)) + record)
+                index.append(INDEX_ENTRY.pack(
+                    timestamp, position + RECORD_HEADER.size, len(record), request_uuid, kind, status, categories
+                ))
+            self._write_index(index)
+
+    def _write_index(self, index):
+        # Records are written before their index entries: readers never see a dangling entry
+        if self._data_file is None or not index:
+            return
+        self._data_file.flush()
+        self._index_file.write(b''.join(index))
+        self._index_file.flush()
+        index.clear()
+
+    def _open_segment(self):
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        name = f'{time.time_ns() // 1000000:013d}-{self._sequence:06d}-{socket.gethostname()}-{os.getpid()}'
+        self._path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        self._data_file = open(self._path, 'ab')
+        self._index_file = open(self._get_index_path(self._path), 'ab')
+
+    def _close_segment(self):
+        for file in (self._data_file, self._index_file):
+            if file is not None:
+                file.close()
+        self._path = self._data_file = self._index_file = None
+
+    #
+    # Reading
+    #
+
+    def requests(self):
+        return RecordSet(self, SonarRequest)
+
+    def entries(self):
+        return RecordSet(self, SonarData)
+
+    def mark_read(self, sonar_request):
+        # Segments are append-only: read flags live in this process
+        self._read.add(sonar_request.uuid)
+        sonar_request.is_read = True
+
+    def get_segments(self):
+        """Return the segment paths, oldest first."""
+        return sorted(glob.glob(os.path.join(glob.escape(self.directory), '*' + SEGMENT_SUFFIX)))
+
+    def _get_index_path(self, path):
+        return path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+
+    def get_index(self, path):
+        """
+        Read the index entries of a segment, only reading what was appended since the last call.
+
+        Segments without a sidecar index are scanned instead.
+
+        :param path: Segment path
+        :return: List of index entry tuples
+        """
+        index_path = self._get_index_path(path)
+        try:
+            size = os.path.getsize(index_path)
+        except FileNotFoundError:
+            return self._scan_segment(path)
+        # A concurrent writer may be halfway through an entry
+        size -= size % INDEX_ENTRY.size
+
+        with self._index_lock:
+            read, entries = self._indexes.get(path, (0, []))
+            if size > read:
+                with open(index_path, 'rb') as index_file:
+                    with mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        entries = entries + list(INDEX_ENTRY.iter_unpack(mapped[read:size]))
+                self._indexes[path] = (size, entries)
+            return entries
+
+    def _scan_segment(self, path):
+        # Rebuild the index entries from the length prefixes of the records
+        entries = []
+        reader = SegmentReader()
+        try:
+            offset = 0
+            while True:
+                header = reader.read(path, offset, RECORD_HEADER.size)
+                if header is None:
+                    break
+                (length,) = RECORD_HEADER.unpack(header)
+                offset += RECORD_HEADER.size
+                record = reader.read(path, offset, length)
+                if record is None:
+                    break
+                head = decode_head(record)
+                kind = KIND_REQUEST if 'verb' in head else KIND_ENTRIES
+                categories = get_rows_categories(decode_record_rows(record))
+                created_at = SonarRequest._meta.get_field('created_at').to_python(head['created_at'])
+                entries.append((
+                    created_at.timestamp(), offset, length, uuid.UUID(head['uuid']).bytes, kind,
+                    get_status_code(head.get('status', 0)), categories,
+                ))
+                offset += length
+        finally:
+            reader.close()
+        return entries
+
+    def _get_index_filter(self, model, lookups):
+        """
+        Build a predicate on index entries from the lookups it can decide.
+
+        :return: Tuple (predicate, whether every lookup was decided by the index)
+        """
+        checks = []
+        exact = True
+        uuid_field = 'uuid' if model is SonarRequest else 'sonar_request_id'
+        for name, lookup, value in lookups:
+            if name == uuid_field and lookup == 'exact':
+                checks.append(lambda entry, value=value.bytes: entry[UUID] == value)
+            elif name == uuid_field and lookup == 'in':
+                checks.append(lambda entry, values={item.bytes for item in value}: entry[UUID] in values)
+            elif name == 'created_at' and lookup in ('gt', 'gte', 'lt', 'lte'):
+                compare = {'gt': float.__gt__, 'gte': float.__ge__, 'lt': float.__lt__, 'lte': float.__le__}[lookup]
+                checks.append(lambda entry, compare=compare, value=value.timestamp(): compare(entry[TIMESTAMP], value))
+            elif name == 'status' and lookup == 'exact' and model is SonarRequest and get_status_code(value):
+                checks.append(lambda entry, value=get_status_code(value): entry[STATUS] == value)
+            elif name == 'has_n_plus_one' and model is SonarRequest:
+                bits = CATEGORY_BITS['n_plus_one']
+                checks.append(lambda entry, value=value: bool(entry[CATEGORIES] & bits) == value)
+            elif name == 'category' and lookup in ('exact', 'in'):
+                exact = False
+                bits = 0
+                for category in (value if lookup == 'in' else [value]):
+                    bits |= get_category_bits(category)
+                checks.append(lambda entry, bits=bits: entry[CATEGORIES] & bits)
+            else:
+                exact = False
+
+        kinds = (KIND_REQUEST,) if model is SonarRequest else (KIND_REQUEST, KIND_ENTRIES)
+        if model is SonarData:
+            exact = False
+
+        def predicate(entry):
+            return entry[KIND] in kinds and all(check(entry) for check in checks)
+        return predicate, exact
+
+    def _select(self, model, lookups, descending):
+        predicate, _exact = self._get_index_filter(model, lookups)
+        selected = [
+            (entry, path)
+            for path in self.get_segments()
+            for entry in self.get_index(path)
+            if predicate(entry)
+        ]
+        # Stable: records of the same instant keep their append order
+        selected.sort(key=lambda item: item[0][TIMESTAMP], reverse=descending)
+        return selected
+
+    def count_records(self, model, lookups):
+        predicate, exact = self._get_index_filter(model, lookups)
+        if not exact:
+            return None
+        return sum(1 for path in self.get_segments() for entry in self.get_index(path) if predicate(entry))
+
+    def scan(self, model, lookups, descending=True):
+        """
+        Yield the instances of the records the index selects.
+
+        :param model: SonarRequest or SonarData
+        :param lookups: Tuple of records.Lookup
+        :param descending: Newest records first
+        """
+        selected = self._select(model, lookups, descending)
+        reader = SegmentReader()
+        try:
+            for entry, path in selected:
+                record = reader.read(path, entry[OFFSET], entry[LENGTH])
+                if record is None:
+                    continue
+                if model is SonarRequest:
+                    yield self._build_request(decode_head(record), entry)
+                else:
+                    rows = decode_record_rows(record)
+                    # Newest first like the database ordering (-created_at, -pk)
+                    yield from build_entries(uuid.UUID(bytes=entry[UUID]), rows[::-1] if descending else rows)
+        finally:
+            reader.close()
+
+    def _build_request(self, head, entry):
+        sonar_request = SonarRequest(**{
+            name: REQUEST_FIELDS[name].to_python(value) for name, value in head.items() if name in REQUEST_FIELDS
+        })
+        sonar_request._state.adding = False
+        sonar_request.is_read = sonar_request.uuid in self._read
+        sonar_request.has_n_plus_one = bool(entry[CATEGORIES] & CATEGORY_BITS['n_plus_one'])
+        return sonar_request
+
+    #
+    # Retention
+    #
+
+    def prune(self, before):
+        """
+        Delete the segments whose every record is older than a date.
+
+        The segment being written by this process is kept, and so are
+        segments modified after the cutoff (being written by another process).
+        """
+        cutoff = before.timestamp()
+        with self._write_lock:
+            current = self._path
+        result = {'rows': 0, 'bytes': 0}
+        for path in self.get_segments():
+            if path == current:
+                continue
+            entries = self.get_index(path)
+            newest = max((entry[TIMESTAMP] for entry in entries), default=0)
+            try:
+                if newest >= cutoff or os.path.getmtime(path) >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            result['rows'] += sum(1 for entry in entries if entry[KIND] == KIND_REQUEST)
+            result['bytes'] += self._remove_segment(path)
+        return result
+
+    def clear(self):
+        with self._write_lock:
+            self._close_segment()
+            for path in self.get_segments():
+                self._remove_segment(path)
+        self._read.clear()
+
+    def _remove_segment(self, path):
+        removed = 0
+        for file_path in (path, self._get_index_path(path)):
+            try:
+                removed += os.path.getsize(file_path)
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+        with self._index_lock:
+            self._indexes.pop(path, None)
+        return removed
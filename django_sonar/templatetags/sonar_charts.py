@@ -0,0 +1,31 @@
+from django import template
+from django.utils.html import format_html
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def sonar_sparkline(values, width=120, height=24, title=''):
+    """
+    Render a series of numbers as an inline SVG sparkline.
+
+    :param values: Sequence of numbers, None for missing points (drawn as 0)
+    :param width: Width in pixels
+    :param height: Height in pixels
+    :param title: Tooltip of the chart
+    """
+    values = [value or 0 for value in values]
+    if not values:
+        return ''
+    peak = max(values) or 1
+    step = width / max(len(values) - 1, 1)
+    points = ' '.join(
+        f'{index * step:.1f},{height - 1 - value / peak * (height - 2):.1f}' for index, value in enumerate(values)
+    )
+    return format_html(
+        '<svg class="sonar-sparkline" width="{}" height="{}" viewBox="0 0 {} {}" role="img">'
+        '<title>{}</title>'
+        '<polyline points="{}" fill="none" stroke="currentColor" stroke-width="1.5"/></svg>',
+        width, height, width, height, title, points,
+    )
@@ -10,11 +10,46 @@ from .test_middleware_requests import MiddlewareRequestTypesTestCase
 from .test_middleware_data_capture import MiddlewareDataCaptureTestCase
 from .test_middleware_exclusions import MiddlewareExclusionsTestCase
 from .test_middleware_helpers import MiddlewareHelpersTestCase
+from .test_middleware_async import MiddlewareAsyncTestCase
 
 # Core module tests
 from .test_core_parsers import RequestParserTestCase
 from .test_core_filters import PathFilterTestCase
-from .test_core_collectors import DataCollectorTestCase
+from .test_core_collectors import DataCollectorTestCase, BatchDataCollectorTestCase
+from .test_core_writer import SonarWriterTestCase
+from .test_core_sampling import RequestSamplerTestCase, TailSamplerTestCase
+from .test_core_profiling import MemoryProfilerTestCase
+from .test_core_queries import QueryCaptureTestCase
+from .test_core_fingerprints import FingerprintTestCase, NPlusOneTestCase
+from .test_core_sketches import LatencySketchTestCase
+from .test_core_query_stats import QueryStatsTestCase
+from .test_core_explain import ExplainTestCase
+from .test_core_callsite import CallSiteTestCase
+from .test_core_retention import RetentionPrunerTestCase, PruneCommandTestCase, RetentionSchedulerTestCase
+from .test_core_partitions import PartitionsTestCase
+from .test_core_compression import CompressionCodecTestCase, CompressedSonarDataTestCase
+from .test_core_blobs import BlobDedupTestCase, DedupDisabledTestCase, BlobCacheTestCase
+from .test_core_rollups import (
+    RouteRollupTestCase,
+    RollupPercentilesTestCase,
+    RouteRollupMiddlewareTestCase,
+    EndpointsPanelTestCase,
+    RequestsPanelPercentileTestCase,
+)
+from .test_core_exports import ExportTestCase
+from .test_core_imports import ImportTestCase
+from .test_core_parquet import ParquetExportTestCase, ParquetMissingTestCase
+from .test_core_clear import (
+    SonarCleanerTestCase,
+    SonarTablesTestCase,
+    ClearCommandTestCase,
+    ClearViewTestCase,
+    ClearMaintenanceTestCase,
+)
+
+# Storage tests
+from .test_storage_segments import SegmentStorageTestCase, SegmentStorageDashboardTestCase
+from .test_storage_memory import MemoryStorageTestCase, MemoryStorageDashboardTestCase
 
 __all__ = [
     # Middleware tests
@@ -23,8 +58,49 @@ __all__ = [
     'MiddlewareDataCaptureTestCase',
     'MiddlewareExclusionsTestCase',
     'MiddlewareHelpersTestCase',
+    'MiddlewareAsyncTestCase',
     # Core tests
     'RequestParserTestCase',
     'PathFilterTestCase',
     'DataCollectorTestCase',
+    'BatchDataCollectorTestCase',
+    'SonarWriterTestCase',
+    'RequestSamplerTestCase',
+    'TailSamplerTestCase',
+    'MemoryProfilerTestCase',
+    'QueryCaptureTestCase',
+    'FingerprintTestCase',
+    'NPlusOneTestCase',
+    'LatencySketchTestCase',
+    'QueryStatsTestCase',
+    'ExplainTestCase',
+    'CallSiteTestCase',
+    'RetentionPrunerTestCase',
+    'PruneCommandTestCase',
+    'RetentionSchedulerTestCase',
+    'PartitionsTestCase',
+    'CompressionCodecTestCase',
+    'CompressedSonarDataTestCase',
+    'BlobDedupTestCase',
+    'DedupDisabledTestCase',
+    'BlobCacheTestCase',
+    'RouteRollupTestCase',
+    'RollupPercentilesTestCase',
+    'RouteRollupMiddlewareTestCase',
+    'EndpointsPanelTestCase',
+    'RequestsPanelPercentileTestCase',
+    'ExportTestCase',
+    'ImportTestCase',
+    'ParquetExportTestCase',
+    'ParquetMissingTestCase',
+    'SonarCleanerTestCase',
+    'SonarTablesTestCase',
+    'ClearCommandTestCase',
+    'ClearViewTestCase',
+    'ClearMaintenanceTestCase',
+    # Storage tests
+    'SegmentStorageTestCase',
+    'SegmentStorageDashboardTestCase',
+    'MemoryStorageTestCase',
+    'MemoryStorageDashboardTestCase',
 ]
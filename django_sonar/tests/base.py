@@ -2,7 +2,9 @@
 Base test case with common setup and utilities for all test modules.
 """
 
+from contextlib import contextmanager
 from unittest.mock import Mock, patch, MagicMock
+from django.db import connections, router, transaction
 from django.test import TestCase, RequestFactory
 from django.contrib.auth import get_user_model
 from django.contrib.sessions.middleware import SessionMiddleware
@@ -10,6 +12,29 @@ from django.http import HttpResponse
 from django_sonar import utils
 
 
+@contextmanager
+def read_replica():
+    """
+    Route the reads to a 'replica' alias sharing the default connection.
+
+    Yields the aliases every transaction.atomic() block is opened on, so a
+    transaction opened on the read alias instead of the written one shows up.
+    """
+    connections['replica'] = connections['default']
+    aliases = []
+    real_atomic = transaction.atomic
+
+    def atomic(using=None, *args, **kwargs):
+        aliases.append(using)
+        return real_atomic(using, *args, **kwargs)
+
+    try:
+        with patch.object(router, 'db_for_read', return_value='replica'), patch.object(transaction, 'atomic', atomic):
+            yield aliases
+    finally:
+        del connections['replica']
+
+
 class BaseMiddlewareTestCase(TestCase):
     """Base test case with common setup for middleware tests"""
 
@@ -41,6 +66,7 @@ class BaseMiddlewareTestCase(TestCase):
         
         mock_resolved = MagicMock()
         mock_resolved.func = mock_func
+        mock_resolved.route = 'test/'
         
         self.mock_resolve.return_value = mock_resolved
 
@@ -0,0 +1,190 @@
+"""
+Tests for core.blobs module.
+
+Tests content-addressed deduplication of repeated payloads.
+"""
+
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_sonar.core import blobs
+from django_sonar.core.blobs import BlobCache, blob_cache, hash_payload
+from django_sonar.core.collectors import DataCollector
+from django_sonar.core.persistence import persist_snapshots
+from django_sonar.core.retention import RetentionPruner
+from django_sonar.models import SonarBlob, SonarData, SonarRequest
+
+
+def _make_snapshot(**overrides):
+    snapshot = {
+        'uuid': uuid.uuid4(),
+        'verb': 'GET',
+        'path': '/dedup/',
+        'status': 200,
+        'duration': 3,
+        'created_at': timezone.now(),
+        'user_info': None,
+        'view_func': 'test.views.dedup',
+        'middlewares_used': ['django.middleware.common.CommonMiddleware'] * 10,
+        'memory_used': None,
+        'get_payload': {},
+        'post_payload': {},
+        'queries': [],
+        'headers': {'Accept': '*/*', 'Host': 'example.com'},
+        'session': {},
+        'events': [],
+        'logs': [],
+        'dumps': [],
+        'exceptions': [],
+    }
+    snapshot.update(overrides)
+    return snapshot
+
+
+def _count_blob_inserts(captured):
+    return len([q for q in captured.captured_queries if q['sql'].startswith('INSERT') and 'sonar_blobs' in q['sql']])
+
+
+@override_settings(DJANGO_SONAR={'dedup': True})
+class BlobDedupTestCase(TestCase):
+    """Test that repeated payloads are stored once"""
+
+    def setUp(self):
+        blob_cache.clear()
+
+    def tearDown(self):
+        blob_cache.clear()
+        super().tearDown()
+
+    def test_hash_ignores_key_order(self):
+        """The hash should be computed on canonical JSON"""
+        self.assertEqual(hash_payload({'a': 1, 'b': 2}), hash_payload({'b': 2, 'a': 1}))
+        self.assertNotEqual(hash_payload({'a': 1})[0], hash_payload({'a': 2})[0])
+
+    def test_identical_payloads_share_one_blob(self):
+        """Requests with identical headers/details should reference the same blobs"""
+        persist_snapshots([_make_snapshot(), _make_snapshot()])
+
+        headers = SonarData.objects.filter(category='headers')
+        self.assertEqual(headers.count(), 2)
+        self.assertEqual(len({entry.blob_id for entry in headers}), 1)
+        self.assertEqual(list(headers.values_list('data', flat=True)), [None, None])
+        self.assertEqual(headers[0].data, {'request_headers': {'Accept': '*/*', 'Host': 'example.com'}})
+        # details, payload, headers and session
+        self.assertEqual(SonarBlob.objects.count(), 4)
+
+    def test_other_categories_stay_inline(self):
+        """Only the dedup categories should reference blobs"""
+        persist_snapshots([_make_snapshot(queries=[{'sql': 'SELECT 1', 'time': 0.1}])])
+
+        queries = SonarData.objects.get(category='queries')
+        self.assertIsNone(queries.blob_id)
+        self.assertEqual(queries.data['query_count'], 1)
+
+    def test_known_blobs_are_not_written_again(self):
+        """After a committed write the process should skip the blob INSERT"""
+        with self.captureOnCommitCallbacks(execute=True):
+            persist_snapshots([_make_snapshot()])
+
+        with CaptureQueriesContext(connection) as captured:
+            persist_snapshots([_make_snapshot()])
+
+        self.assertEqual(_count_blob_inserts(captured), 0)
+        self.assertEqual(SonarData.objects.filter(category='details').count(), 2)
+
+    def test_blobs_cleared_by_another_process_are_written_again(self):
+        """Remembered hashes whose blobs were deleted elsewhere should not leave dangling references"""
+        with self.captureOnCommitCallbacks(execute=True):
+            persist_snapshots([_make_snapshot()])
+        # Another process clears the tables: this process still remembers the hashes
+        SonarData.objects.all().delete()
+        SonarBlob.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as captured:
+            persist_snapshots([_make_snapshot()])
+
+        self.assertEqual(_count_blob_inserts(captured), 1)
+        self.assertEqual(SonarBlob.objects.count(), 4)
+        self.assertEqual(
+            SonarData.objects.get(category='headers').data,
+            {'request_headers': {'Accept': '*/*', 'Host': 'example.com'}},
+        )
+
+    def test_blob_cache_not_filled_without_commit(self):
+        """Hashes should only be remembered once their transaction commits"""
+        persist_snapshots([_make_snapshot()])
+
+        with CaptureQueriesContext(connection) as captured:
+            persist_snapshots([_make_snapshot()])
+
+        self.assertEqual(_count_blob_inserts(captured), 1)
+
+    def test_data_collector_save_entry(self):
+        """Entries written one by one should be deduplicated too"""
+        sonar_request = SonarRequest.objects.create(verb='GET', path='/', status='200', duration=1)
+        collector = DataCollector(sonar_request.uuid)
+
+        collector.save_headers({'Accept': '*/*'})
+        collector.save_headers({'Accept': '*/*'})
+
+        self.assertEqual(SonarBlob.objects.count(), 1)
+        self.assertEqual(SonarData.objects.filter(blob__isnull=False).count(), 2)
+
+    def test_missing_blob_reads_as_none(self):
+        """Rows whose blob was removed should not break the dashboard"""
+        persist_snapshots([_make_snapshot()])
+        SonarBlob.objects.all().delete()
+
+        self.assertIsNone(SonarData.objects.get(category='headers').data)
+
+    def test_orphan_blobs_are_pruned(self):
+        """Retention should delete old blobs without references only"""
+        persist_snapshots([_make_snapshot()])
+        orphan = SonarBlob.objects.create(hash='orphan', data={'a': 1}, size=7)
+        SonarBlob.objects.filter(pk=orphan.pk).update(created_at=timezone.now() - timedelta(days=1))
+        SonarBlob.objects.create(hash='young-orphan', data={'a': 2}, size=7)
+
+        result = RetentionPruner(policy={}, sleep=0).prune_orphan_blobs()
+
+        self.assertEqual(result, {'rows': 1, 'bytes': 7})
+        self.assertFalse(SonarBlob.objects.filter(hash='orphan').exists())
+        self.assertTrue(SonarBlob.objects.filter(hash='young-orphan').exists())
+        self.assertEqual(SonarBlob.objects.count(), 5)
+
+
+class DedupDisabledTestCase(TestCase):
+    """Test the default, non deduplicated storage"""
+
+    def test_dedup_is_opt_in(self):
+        """Without the setting payloads should stay inline"""
+        persist_snapshots([_make_snapshot()])
+
+        self.assertFalse(SonarBlob.objects.exists())
+        self.assertFalse(SonarData.objects.filter(blob__isnull=False).exists())
+
+
+class BlobCacheTestCase(TestCase):
+    """Test BlobCache bounds"""
+
+    def test_cache_is_bounded(self):
+        """The oldest hashes should be evicted beyond max_size"""
+        cache = BlobCache(max_size=2)
+        cache.add(['a', 'b', 'c'])
+
+        self.assertNotIn('a', cache)
+        self.assertIn('c', cache)
+
+    def test_cache_entries_expire(self):
+        """Hashes should not be trusted after the TTL"""
+        cache = BlobCache(ttl=10)
+        with patch.object(blobs.time, 'monotonic', return_value=100.0):
+            cache.add(['a'])
+        with patch.object(blobs.time, 'monotonic', return_value=105.0):
+            self.assertIn('a', cache)
+        with patch.object(blobs.time, 'monotonic', return_value=111.0):
+            self.assertNotIn('a', cache)
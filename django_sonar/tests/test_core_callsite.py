@@ -0,0 +1,92 @@
+"""
+Tests for core.callsite module.
+
+Tests project frame detection, caching and grouping by call site.
+"""
+
+import threading
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django_sonar.core import callsite, queries
+
+
+PROJECT_FILE = '/srv/project/services/billing.py'
+
+PROJECT_SOURCE = '''
+def charge(lookup):
+    return lookup()
+'''
+
+
+def _project_function(name):
+    namespace = {}
+    exec(compile(PROJECT_SOURCE, PROJECT_FILE, 'exec'), namespace)
+    return namespace[name]
+
+
+class CallSiteTestCase(TestCase):
+    """Test call-site attribution"""
+
+    def tearDown(self):
+        queries.stop_query_capture()
+        super().tearDown()
+
+    def test_first_project_frame_is_returned(self):
+        """Library and DjangoSonar frames should be skipped"""
+        charge = _project_function('charge')
+
+        call_site = charge(callsite.get_call_site)
+
+        self.assertEqual(call_site, f'{PROJECT_FILE}:3 in charge')
+
+    def test_no_project_frame(self):
+        """Only library frames should give no call site"""
+        results = []
+        thread = threading.Thread(target=lambda: results.append(callsite.get_call_site()))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(results, [None])
+
+    def test_decision_is_cached_per_code_object(self):
+        """The project/library decision should be computed once per code object"""
+        charge = _project_function('charge')
+        charge(callsite.get_call_site)
+
+        self.assertIn(charge.__code__, callsite._code_cache)
+        self.assertEqual(callsite._code_cache[charge.__code__], PROJECT_FILE)
+
+    def test_queries_are_annotated(self):
+        """Captured queries should carry the call site of the project code"""
+        charge = _project_function('charge')
+
+        queries.start_query_capture()
+        charge(lambda: get_user_model().objects.count())
+        buffer = queries.stop_query_capture()
+
+        self.assertEqual(buffer.as_list()[0]['call_site'], f'{PROJECT_FILE}:3 in charge')
+
+    @override_settings(DJANGO_SONAR={'query_call_sites': False})
+    def test_annotation_can_be_disabled(self):
+        """No frame walking should happen when call sites are disabled"""
+        charge = _project_function('charge')
+
+        queries.start_query_capture()
+        charge(lambda: get_user_model().objects.count())
+        buffer = queries.stop_query_capture()
+
+        self.assertIsNone(buffer.as_list()[0]['call_site'])
+
+    def test_group_by_call_site(self):
+        """Queries should be grouped per call site, slowest first"""
+        groups = callsite.group_by_call_site([
+            {'sql': 'SELECT 1', 'time': 1.0, 'call_site': 'a.py:1 in f'},
+            {'sql': 'SELECT 2', 'time': 4.0, 'call_site': 'b.py:2 in g'},
+            {'sql': 'SELECT 3', 'time': 2.0, 'call_site': 'a.py:1 in f'},
+        ])
+
+        self.assertEqual(groups, [
+            {'call_site': 'b.py:2 in g', 'count': 1, 'total_time': 4.0},
+            {'call_site': 'a.py:1 in f', 'count': 2, 'total_time': 3.0},
+        ])
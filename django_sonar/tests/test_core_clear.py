@@ -0,0 +1,200 @@
+"""
+Tests for core.clear module.
+
+Tests full and selective clears and the clear_sonar_data command.
+"""
+
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection, router
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_sonar.core.clear import SonarCleaner, get_maintenance_statements, get_sonar_tables
+from django_sonar.core.persistence import persist_snapshots
+from django_sonar.models import SonarBlob, SonarData, SonarRequest, SonarRouteRollup
+from .test_core_rollups import _snapshot
+
+
+def _persist(now):
+    persist_snapshots([
+        _snapshot(created_at=now - timedelta(days=10), path='/static/app.js', status=200),
+        _snapshot(created_at=now - timedelta(days=10), path='/books/1/', status=500),
+        _snapshot(created_at=now - timedelta(days=1), path='/static/app.css', status=200),
+        _snapshot(created_at=now - timedelta(days=1), path='/books/2/', status=404),
+    ])
+
+
+@override_settings(DJANGO_SONAR={'rollups': True})
+class SonarCleanerTestCase(TestCase):
+    """Test selective clears"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        _persist(self.now)
+        self.entries_per_request = SonarData.objects.count() // 4
+
+    def test_selectors_are_combined(self):
+        """Age, path prefix and status selectors should all apply"""
+        result = SonarCleaner(older_than=5, path_prefixes=['/static/'], sleep=0).clear()
+
+        self.assertEqual(result['requests'], 1)
+        self.assertEqual(result['entries'], self.entries_per_request)
+        self.assertEqual(
+            sorted(SonarRequest.objects.values_list('path', flat=True)),
+            ['/books/1/', '/books/2/', '/static/app.css'],
+        )
+
+        SonarCleaner(statuses=['4xx', '500'], sleep=0).clear()
+        self.assertEqual(list(SonarRequest.objects.values_list('path', flat=True)), ['/static/app.css'])
+
+    def test_categories_keep_the_requests(self):
+        """With categories, only the entries of those categories should be deleted"""
+        result = SonarCleaner(categories=['headers', 'session'], path_prefixes=['/books/'], sleep=0).clear()
+
+        self.assertEqual(result, {'requests': 0, 'entries': 4, 'blobs': 0})
+        self.assertEqual(SonarRequest.objects.count(), 4)
+        self.assertFalse(SonarData.objects.filter(category='headers', sonar_request__path__startswith='/books/'))
+        self.assertEqual(SonarData.objects.filter(category='headers').count(), 2)
+
+    def test_chunks_are_selected_on_the_write_database(self):
+        """Chunks should never be selected on the read database"""
+        with patch.object(router, 'db_for_read', return_value='replica'):
+            result = SonarCleaner(path_prefixes=['/static/'], sleep=0).clear()
+            SonarCleaner(categories=['headers'], sleep=0).clear()
+
+        self.assertEqual(result['requests'], 2)
+        self.assertFalse(SonarData.objects.filter(category='headers').exists())
+
+    def test_deletes_in_bounded_chunks(self):
+        """Every chunk should report its progress"""
+        progress = []
+
+        SonarCleaner(batch_size=1, sleep=0, progress=lambda result: progress.append(result['requests'])).clear()
+
+        self.assertEqual(progress, [1, 2, 3, 4])
+        self.assertEqual(SonarData.objects.count(), 0)
+        # Aggregates are kept
+        self.assertTrue(SonarRouteRollup.objects.exists())
+
+
+class SonarTablesTestCase(TestCase):
+    """Test the database targeted by clears"""
+
+    def test_tables_follow_the_router(self):
+        """The Sonar tables should be flushed on the database the router writes them to"""
+        with patch('django_sonar.core.clear.router.db_for_write', return_value='sonar_db'):
+            tables = get_sonar_tables()
+
+        self.assertEqual(list(tables), ['sonar_db'])
+        self.assertIn('sonar_requests', tables['sonar_db'])
+        self.assertIn('sonar_data', tables['sonar_db'])
+
+    def test_maintenance_statements(self):
+        """VACUUM/ANALYZE statements should match the database vendor"""
+        tables = ['sonar_requests', 'sonar_data']
+        statements = get_maintenance_statements(connection, tables, vacuum=True, analyze=True)
+        self.assertEqual(statements, ['VACUUM', 'ANALYZE "sonar_requests"', 'ANALYZE "sonar_data"'])
+
+        with patch.object(connection, 'vendor', 'postgresql'):
+            self.assertEqual(
+                get_maintenance_statements(connection, tables, vacuum=True, analyze=True),
+                ['VACUUM (ANALYZE) "sonar_requests"', 'VACUUM (ANALYZE) "sonar_data"'],
+            )
+        with patch.object(connection, 'vendor', 'oracle'):
+            self.assertEqual(get_maintenance_statements(connection, tables, analyze=True), [])
+
+
+@override_settings(DJANGO_SONAR={'rollups': True})
+class ClearCommandTestCase(TestCase):
+    """Test the clear_sonar_data command"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        _persist(self.now)
+
+    def test_clear_everything(self):
+        """Without selectors, every Sonar table should be flushed"""
+        out = StringIO()
+        call_command('clear_sonar_data', '--no-input', stdout=out)
+
+        self.assertIn('and 4 SonarRequest entries', out.getvalue())
+        self.assertFalse(SonarRequest.objects.exists())
+        self.assertFalse(SonarData.objects.exists())
+        self.assertFalse(SonarRouteRollup.objects.exists())
+
+    def test_counts_use_the_flushed_database(self):
+        """The reported counts should be read from the database the tables are flushed on"""
+        out = StringIO()
+        with patch.object(router, 'db_for_read', return_value='replica'):
+            call_command('clear_sonar_data', '--no-input', stdout=out)
+
+        self.assertIn('and 4 SonarRequest entries', out.getvalue())
+
+    def test_selective_clear_reports_progress(self):
+        """Selectors should delete in chunks and print the progress"""
+        out = StringIO()
+        call_command(
+            'clear_sonar_data', '--no-input', '--older-than', '5', '--status', '5xx', '--status', '200',
+            '--batch-size', '1', stdout=out,
+        )
+
+        self.assertIn('... 1 requests', out.getvalue())
+        self.assertIn('Deleted 2 requests', out.getvalue())
+        self.assertEqual(SonarRequest.objects.count(), 2)
+        self.assertTrue(SonarRouteRollup.objects.exists())
+
+    def test_cancelled_without_confirmation(self):
+        """Anything but "yes" should cancel"""
+        out = StringIO()
+        with patch('builtins.input', return_value='no'):
+            call_command('clear_sonar_data', '--category', 'headers', stdout=out)
+
+        self.assertIn('Operation cancelled', out.getvalue())
+        self.assertTrue(SonarData.objects.filter(category='headers').exists())
+
+    def test_selectors_require_database_storage(self):
+        """The segment and memory backends can only be cleared entirely or by age"""
+        with override_settings(DJANGO_SONAR={'storage': 'memory'}):
+            with self.assertRaises(CommandError):
+                call_command('clear_sonar_data', '--no-input', '--status', '404', stdout=StringIO())
+
+
+@override_settings(DJANGO_SONAR={'rollups': True, 'dedup': True})
+class ClearViewTestCase(TestCase):
+    """Test the clear button of the dashboard"""
+
+    def test_clear_keeps_the_aggregates(self):
+        """Only the requests, their entries and blobs should be deleted"""
+        _persist(timezone.now())
+        get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='admin123')
+        client = Client()
+        client.login(username='admin', password='admin123')
+
+        self.assertTrue(SonarBlob.objects.exists())
+
+        response = client.get(reverse('sonar_request_clear'))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(SonarRequest.objects.exists())
+        self.assertFalse(SonarData.objects.exists())
+        self.assertFalse(SonarBlob.objects.exists())
+        self.assertTrue(SonarRouteRollup.objects.exists())
+
+
+class ClearMaintenanceTestCase(TransactionTestCase):
+    """Test VACUUM/ANALYZE, which cannot run inside a transaction"""
+
+    def test_vacuum_and_analyze(self):
+        """--vacuum and --analyze should run after the clear"""
+        _persist(timezone.now())
+        out = StringIO()
+
+        call_command('clear_sonar_data', '--no-input', '--path-prefix', '/static/', '--vacuum', '--analyze', stdout=out)
+
+        self.assertIn('Ran 7 maintenance statements (VACUUM...)', out.getvalue())
+        self.assertEqual(SonarRequest.objects.count(), 2)
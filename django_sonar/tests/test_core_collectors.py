@@ -4,10 +4,23 @@ Tests for core.collectors module.
 Tests DataCollector class functionality for data persistence.
 """
 
-from django_sonar.core.collectors import DataCollector
-from django_sonar.models import SonarRequest, SonarData
+import math
+import uuid
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_sonar.core.collectors import BatchDataCollector, DataCollector
+from django_sonar.core.persistence import add_sample_count, persist_sample_counts, persist_snapshots
+from django_sonar.models import SonarRequest, SonarData, SonarRouteRollup, SonarSampleCounter
+from django_sonar.storage import get_storage
 from django_sonar import utils
-from .base import BaseMiddlewareTestCase
+from .base import BaseMiddlewareTestCase, read_replica
+
+
+def _count_inserts(captured):
+    return len([q for q in captured.captured_queries if q['sql'].startswith('INSERT')])
 
 
 class DataCollectorTestCase(BaseMiddlewareTestCase):
@@ -264,3 +277,134 @@ class DataCollectorTestCase(BaseMiddlewareTestCase):
         
         self.assertEqual(data1.data['view_func'], 'view1')
         self.assertEqual(data2.data['view_func'], 'view2')
+
+
+class BatchDataCollectorTestCase(BaseMiddlewareTestCase):
+    """Test BatchDataCollector and bulk snapshot persistence"""
+
+    def _make_snapshot(self, **overrides):
+        snapshot = {
+            'uuid': uuid.uuid4(),
+            'verb': 'GET',
+            'path': '/batch/',
+            'status': 200,
+            'duration': 12,
+            'query_count': 1,
+            'ip_address': '127.0.0.1',
+            'hostname': 'testhost',
+            'is_ajax': False,
+            'created_at': timezone.now(),
+            'user_info': None,
+            'view_func': 'test.views.batch',
+            'middlewares_used': ['middleware1'],
+            'memory_used': 0.5,
+            'get_payload': {},
+            'post_payload': {},
+            'queries': [{'sql': 'SELECT 1', 'time': '0.001'}],
+            'headers': {'Accept': '*/*'},
+            'session': {},
+            'events': [{'name': 'event'}],
+            'logs': [{'message': 'line %d' % index} for index in range(200)],
+            'dumps': ['dump'],
+            'exceptions': [],
+        }
+        snapshot.update(overrides)
+        return snapshot
+
+    def test_entries_are_queued_until_flush(self):
+        """save_* calls should not hit the database before flush()"""
+        sonar_request = SonarRequest(verb='GET', path='/q/', status='200', duration=1)
+        collector = BatchDataCollector(sonar_request.uuid)
+
+        with CaptureQueriesContext(connection) as captured:
+            collector.save_details(None, 'view', [], 0)
+            collector.save_headers({'Accept': '*/*'})
+            collector.save_logs([{'message': 'a'}, {'message': 'b'}])
+        self.assertEqual(len(captured.captured_queries), 0)
+        self.assertEqual(len(collector.entries), 4)
+
+        with CaptureQueriesContext(connection) as captured:
+            collector.flush(sonar_request)
+
+        # One INSERT for the request row and one bulk INSERT for every entry
+        self.assertEqual(_count_inserts(captured), 2)
+        self.assertEqual(SonarData.objects.filter(sonar_request=sonar_request).count(), 4)
+        self.assertEqual(collector.entries, [])
+
+    def test_flush_respects_max_batch_size(self):
+        """Entries should be split into INSERTs of at most max_batch_size rows"""
+        sonar_request = SonarRequest.objects.create(verb='GET', path='/q/', status='200', duration=1)
+        collector = BatchDataCollector(sonar_request.uuid, max_batch_size=2)
+        collector.save_logs([{'message': str(index)} for index in range(5)])
+
+        with CaptureQueriesContext(connection) as captured:
+            collector.flush()
+
+        self.assertEqual(_count_inserts(captured), 3)
+        self.assertEqual(SonarData.objects.filter(category='logs').count(), 5)
+
+    def test_persist_snapshots_uses_single_bulk_insert(self):
+        """A log-heavy snapshot should be written with one INSERT per table"""
+        snapshot = self._make_snapshot()
+
+        with CaptureQueriesContext(connection) as captured:
+            persist_snapshots([snapshot])
+
+        # Request rows and data entries (query statistics and route rollups are opt-in).
+        # The data entries only split when the backend caps the parameters of a statement (SQLite)
+        sonar_request = SonarRequest.objects.get(uuid=snapshot['uuid'])
+        entries = SonarData.objects.filter(sonar_request=sonar_request).count()
+        fields = [field for field in SonarData._meta.concrete_fields if not field.primary_key]
+        batch_size = connection.ops.bulk_batch_size(fields, [None] * entries)
+        self.assertEqual(_count_inserts(captured), 1 + math.ceil(entries / batch_size))
+        self.assertEqual(sonar_request.created_at, snapshot['created_at'])
+        self.assertEqual(
+            SonarData.objects.filter(sonar_request=sonar_request, category='logs').count(),
+            200
+        )
+        categories = set(
+            SonarData.objects.filter(sonar_request=sonar_request).values_list('category', flat=True)
+        )
+        self.assertEqual(
+            categories,
+            {'details', 'payload', 'queries', 'headers', 'session', 'events', 'logs', 'dumps'}
+        )
+
+    def test_persist_snapshots_batches_many_requests(self):
+        """Several snapshots should share the same bulk INSERTs"""
+        snapshots = [self._make_snapshot(logs=[]) for _ in range(3)]
+
+        with CaptureQueriesContext(connection) as captured:
+            persist_snapshots(snapshots)
+
+        self.assertEqual(_count_inserts(captured), 2)
+        self.assertEqual(SonarRequest.objects.count(), 3)
+
+    @override_settings(DJANGO_SONAR={'query_stats': True, 'rollups': True})
+    def test_writes_run_on_the_write_database(self):
+        """Batches should be atomic on the database the router writes to, not the read one"""
+        snapshot = self._make_snapshot(logs=[])
+        counts = {}
+        add_sample_count(counts, {'created_at': timezone.now(), 'hostname': 'web-1', 'duration': 5})
+
+        with read_replica() as aliases:
+            persist_snapshots([snapshot])
+            DataCollector(snapshot['uuid']).save_entry('events', {'name': 'late'})
+            persist_sample_counts(counts)
+
+        self.assertNotIn('replica', aliases)
+        self.assertEqual(SonarData.objects.filter(sonar_request_id=snapshot['uuid'], category='events').count(), 2)
+        self.assertTrue(SonarRouteRollup.objects.exists())
+        self.assertEqual(SonarSampleCounter.objects.get().dropped, 1)
+
+    def test_entries_of_a_request_keep_their_capture_order(self):
+        """Entries sharing the created_at of their request should be ordered by primary key"""
+        snapshot = self._make_snapshot(logs=[{'message': 'line %d' % index} for index in range(5)])
+        persist_snapshots([snapshot])
+
+        logs = get_storage().entries().filter(sonar_request_id=snapshot['uuid'], category='logs')
+        self.assertEqual([log.data['message'] for log in logs], ['line %d' % index for index in range(4, -1, -1)])
+        self.assertEqual(
+            [log.data['message'] for log in logs.order_by('created_at', 'pk')],
+            ['line %d' % index for index in range(5)]
+        )
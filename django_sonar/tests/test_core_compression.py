@@ -0,0 +1,123 @@
+"""
+Tests for django_sonar.compression and the compressed SonarData payloads.
+"""
+
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import router
+from django.test import TestCase, override_settings
+from django_sonar import compression
+from django_sonar.models import SonarData, SonarRequest
+
+
+LARGE_PAYLOAD = {'executed_queries': [{'sql': 'SELECT * FROM book WHERE id = %s', 'time': 0.5}] * 200}
+
+
+class CompressionCodecTestCase(TestCase):
+    """Test payload encoding and decoding"""
+
+    def test_zlib_round_trip(self):
+        """A zlib blob should start with its marker and decode to the payload"""
+        blob = compression.compress_payload(LARGE_PAYLOAD, codec='zlib')
+
+        self.assertEqual(blob[:1], compression.ZLIB_MARKER)
+        self.assertEqual(compression.decompress_payload(memoryview(blob)), LARGE_PAYLOAD)
+
+    def test_unknown_marker(self):
+        """Blobs with an unknown marker should be rejected"""
+        with self.assertRaises(ValueError):
+            compression.decompress_payload(b'?abc')
+
+    def test_auto_codec_without_zstandard(self):
+        """auto should fall back to zlib when zstandard is missing, zstd should fail loudly"""
+        with patch.object(compression, 'zstandard', None):
+            self.assertEqual(compression.get_codec(), 'zlib')
+            with override_settings(DJANGO_SONAR={'compression_codec': 'zstd'}):
+                with self.assertRaises(ImproperlyConfigured):
+                    compression.get_codec()
+
+    @override_settings(DJANGO_SONAR={'compression': True, 'compression_threshold': 1024})
+    def test_encode_respects_threshold(self):
+        """Small payloads should stay plain JSON"""
+        self.assertIsNone(compression.encode_payload({'a': 1}))
+        self.assertIsNotNone(compression.encode_payload(LARGE_PAYLOAD))
+
+    def test_encode_disabled_by_default(self):
+        """Compression should be opt-in"""
+        self.assertIsNone(compression.encode_payload(LARGE_PAYLOAD))
+        self.assertIsNotNone(compression.encode_payload(LARGE_PAYLOAD, force=True))
+
+
+class CompressedSonarDataTestCase(TestCase):
+    """Test transparent compression on SonarData"""
+
+    def setUp(self):
+        self.sonar_request = SonarRequest.objects.create(verb='GET', path='/test/', status='200', duration=1)
+
+    def _raw(self, entry):
+        return SonarData.objects.filter(pk=entry.pk).values_list('data', 'data_blob').get()
+
+    @override_settings(DJANGO_SONAR={'compression': True, 'compression_codec': 'zlib'})
+    def test_large_payload_stored_compressed(self):
+        """Large payloads should be stored in data_blob and read back transparently"""
+        entry = SonarData.objects.create(sonar_request=self.sonar_request, category='queries', data=LARGE_PAYLOAD)
+
+        data, blob = self._raw(entry)
+        self.assertIsNone(data)
+        self.assertLess(len(blob), len(compression.serialize_payload(LARGE_PAYLOAD)) / 5)
+
+        reloaded = SonarData.objects.get(pk=entry.pk)
+        self.assertEqual(reloaded.data, LARGE_PAYLOAD)
+
+    @override_settings(DJANGO_SONAR={'compression': True})
+    def test_bulk_create_compresses(self):
+        """bulk_create (used by the persistence layer) should compress too"""
+        SonarData.objects.bulk_create([
+            SonarData(sonar_request=self.sonar_request, category='queries', data=LARGE_PAYLOAD),
+            SonarData(sonar_request=self.sonar_request, category='headers', data={'Host': 'example.com'}),
+        ])
+
+        queries = SonarData.objects.get(category='queries')
+        headers = SonarData.objects.get(category='headers')
+        self.assertIsNotNone(queries.data_blob)
+        self.assertIsNone(headers.data_blob)
+        self.assertEqual(queries.data, LARGE_PAYLOAD)
+        self.assertEqual(headers.data, {'Host': 'example.com'})
+
+    def test_disabled_compression_stores_json(self):
+        """Without the setting payloads should stay in the JSON column"""
+        entry = SonarData.objects.create(sonar_request=self.sonar_request, category='queries', data=LARGE_PAYLOAD)
+
+        self.assertEqual(self._raw(entry), (LARGE_PAYLOAD, None))
+
+    def test_backfill_command_round_trip(self):
+        """compress_sonar_data should convert existing rows in chunks, and back"""
+        entries = [
+            SonarData.objects.create(sonar_request=self.sonar_request, category='queries', data=LARGE_PAYLOAD)
+            for _ in range(3)
+        ]
+        small = SonarData.objects.create(sonar_request=self.sonar_request, category='headers', data={'a': 1})
+
+        out = StringIO()
+        call_command('compress_sonar_data', '--batch-size', '2', stdout=out)
+
+        self.assertIn('Compressed 3 SonarData entries', out.getvalue())
+        for entry in entries:
+            self.assertIsNone(self._raw(entry)[0])
+            self.assertEqual(SonarData.objects.get(pk=entry.pk).data, LARGE_PAYLOAD)
+        self.assertEqual(self._raw(small), ({'a': 1}, None))
+
+        call_command('compress_sonar_data', '--decompress', stdout=StringIO())
+        self.assertEqual(self._raw(entries[0]), (LARGE_PAYLOAD, None))
+
+    def test_backfill_command_uses_the_write_database(self):
+        """Chunks should be read and rewritten on the database the router writes to"""
+        entry = SonarData.objects.create(sonar_request=self.sonar_request, category='queries', data=LARGE_PAYLOAD)
+
+        with patch.object(router, 'db_for_read', return_value='replica'):
+            call_command('compress_sonar_data', stdout=StringIO())
+
+        self.assertIsNone(self._raw(entry)[0])
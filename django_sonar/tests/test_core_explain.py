@@ -0,0 +1,85 @@
+"""
+Tests for core.explain module.
+
+Tests EXPLAIN on SQLite, statement safety checks and scheduling of slow
+fingerprints from the query statistics update.
+"""
+
+import uuid
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_sonar.core.explain import ExplainWorker, explain_query, is_explainable
+from django_sonar.core.query_stats import collect_query_stats, update_query_stats
+from django_sonar.models import SonarQueryStat
+from .base import read_replica
+
+
+SLOW_SQL = 'SELECT "sonar_requests"."uuid" FROM "sonar_requests" WHERE "sonar_requests"."verb" = %s'
+
+
+class ExplainTestCase(TestCase):
+    """Test EXPLAIN capture"""
+
+    def _snapshot(self, time, sql=SLOW_SQL, params=('GET',)):
+        return {
+            'uuid': uuid.uuid4(),
+            'created_at': timezone.now(),
+            'queries': [{'sql': sql, 'params': list(params), 'time': time, 'alias': 'default'}],
+        }
+
+    def test_only_single_selects_are_explainable(self):
+        """Writes, multiple statements and executemany should never be explained"""
+        self.assertTrue(is_explainable(SLOW_SQL, ['GET']))
+        self.assertFalse(is_explainable('DELETE FROM sonar_requests', []))
+        self.assertFalse(is_explainable('SELECT 1; DELETE FROM sonar_requests', []))
+        self.assertFalse(is_explainable('SELECT %s', [['a'], ['b']]))
+
+    def test_explain_query_on_sqlite(self):
+        """SQLite plans should be fetched with EXPLAIN QUERY PLAN"""
+        plan = explain_query(SLOW_SQL, ['GET'], 'default')
+        self.assertIn('sonar_requests', plan)
+
+    @override_settings(DJANGO_SONAR={'explain_threshold': 100})
+    def test_slow_fingerprints_are_scheduled_after_commit(self):
+        """Only fingerprints above the threshold should be handed to the worker"""
+        with patch('django_sonar.core.query_stats.schedule_explains') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                update_query_stats(collect_query_stats([self._snapshot(5)]))
+            schedule.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                update_query_stats(collect_query_stats([self._snapshot(150)]))
+
+        candidates = schedule.call_args[0][0]
+        self.assertEqual(len(candidates), 1)
+        self.assertEqual(candidates[0][1:], (SLOW_SQL, ['GET'], 'default'))
+
+    @override_settings(DJANGO_SONAR={'explain_threshold': 100})
+    def test_explains_wait_for_the_write_transaction(self):
+        """The worker should be scheduled after the commit of the database the statistics are written to"""
+        with read_replica(), patch('django_sonar.core.query_stats.transaction.on_commit') as on_commit:
+            update_query_stats(collect_query_stats([self._snapshot(150)]))
+
+        self.assertEqual(on_commit.call_args.kwargs['using'], 'default')
+
+    @override_settings(DJANGO_SONAR={'explain_threshold': 100})
+    def test_worker_stores_plan_once_per_refresh_interval(self):
+        """The worker should store the plan, which is not refreshed too early"""
+        update_query_stats(collect_query_stats([self._snapshot(150)]))
+        stat = SonarQueryStat.objects.get()
+
+        worker = ExplainWorker()
+        self.assertTrue(worker.submit(stat.fingerprint, SLOW_SQL, ['GET'], 'default'))
+        self.assertFalse(worker.submit(stat.fingerprint, SLOW_SQL, ['GET'], 'default'))
+        worker.process_pending()
+
+        stat.refresh_from_db()
+        self.assertIn('sonar_requests', stat.explain_plan)
+        self.assertIsNotNone(stat.explained_at)
+
+        with patch('django_sonar.core.query_stats.schedule_explains') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                update_query_stats(collect_query_stats([self._snapshot(200)]))
+        schedule.assert_not_called()
@@ -0,0 +1,102 @@
+"""
+Tests for core.exports module.
+
+Tests the keyset-paginated NDJSON export and the export_sonar_data command.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_sonar.core.exports import iter_export
+from django_sonar.core.persistence import persist_snapshots
+from .test_core_rollups import _snapshot
+
+
+class ExportTestCase(TestCase):
+    """Test streaming requests with their entries"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.snapshots = [
+            _snapshot(created_at=self.now - timedelta(minutes=index), duration=index, status=200 if index % 2 else 500)
+            for index in range(7)
+        ]
+        # Same instant: the UUID breaks the tie between pages
+        self.snapshots.append(_snapshot(created_at=self.snapshots[0]['created_at'], dumps=[{'value': 'dumped'}]))
+        persist_snapshots(self.snapshots)
+
+    def test_pages_cover_every_request_once(self):
+        """Keyset pages should return every request once, oldest first, whatever the page size"""
+        exported = list(iter_export(chunk_size=3))
+
+        self.assertEqual(len(exported), 8)
+        self.assertEqual(len({request['uuid'] for request in exported}), 8)
+        created = [request['created_at'] for request in exported]
+        self.assertEqual(created, sorted(created))
+        self.assertEqual(
+            [entry['category'] for entry in exported[0]['entries']],
+            ['details', 'payload', 'queries', 'headers', 'session'],
+        )
+
+    def test_pages_read_entries_with_a_bounded_number_of_queries(self):
+        """Every page should cost one request query and one entries query"""
+        with self.assertNumQueries(6):
+            self.assertEqual(len(list(iter_export(chunk_size=3))), 8)
+
+    def test_filters(self):
+        """Time range, status and category filters should select the exported requests"""
+        self.assertEqual(len(list(iter_export(since=self.now - timedelta(minutes=2, seconds=30)))), 4)
+        self.assertEqual(len(list(iter_export(until=self.now - timedelta(minutes=2, seconds=30)))), 4)
+        self.assertEqual(len(list(iter_export(statuses=['5xx']))), 4)
+        self.assertEqual(len(list(iter_export(routes=['other/']))), 0)
+
+        dumps = list(iter_export(categories=['dumps']))
+        self.assertEqual(len(dumps), 1)
+        self.assertEqual(dumps[0]['entries'], [
+            {'category': 'dumps', 'created_at': self.snapshots[0]['created_at'], 'data': {'value': 'dumped'}},
+        ])
+
+    def test_command_writes_ndjson_to_stdout(self):
+        """Each line should be one JSON request with its entries"""
+        out = StringIO()
+        err = StringIO()
+
+        call_command('export_sonar_data', '--status', '500', stdout=out, stderr=err)
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(lines), 4)
+        self.assertEqual({line['status'] for line in lines}, {'500'})
+        self.assertEqual(len(lines[0]['entries']), 5)
+        self.assertIn('Exported 4 requests with 20 entries', err.getvalue())
+
+    def test_command_writes_gzip_file(self):
+        """An output ending with .gz should be gzip-compressed"""
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'sonar.ndjson.gz')
+        self.addCleanup(os.rmdir, directory)
+        self.addCleanup(os.remove, path)
+
+        since = (self.now - timedelta(days=1)).date().isoformat()
+
+        call_command('export_sonar_data', '--output', path, '--since', since, stderr=StringIO())
+
+        with gzip.open(path, 'rt', encoding='utf-8') as exported:
+            self.assertEqual(len(exported.read().splitlines()), 8)
+
+    def test_command_rejects_invalid_dates(self):
+        """Dates should be ISO dates or datetimes"""
+        with self.assertRaises(CommandError):
+            call_command('export_sonar_data', '--since', 'yesterday', stdout=StringIO())
+
+    @override_settings(DJANGO_SONAR={'storage': 'memory'})
+    def test_command_requires_database_storage(self):
+        """Exports should refuse to run on another storage backend"""
+        with self.assertRaises(CommandError):
+            call_command('export_sonar_data', stdout=StringIO())
@@ -0,0 +1,79 @@
+"""
+Tests for core.fingerprints module.
+
+Tests SQL normalization, fingerprint stability and N+1 detection.
+"""
+
+from django.test import TestCase, override_settings
+from django_sonar.core.collectors import BatchDataCollector
+from django_sonar.core.fingerprints import detect_n_plus_one, fingerprint_sql, normalize_sql
+
+
+class FingerprintTestCase(TestCase):
+    """Test SQL fingerprinting"""
+
+    def test_literals_and_placeholders_collapse(self):
+        """Statements differing only by values should share a fingerprint"""
+        self.assertEqual(
+            normalize_sql("SELECT * FROM book WHERE id = 42 AND title = 'It''s'"),
+            'SELECT * FROM book WHERE id = ? AND title = ?',
+        )
+        self.assertEqual(
+            fingerprint_sql('SELECT * FROM "book" WHERE "book"."author_id" = %s'),
+            fingerprint_sql('SELECT * FROM "book" WHERE "book"."author_id" = 7'),
+        )
+
+    def test_in_lists_and_values_collapse(self):
+        """IN-lists and multi-row VALUES should not depend on their length"""
+        self.assertEqual(
+            normalize_sql('SELECT * FROM book WHERE id IN (%s, %s, %s)'),
+            'SELECT * FROM book WHERE id IN (...)',
+        )
+        self.assertEqual(
+            normalize_sql('INSERT INTO book (a, b) VALUES (%s, %s), (%s, %s)'),
+            normalize_sql('INSERT INTO book (a, b) VALUES (1, 2)'),
+        )
+
+    def test_comments_whitespace_and_identifiers(self):
+        """Comments and whitespace should be dropped, identifiers kept"""
+        self.assertEqual(
+            normalize_sql('SELECT  "t1"."col2"  /* hint */\n FROM t1 -- trailing'),
+            'SELECT "t1"."col2" FROM t1',
+        )
+        self.assertEqual(normalize_sql('SELECT x::text FROM t'), 'SELECT x::text FROM t')
+
+
+class NPlusOneTestCase(TestCase):
+    """Test N+1 detection"""
+
+    def _queries(self, count, sql='SELECT * FROM author WHERE id = %s'):
+        return [{'sql': sql, 'time': 1.5, 'call_site': 'app/views.py:12 in index'} for _ in range(count)]
+
+    def test_detects_repeated_fingerprints(self):
+        """Fingerprints repeated at least threshold times should be reported"""
+        executed = self._queries(6) + self._queries(2, 'SELECT COUNT(*) FROM book')
+
+        findings = detect_n_plus_one(executed, threshold=5)
+
+        self.assertEqual(len(findings), 1)
+        self.assertEqual(findings[0]['count'], 6)
+        self.assertEqual(findings[0]['total_time'], 9.0)
+        self.assertEqual(findings[0]['call_site'], 'app/views.py:12 in index')
+        self.assertEqual(findings[0]['sql'], 'SELECT * FROM author WHERE id = ?')
+
+    @override_settings(DJANGO_SONAR={'n_plus_one_threshold': None})
+    def test_detection_can_be_disabled(self):
+        """A None threshold should disable detection"""
+        self.assertEqual(detect_n_plus_one(self._queries(50)), [])
+
+    @override_settings(DJANGO_SONAR={'n_plus_one_threshold': 3})
+    def test_collector_stores_finding(self):
+        """Collectors should store an n_plus_one entry only when something is found"""
+        collector = BatchDataCollector('00000000-0000-0000-0000-000000000001')
+
+        collector.save_n_plus_one(self._queries(2))
+        self.assertEqual(collector.entries, [])
+
+        collector.save_n_plus_one(self._queries(3))
+        self.assertEqual(collector.entries[0].category, 'n_plus_one')
+        self.assertEqual(collector.entries[0].data['findings'][0]['count'], 3)
@@ -0,0 +1,151 @@
+"""
+Tests for core.imports module.
+
+Tests loading NDJSON exports back with the import_sonar_data command.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_sonar.core.exports import dump_export_line, iter_export
+from django_sonar.core.imports import SonarImporter, read_ndjson
+from django_sonar.core.persistence import persist_snapshots
+from django_sonar.models import SonarData, SonarRequest, SonarRouteRollup
+from .base import read_replica
+from .test_core_rollups import _snapshot
+
+
+class ImportTestCase(TestCase):
+    """Test replaying exported requests"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        persist_snapshots([
+            _snapshot(created_at=self.now - timedelta(minutes=index), duration=index, status=200 if index % 2 else 500)
+            for index in range(5)
+        ])
+        self.lines = [dump_export_line(request) for request in iter_export()]
+        self.exported = [json.loads(line) for line in self.lines]
+        self.entries = SonarData.objects.count()
+        self._clear()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'export.ndjson')
+        with open(self.path, 'w', encoding='utf-8') as stream:
+            stream.write('\n'.join(self.lines) + '\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @staticmethod
+    def _clear():
+        SonarData.objects.all().delete()
+        SonarRequest.objects.all().delete()
+        SonarRouteRollup.objects.all().delete()
+
+    def test_import_preserves_uuids_and_timestamps(self):
+        """Imported requests and entries should match the exported ones"""
+        result = SonarImporter().run(read_ndjson(self.lines))
+
+        self.assertEqual(result, {'requests': 5, 'entries': self.entries, 'skipped': 0, 'invalid': 0})
+        self.assertEqual(
+            [json.loads(dump_export_line(request)) for request in iter_export()],
+            self.exported,
+        )
+
+    def test_reimport_is_idempotent(self):
+        """Importing the same file twice should skip the requests already present"""
+        SonarImporter().run(read_ndjson(self.lines))
+        rollups = list(SonarRouteRollup.objects.values_list('count', flat=True))
+
+        result = SonarImporter().run(read_ndjson(self.lines + self.lines[:1]))
+
+        self.assertEqual(result, {'requests': 0, 'entries': 0, 'skipped': 6, 'invalid': 0})
+        self.assertEqual(SonarRequest.objects.count(), 5)
+        self.assertEqual(SonarData.objects.count(), self.entries)
+        self.assertEqual(list(SonarRouteRollup.objects.values_list('count', flat=True)), rollups)
+
+    def test_batches_write_in_bounded_queries(self):
+        """Every batch should cost one lookup and one transaction of bulk inserts"""
+        with override_settings(DJANGO_SONAR={'rollups': False}):
+            # 3 batches: lookup, savepoint, requests insert, entries insert, release
+            with self.assertNumQueries(15):
+                SonarImporter(batch_size=2).run(read_ndjson(self.lines))
+        self.assertEqual(SonarRequest.objects.count(), 5)
+
+    def test_batches_are_atomic_on_the_write_database(self):
+        """Every batch should be looked up and written in a transaction on the written database"""
+        with read_replica() as aliases:
+            result = SonarImporter(batch_size=2).run(read_ndjson(self.lines))
+
+        self.assertEqual(result['requests'], 5)
+        self.assertNotIn('replica', aliases)
+
+    @override_settings(DJANGO_SONAR={'rollups': True})
+    def test_import_updates_rollups(self):
+        """Imported requests should be counted in the route rollups"""
+        SonarImporter().run(read_ndjson(self.lines))
+
+        self.assertEqual(
+            sum(SonarRouteRollup.objects.filter(resolution=SonarRouteRollup.HOUR).values_list('count', flat=True)),
+            5,
+        )
+
+    def test_invalid_lines_are_skipped(self):
+        """Malformed or invalid lines should be reported and skipped"""
+        invalid = dict(self.exported[0], uuid=None)
+        bad_ip = dict(self.exported[1], ip_address='not an address')
+        errors = []
+
+        result = SonarImporter(on_error=lambda line_number, exc: errors.append(line_number)).run(
+            read_ndjson(['{not json', json.dumps(invalid), json.dumps(bad_ip), '', self.lines[2], '[]'])
+        )
+
+        self.assertEqual(result['requests'], 1)
+        self.assertEqual(result['invalid'], 4)
+        self.assertEqual(errors, [1, 2, 3, 6])
+
+    def test_no_validate_skips_model_validation(self):
+        """Without validation, rows are only converted to the column types"""
+        bad_ip = dict(self.exported[1], ip_address='not an address')
+
+        result = SonarImporter(validate=False).run(read_ndjson([json.dumps(bad_ip)]))
+
+        self.assertEqual(result['requests'], 1)
+
+    def test_command_reads_plain_and_gzip_files(self):
+        """The command should detect gzip files and print a summary"""
+        gzip_path = os.path.join(self.directory.name, 'export.ndjson.gz')
+        with gzip.open(gzip_path, 'wt', encoding='utf-8') as stream:
+            stream.write('\n'.join(self.lines[:2]) + '\n')
+
+        out = StringIO()
+        call_command('import_sonar_data', gzip_path, self.path, '--batch-size', '2', stdout=out, stderr=StringIO())
+
+        self.assertEqual(SonarRequest.objects.count(), 5)
+        self.assertIn('Imported 5 requests', out.getvalue())
+        self.assertIn('skipped 2 already present', out.getvalue())
+
+    def test_command_reports_invalid_lines(self):
+        """Invalid lines should be reported on stderr with their position"""
+        with open(self.path, 'a', encoding='utf-8') as stream:
+            stream.write('{broken\n')
+
+        err = StringIO()
+        call_command('import_sonar_data', self.path, '--no-validate', stdout=StringIO(), stderr=err)
+
+        self.assertIn(f'{self.path}:6:', err.getvalue())
+        self.assertEqual(SonarRequest.objects.count(), 5)
+
+    def test_command_requires_database_storage(self):
+        """Importing into the segment or memory storage should be refused"""
+        with override_settings(DJANGO_SONAR={'storage': 'memory'}):
+            with self.assertRaises(CommandError):
+                call_command('import_sonar_data', self.path, stdout=StringIO())
@@ -0,0 +1,118 @@
+"""
+Tests for core.parquet module.
+
+Tests the date-partitioned Parquet export (requires the optional pyarrow package).
+"""
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django_sonar.core import parquet
+from django_sonar.core.parquet import export_parquet
+from django_sonar.core.persistence import persist_snapshots
+from .test_core_rollups import _snapshot
+
+
+@unittest.skipUnless(parquet.pyarrow is not None, 'pyarrow is not installed')
+class ParquetExportTestCase(TestCase):
+    """Test flattening requests, queries and headers into Parquet tables"""
+
+    def setUp(self):
+        self.day = datetime(2024, 5, 1, 23, 0, tzinfo=dt_timezone.utc)
+        persist_snapshots([
+            _snapshot(
+                created_at=self.day + timedelta(minutes=40 * index),
+                duration=10 * index,
+                status=200 if index % 2 else 500,
+                db_time=1.5,
+                user_info={'user_id': 7, 'username': 'alice', 'email': 'alice@example.com'},
+                view_func='books.views.detail',
+                headers={'Accept': 'text/html', 'X-Request-Id': str(index)},
+                queries=[
+                    {'sql': f'SELECT {number}', 'params': [], 'time': 0.5 * number, 'rowcount': 1, 'alias': 'default'}
+                    for number in (1, 2)
+                ],
+            )
+            for index in range(3)
+        ])
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _read(self, table):
+        import pyarrow.dataset
+        return pyarrow.dataset.dataset(
+            os.path.join(self.directory.name, table), format='parquet', partitioning='hive'
+        ).to_table().sort_by('created_at')
+
+    def test_tables_are_partitioned_by_date(self):
+        """Requests, queries and headers should be written per UTC date"""
+        counts = export_parquet(self.directory.name, chunk_size=2)
+
+        self.assertEqual(counts, {'requests': 3, 'queries': 6, 'headers': 6})
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.directory.name, 'requests'))),
+            ['date=2024-05-01', 'date=2024-05-02'],
+        )
+        requests = self._read('requests')
+        self.assertEqual(requests.num_rows, 3)
+        self.assertEqual([str(date) for date in requests.column('date').to_pylist()][0], '2024-05-01')
+
+    def test_columns_are_typed_and_flattened(self):
+        """Numbers should be typed columns and the details flattened into the requests table"""
+        export_parquet(self.directory.name)
+
+        requests = self._read('requests')
+        self.assertEqual(str(requests.schema.field('status').type), 'int16')
+        self.assertEqual(str(requests.schema.field('duration').type), 'int32')
+        self.assertEqual(str(requests.schema.field('db_time').type), 'double')
+        row = requests.to_pylist()[0]
+        self.assertEqual((row['status'], row['duration'], row['query_count'], row['db_time']), (500, 0, 0, 1.5))
+        self.assertEqual((row['user_id'], row['username'], row['view_func']), ('7', 'alice', 'books.views.detail'))
+        self.assertEqual(row['created_at'], self.day)
+
+        queries = self._read('queries').to_pylist()
+        self.assertEqual([query['sql'] for query in queries[:2]], ['SELECT 1', 'SELECT 2'])
+        self.assertEqual([query['position'] for query in queries[:2]], [0, 1])
+        self.assertEqual(queries[0]['request_uuid'], row['uuid'])
+        headers = self._read('headers').to_pylist()
+        self.assertEqual({header['name'] for header in headers}, {'Accept', 'X-Request-Id'})
+
+    def test_successive_exports_share_the_directory(self):
+        """Every run should write its own part files"""
+        export_parquet(self.directory.name, since=self.day + timedelta(hours=1))
+        export_parquet(self.directory.name, until=self.day + timedelta(hours=1))
+
+        self.assertEqual(self._read('requests').num_rows, 3)
+        export_parquet(self.directory.name)
+        self.assertEqual(self._read('requests').num_rows, 6)
+        self.assertEqual(len(os.listdir(os.path.join(self.directory.name, 'requests', 'date=2024-05-02'))), 2)
+
+    def test_command(self):
+        """export_sonar_data --format parquet should write the tables and print the row counts"""
+        out = StringIO()
+        call_command(
+            'export_sonar_data', '--format', 'parquet', '--output', self.directory.name,
+            '--status', '5xx', '--compression', 'zstd', stdout=out,
+        )
+
+        self.assertIn('Exported 2 requests, 4 queries and 4 headers', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('export_sonar_data', '--format', 'parquet', stdout=StringIO())
+
+
+class ParquetMissingTestCase(TestCase):
+    """Test the error raised without pyarrow"""
+
+    def test_command_requires_pyarrow(self):
+        """The command should explain how to install the optional dependency"""
+        with patch.object(parquet, 'pyarrow', None):
+            with self.assertRaisesMessage(CommandError, 'django-sonar[parquet]'):
+                call_command('export_sonar_data', '--format', 'parquet', '--output', 'unused', stdout=StringIO())
@@ -0,0 +1,83 @@
+"""
+Tests for core.partitions module.
+
+The partitioned layout needs PostgreSQL: these tests cover naming,
+partition discovery and the behavior on other backends.
+"""
+
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from django.core.management import CommandError, call_command
+from django.db import connection, router
+from django.test import TestCase
+from django_sonar.core import partitions
+from django_sonar.models import SonarData, SonarRequest
+
+
+class PartitionsTestCase(TestCase):
+    """Test partition helpers"""
+
+    def _fake_connection(self, rows):
+        connection = MagicMock(vendor='postgresql')
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = rows
+        return connection
+
+    def test_partition_name(self):
+        """Partitions should be named after their table and day"""
+        self.assertEqual(partitions.get_partition_name('sonar_data', date(2026, 3, 7)), 'sonar_data_p20260307')
+
+    def test_get_partitions_parses_days(self):
+        """Daily partitions should be listed by day, ignoring the default partition"""
+        connection = self._fake_connection([
+            ('sonar_requests_p20260302',), ('sonar_requests_default',), ('sonar_requests_p20260301',),
+        ])
+        with patch.object(partitions, 'get_connection', return_value=connection):
+            result = partitions.get_partitions(SonarRequest)
+
+        self.assertEqual(result, [
+            (date(2026, 3, 1), 'sonar_requests_p20260301'),
+            (date(2026, 3, 2), 'sonar_requests_p20260302'),
+        ])
+
+    def test_connection_is_the_write_database(self):
+        """Partitions should be managed on the database the Sonar tables are written to"""
+        with patch.object(router, 'db_for_read', return_value='replica'):
+            self.assertEqual(partitions.get_connection().alias, router.db_for_write(SonarRequest))
+
+    def test_not_partitioned_on_other_backends(self):
+        """Tables are never reported as partitioned outside PostgreSQL"""
+        self.assertFalse(partitions.is_partitioned(SonarRequest))
+        self.assertFalse(partitions.is_partitioned(SonarData))
+
+    def test_partitioning_requires_postgresql(self):
+        """Partition management should refuse other backends"""
+        with self.assertRaises(partitions.PartitioningUnsupported):
+            partitions.create_partitions(date(2026, 3, 1), 1)
+        with self.assertRaises(partitions.PartitioningUnsupported):
+            partitions.drop_partitions(date(2026, 3, 1))
+
+    def test_command_requires_postgresql(self):
+        """The partition_sonar_data command should fail cleanly outside PostgreSQL"""
+        with self.assertRaisesMessage(CommandError, 'requires PostgreSQL'):
+            call_command('partition_sonar_data')
+
+    def test_convert_recreates_every_index(self):
+        """The Meta indexes and the ForeignKey indexes should be recreated on the partitioned tables"""
+        fake_connection = MagicMock(vendor='postgresql', alias=connection.alias)
+        fake_connection.ops.quote_name = connection.ops.quote_name
+        fake_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (None, None)
+        schema_editor = connection.SchemaEditorClass(connection, collect_sql=True)
+        fake_connection.schema_editor.return_value.__enter__.return_value = schema_editor
+
+        with patch.object(partitions, 'get_connection', return_value=fake_connection):
+            self.assertEqual(partitions.convert_to_partitioned(), [])
+
+        statements = [statement for statement in schema_editor.collected_sql if statement.startswith('CREATE INDEX')]
+        for index in SonarRequest._meta.indexes + SonarData._meta.indexes:
+            self.assertTrue([statement for statement in statements if f'"{index.name}"' in statement], index.name)
+        for column in ('sonar_request_id', 'blob_id'):
+            self.assertTrue(
+                [statement for statement in statements if statement.endswith(f'"sonar_data" ("{column}");')], column
+            )
@@ -0,0 +1,74 @@
+"""
+Tests for core.profiling module.
+
+Tests MemoryProfiler trigger rules, signed header tokens and that
+tracemalloc only runs while a profiled request is in flight.
+"""
+
+import tracemalloc
+
+from django.test import override_settings
+from django_sonar.core.profiling import MemoryProfiler, get_profiling_token
+from django_sonar.middlewares.requests import RequestsMiddleware
+from django_sonar.models import SonarData
+from .base import BaseMiddlewareTestCase
+
+
+class MemoryProfilerTestCase(BaseMiddlewareTestCase):
+    """Test MemoryProfiler functionality"""
+
+    @override_settings(DJANGO_SONAR={})
+    def test_disabled_by_default(self):
+        """Requests should not be profiled without a rate or a token"""
+        profiler = MemoryProfiler()
+        self.assertFalse(profiler.should_profile(self.factory.get('/')))
+
+    @override_settings(DJANGO_SONAR={'memory_profiling_rate': 1.0})
+    def test_rate_enables_profiling(self):
+        """A full rate should profile every captured request"""
+        profiler = MemoryProfiler()
+        self.assertTrue(profiler.should_profile(self.factory.get('/')))
+
+    @override_settings(DJANGO_SONAR={})
+    def test_signed_header_enables_profiling(self):
+        """Only a correctly signed header should enable profiling"""
+        profiler = MemoryProfiler()
+
+        valid = self.factory.get('/', HTTP_X_SONAR_PROFILE=get_profiling_token())
+        forged = self.factory.get('/', HTTP_X_SONAR_PROFILE='profile:forged')
+
+        self.assertTrue(profiler.should_profile(valid))
+        self.assertFalse(profiler.should_profile(forged))
+
+    @override_settings(DJANGO_SONAR={'memory_profiling_top_n': 3})
+    def test_start_stop_reports_top_allocations(self):
+        """stop() should report memory, peak and at most top_n allocation sites"""
+        profiler = MemoryProfiler()
+        was_tracing = tracemalloc.is_tracing()
+
+        state = profiler.start()
+        self.assertTrue(tracemalloc.is_tracing())
+        allocated = [bytearray(1024) for _ in range(100)]
+        profile = profiler.stop(state)
+
+        self.assertEqual(tracemalloc.is_tracing(), was_tracing)
+        self.assertGreater(profile['memory_used'], 0)
+        self.assertGreaterEqual(profile['peak'], profile['memory_used'])
+        self.assertLessEqual(len(profile['top_allocations']), 3)
+        self.assertEqual(profile['top_allocations'][0]['file_name'], __file__)
+        del allocated
+
+    @override_settings(DJANGO_SONAR={'excludes': []})
+    def test_middleware_profiles_request_with_token(self):
+        """The middleware should profile a request carrying a valid token"""
+        request = self.factory.get('/test/', HTTP_X_SONAR_PROFILE=get_profiling_token())
+        request = self._add_session_to_request(request)
+        request.user = self.user
+
+        middleware = RequestsMiddleware(self.get_response)
+        middleware(request)
+
+        details = SonarData.objects.get(category='details')
+        self.assertIsInstance(details.data['memory_used'], float)
+        self.assertIn('memory_top_allocations', details.data)
+        self.assertFalse(tracemalloc.is_tracing())
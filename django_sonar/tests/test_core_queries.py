@@ -0,0 +1,116 @@
+"""
+Tests for core.queries module.
+
+Tests execute_wrapper based SQL capture with DEBUG off, the bounded
+buffer and the middleware integration.
+"""
+
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import HttpResponse
+from django.test import override_settings
+from django_sonar.core import queries
+from django_sonar.middlewares.requests import RequestsMiddleware
+from django_sonar.models import SonarRequest, SonarData
+from .base import BaseMiddlewareTestCase
+
+
+class QueryCaptureTestCase(BaseMiddlewareTestCase):
+    """Test execute_wrapper query capture"""
+
+    def tearDown(self):
+        queries.stop_query_capture()
+        super().tearDown()
+
+    def test_recorder_is_installed_on_default_connection(self):
+        """The recorder should be installed when the connection is created"""
+        connection.ensure_connection()
+        self.assertIn(queries.record_query, connection.execute_wrappers)
+
+    @override_settings(DEBUG=False)
+    def test_records_queries_with_debug_off(self):
+        """Queries should be recorded with sql, params, time, rowcount and alias"""
+        queries_log_size = len(connection.queries_log)
+
+        queries.start_query_capture()
+        get_user_model().objects.filter(username='testuser').count()
+        buffer = queries.stop_query_capture()
+
+        self.assertEqual(buffer.count, 1)
+        query = buffer.as_list()[0]
+        self.assertIn('SELECT COUNT(*)', query['sql'])
+        self.assertEqual(query['params'], ['testuser'])
+        self.assertIsInstance(query['time'], float)
+        self.assertIn('rowcount', query)
+        self.assertEqual(query['alias'], 'default')
+        self.assertEqual(len(connection.queries_log), queries_log_size)
+
+    def test_nothing_recorded_outside_capture(self):
+        """Queries outside an active capture should not be recorded"""
+        buffer = queries.start_query_capture()
+        queries.stop_query_capture()
+
+        get_user_model().objects.count()
+
+        self.assertEqual(buffer.count, 0)
+
+    @override_settings(DJANGO_SONAR={'max_queries': 2})
+    def test_buffer_is_bounded(self):
+        """Statements past max_queries should be counted but not kept"""
+        queries.start_query_capture()
+        for _ in range(5):
+            get_user_model().objects.count()
+        buffer = queries.stop_query_capture()
+
+        self.assertEqual(buffer.count, 5)
+        self.assertEqual(len(buffer.as_list()), 2)
+        self.assertEqual(buffer.truncated, 3)
+
+    def test_per_alias_totals(self):
+        """Counts and time should be aggregated per alias, past the cap too"""
+        buffer = queries.QueryBuffer(max_queries=1)
+        buffer.add('SELECT 1', (), 2.0, 1, 'default')
+        buffer.add('SELECT 2', (), 3.0, 1, 'replica_1')
+        buffer.add('SELECT 3', (), 5.0, 1, 'replica_1')
+
+        self.assertEqual(buffer.time, 10.0)
+        self.assertEqual(buffer.get_alias_stats(), {
+            'default': {'count': 1, 'time': 2.0},
+            'replica_1': {'count': 2, 'time': 8.0},
+        })
+
+    def test_recorder_installed_on_every_alias_by_default(self):
+        """Every alias should be captured unless query_aliases restricts them"""
+        replica = SimpleNamespace(alias='replica_1', execute_wrappers=[])
+        queries.install_query_recorder(connection=replica)
+        queries.install_query_recorder(connection=replica)
+        self.assertEqual(replica.execute_wrappers, [queries.record_query])
+
+        with override_settings(DJANGO_SONAR={'query_aliases': ['default']}):
+            other = SimpleNamespace(alias='replica_2', execute_wrappers=[])
+            queries.install_query_recorder(connection=other)
+            self.assertEqual(other.execute_wrappers, [])
+
+    @override_settings(DEBUG=False, DJANGO_SONAR={'excludes': []})
+    def test_middleware_captures_queries_with_debug_off(self):
+        """The middleware should store the view queries but not its own inserts"""
+        def get_response(request):
+            list(get_user_model().objects.all())
+            get_user_model().objects.count()
+            return HttpResponse('OK')
+
+        request = self.factory.get('/test/')
+        request = self._add_session_to_request(request)
+        request.user = self.user
+
+        RequestsMiddleware(get_response)(request)
+
+        sonar_request = SonarRequest.objects.get()
+        self.assertEqual(sonar_request.query_count, 2)
+        queries_data = SonarData.objects.get(sonar_request=sonar_request, category='queries')
+        self.assertEqual(queries_data.data['query_count'], 2)
+        self.assertEqual(queries_data.data['aliases']['default']['count'], 2)
+        self.assertGreater(sonar_request.db_time, 0)
+        self.assertFalse(any('sonar_' in query['sql'] for query in queries_data.data['executed_queries']))
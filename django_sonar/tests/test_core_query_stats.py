@@ -0,0 +1,94 @@
+"""
+Tests for core.query_stats module.
+
+Tests incremental per-fingerprint statistics and the Top Queries panel.
+"""
+
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_sonar.core.persistence import persist_snapshots
+from django_sonar.core.query_stats import collect_query_stats, update_query_stats
+from django_sonar.models import SonarQueryStat
+from .test_core_rollups import _snapshot
+
+
+class QueryStatsTestCase(TestCase):
+    """Test SonarQueryStat incremental updates"""
+
+    def _snapshot(self, times, sql='SELECT * FROM book WHERE id = %s'):
+        return {
+            'uuid': uuid.uuid4(),
+            'created_at': timezone.now(),
+            'queries': [{'sql': sql, 'time': time, 'alias': 'default'} for time in times],
+        }
+
+    def test_stats_are_merged_incrementally(self):
+        """Successive batches should add up into one row per fingerprint"""
+        first = self._snapshot([1.0, 3.0])
+        second = self._snapshot([10.0])
+        other = self._snapshot([2.0], sql='SELECT COUNT(*) FROM author')
+
+        update_query_stats(collect_query_stats([first, other]))
+        update_query_stats(collect_query_stats([second]))
+
+        self.assertEqual(SonarQueryStat.objects.count(), 2)
+        stat = SonarQueryStat.objects.get(sql='SELECT * FROM book WHERE id = ?')
+        self.assertEqual(stat.calls, 3)
+        self.assertEqual(stat.total_time, 14.0)
+        self.assertEqual(stat.max_time, 10.0)
+        self.assertAlmostEqual(stat.mean_time, 14.0 / 3)
+        self.assertEqual(stat.sketch['count'], 3)
+        self.assertAlmostEqual(stat.p50, 3.0, delta=0.1)
+        self.assertEqual(stat.example_requests, [str(first['uuid']), str(second['uuid'])])
+        self.assertEqual(stat.alias, 'default')
+
+    @override_settings(DJANGO_SONAR={'query_stats_examples': 2})
+    def test_examples_are_bounded(self):
+        """Only the most recent example request UUIDs should be kept"""
+        snapshots = [self._snapshot([1.0]) for _ in range(4)]
+
+        for snapshot in snapshots:
+            update_query_stats(collect_query_stats([snapshot]))
+
+        stat = SonarQueryStat.objects.get()
+        self.assertEqual(stat.example_requests, [str(snapshot['uuid']) for snapshot in snapshots[-2:]])
+
+    @override_settings(DJANGO_SONAR={'query_stats': True})
+    def test_top_queries_panel_orders_by_total_time(self):
+        """The Top Queries panel should list fingerprints by total time"""
+        update_query_stats(collect_query_stats([
+            self._snapshot([1.0], sql='SELECT 1 FROM cheap'),
+            self._snapshot([50.0], sql='SELECT 1 FROM expensive'),
+        ]))
+        get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='admin123')
+        client = Client()
+        client.login(username='admin', password='admin123')
+
+        response = client.get(
+            reverse('sonar_panel_list', kwargs={'panel_key': 'top_queries'}), HTTP_HX_REQUEST='true'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertLess(content.index('expensive'), content.index('cheap'))
+
+    def test_statistics_are_opt_in(self):
+        """Persisted batches should only update the statistics with the query_stats setting"""
+        queries = [{'sql': 'SELECT 1', 'time': 1.0, 'alias': 'default'}]
+        get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='admin123')
+        client = Client()
+        client.login(username='admin', password='admin123')
+
+        persist_snapshots([_snapshot(queries=queries)])
+
+        self.assertFalse(SonarQueryStat.objects.exists())
+        response = client.get(reverse('sonar_panel_list', kwargs={'panel_key': 'top_queries'}))
+        self.assertEqual(response.status_code, 404)
+
+        with override_settings(DJANGO_SONAR={'query_stats': True}):
+            persist_snapshots([_snapshot(queries=queries)])
+        self.assertEqual(SonarQueryStat.objects.get().calls, 1)
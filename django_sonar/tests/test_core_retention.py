@@ -0,0 +1,188 @@
+"""
+Tests for core.retention module.
+
+Tests chunked age-based pruning, the prune_sonar_data command and the scheduler.
+"""
+
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import router
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django_sonar.core import retention
+from django_sonar.core.retention import RetentionPruner
+from django_sonar.models import SonarData, SonarRequest, SonarSampleCounter
+
+
+class RetentionPrunerTestCase(TestCase):
+    """Test RetentionPruner policies"""
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def _request(self, days_ago, categories=('details', 'queries')):
+        created_at = self.now - timedelta(days=days_ago)
+        sonar_request = SonarRequest.objects.create(
+            verb='GET', path='/test/', status='200', duration=1, created_at=created_at
+        )
+        for category in categories:
+            SonarData.objects.create(
+                sonar_request=sonar_request, category=category, data={'value': 'x' * 10}, created_at=created_at
+            )
+        return sonar_request
+
+    def _pruner(self, policy, **kwargs):
+        return RetentionPruner(policy=policy, sleep=0, now=self.now, **kwargs)
+
+    def test_prune_category_by_age(self):
+        """Only entries of the category older than its retention should be deleted"""
+        old = self._request(3)
+        recent = self._request(0)
+
+        report = self._pruner({'queries': 1}).prune()
+
+        self.assertEqual(report['queries']['rows'], 1)
+        self.assertGreater(report['queries']['bytes'], 0)
+        self.assertFalse(SonarData.objects.filter(sonar_request=old, category='queries').exists())
+        self.assertTrue(SonarData.objects.filter(sonar_request=old, category='details').exists())
+        self.assertTrue(SonarData.objects.filter(sonar_request=recent, category='queries').exists())
+
+    def test_prune_deletes_in_chunks(self):
+        """Deletes should run in batch_size chunks until nothing is left"""
+        for _ in range(5):
+            self._request(10)
+
+        pruner = self._pruner({'details': 1}, batch_size=2)
+        with self.assertNumQueries(3 * 2):  # SELECT + DELETE per chunk, stops after the partial one
+            result = pruner.prune_category('details', 1)
+
+        self.assertEqual(result['rows'], 5)
+        self.assertEqual(SonarData.objects.filter(category='details').count(), 0)
+
+    def test_prune_requests_deletes_their_data(self):
+        """Old requests should be deleted together with all their entries"""
+        old = self._request(20)
+        self._request(1)
+
+        report = self._pruner({'requests': 14}).prune()
+
+        self.assertEqual(report['requests']['rows'], 1)
+        self.assertFalse(SonarRequest.objects.filter(pk=old.pk).exists())
+        self.assertFalse(SonarData.objects.filter(sonar_request_id=old.pk).exists())
+        self.assertEqual(SonarRequest.objects.count(), 1)
+
+    def test_prune_requests_keeps_longer_retained_categories(self):
+        """Requests holding data of a category retained longer should survive until it expires"""
+        with_exception = self._request(20, categories=('details', 'exception'))
+        expired_exception = self._request(40, categories=('details', 'exception'))
+
+        self._pruner({'requests': 14, 'exception': 30}).prune()
+
+        self.assertTrue(SonarRequest.objects.filter(pk=with_exception.pk).exists())
+        self.assertTrue(SonarData.objects.filter(sonar_request=with_exception, category='exception').exists())
+        self.assertFalse(SonarRequest.objects.filter(pk=expired_exception.pk).exists())
+
+    def test_prune_sample_counters(self):
+        """Reserved keys should prune the other Sonar tables"""
+        SonarSampleCounter.objects.create(bucket=self.now - timedelta(days=10), hostname='web-1', dropped=3)
+        SonarSampleCounter.objects.create(bucket=self.now, hostname='web-1', dropped=1)
+
+        report = self._pruner({'sample_counters': 7}).prune()
+
+        self.assertEqual(report['sample_counters'], {'rows': 1, 'bytes': 0})
+        self.assertEqual(SonarSampleCounter.objects.count(), 1)
+
+    def test_prune_runs_on_the_write_database(self):
+        """Chunks should be selected and deleted on the database the router writes to, not the read one"""
+        old = self._request(20)
+        SonarSampleCounter.objects.create(bucket=self.now - timedelta(days=10), hostname='web-1', dropped=3)
+
+        with patch.object(router, 'db_for_read', return_value='replica'):
+            report = self._pruner({'queries': 1, 'requests': 14, 'sample_counters': 7}).prune()
+
+        self.assertEqual((report['queries']['rows'], report['requests']['rows']), (1, 1))
+        self.assertEqual(report['sample_counters']['rows'], 1)
+        self.assertFalse(SonarData.objects.filter(sonar_request_id=old.pk).exists())
+
+    def test_dry_run_deletes_nothing(self):
+        """Dry runs should only count"""
+        self._request(3)
+
+        report = self._pruner({'queries': 1, 'requests': 2}).prune(dry_run=True)
+
+        self.assertEqual(report['queries']['rows'], 1)
+        self.assertEqual(report['requests']['rows'], 1)
+        self.assertEqual(SonarData.objects.count(), 2)
+
+    @override_settings(DJANGO_SONAR={'retention': {'queries': 1, 'exception': None}})
+    def test_policy_from_settings(self):
+        """The retention setting should be the default policy, None meaning keep forever"""
+        self.assertEqual(retention.get_retention_policy(), {'queries': 1.0})
+
+
+class PruneCommandTestCase(TestCase):
+    """Test the prune_sonar_data management command"""
+
+    def setUp(self):
+        created_at = timezone.now() - timedelta(days=5)
+        sonar_request = SonarRequest.objects.create(
+            verb='GET', path='/test/', status='200', duration=1, created_at=created_at
+        )
+        SonarData.objects.create(sonar_request=sonar_request, category='queries', data={}, created_at=created_at)
+
+    @override_settings(DJANGO_SONAR={'retention': {'queries': 1}, 'retention_sleep': 0})
+    def test_command_reports_deleted_rows(self):
+        """The command should apply the settings policy and report what it deleted"""
+        out = StringIO()
+        call_command('prune_sonar_data', stdout=out)
+
+        self.assertIn('queries (older than 1 days): deleted 1 rows', out.getvalue())
+        self.assertIn('Deleted 1 rows', out.getvalue())
+        self.assertFalse(SonarData.objects.exists())
+
+    def test_command_keep_overrides_and_dry_run(self):
+        """--keep should set the policy and --dry-run should not delete"""
+        out = StringIO()
+        call_command('prune_sonar_data', '--keep', 'requests=2', '--dry-run', stdout=out)
+
+        self.assertIn('Would delete 1 rows', out.getvalue())
+        self.assertEqual(SonarRequest.objects.count(), 1)
+
+    def test_command_without_policy(self):
+        """Without a policy the command should do nothing"""
+        out = StringIO()
+        call_command('prune_sonar_data', stdout=out)
+
+        self.assertIn('nothing to prune', out.getvalue())
+        self.assertEqual(SonarData.objects.count(), 1)
+
+
+class RetentionSchedulerTestCase(TestCase):
+    """Test the in-process retention scheduler"""
+
+    def setUp(self):
+        super().setUp()
+        # Middleware tests may have already checked (and cached) the setting in this process
+        retention.shutdown_retention_scheduler()
+
+    def tearDown(self):
+        retention.shutdown_retention_scheduler()
+        super().tearDown()
+
+    def test_scheduler_disabled_by_default(self):
+        """Without retention_interval no thread should be started"""
+        self.assertIsNone(retention.ensure_retention_scheduler())
+
+    @override_settings(DJANGO_SONAR={'retention_interval': 3600})
+    def test_scheduler_started_once_per_process(self):
+        """The scheduler should be started once and reused"""
+        scheduler = retention.ensure_retention_scheduler()
+
+        self.assertTrue(scheduler.is_running)
+        self.assertIs(retention.ensure_retention_scheduler(), scheduler)
+
+        retention.shutdown_retention_scheduler()
+        self.assertFalse(scheduler.is_running)
@@ -0,0 +1,263 @@
+"""
+Tests for core.rollups module.
+
+Tests per-route rollups maintained at write time and the Endpoints panel.
+"""
+
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_sonar.core.persistence import persist_snapshots
+from django_sonar.core.retention import RetentionPruner
+from django_sonar.core.rollups import (
+    collect_rollups,
+    get_endpoint_percentiles,
+    get_latency_series,
+    update_rollups,
+)
+from django_sonar.middlewares.requests import RequestsMiddleware
+from django_sonar.models import SonarRequest, SonarRouteRollup
+from .base import BaseMiddlewareTestCase
+
+
+def _request(route='books/<int:pk>/', verb='GET', status=200, duration=10.0, created_at=None, **extra):
+    request = {
+        'route': route,
+        'verb': verb,
+        'status': status,
+        'duration': duration,
+        'hostname': 'web-1',
+        'created_at': created_at or timezone.now(),
+    }
+    request.update(extra)
+    return request
+
+
+def _snapshot(**overrides):
+    snapshot = _request(**overrides)
+    snapshot.setdefault('uuid', uuid.uuid4())
+    snapshot.setdefault('path', '/books/1/')
+    for key in ('user_info', 'view_func', 'middlewares_used', 'memory_used'):
+        snapshot.setdefault(key, None)
+    for key in ('get_payload', 'post_payload', 'headers', 'session'):
+        snapshot.setdefault(key, {})
+    for key in ('queries', 'events', 'logs', 'dumps', 'exceptions'):
+        snapshot.setdefault(key, [])
+    return snapshot
+
+
+@override_settings(DJANGO_SONAR={'rollups': True})
+class RouteRollupTestCase(TestCase):
+    """Test SonarRouteRollup incremental updates"""
+
+    def test_rollups_are_merged_incrementally(self):
+        """Successive batches should add up into one row per key and resolution"""
+        created_at = timezone.now().replace(minute=30)
+
+        update_rollups(collect_rollups([
+            _request(duration=10.0, created_at=created_at),
+            _request(duration=30.0, created_at=created_at),
+            _request(status=503, duration=5.0, created_at=created_at),
+        ]))
+        update_rollups(collect_rollups([_request(duration=20.0, created_at=created_at, exceptions=['boom'])]))
+
+        minute = SonarRouteRollup.objects.get(resolution=SonarRouteRollup.MINUTE, status_class='2xx')
+        self.assertEqual(minute.bucket, created_at.replace(second=0, microsecond=0))
+        self.assertEqual(minute.count, 3)
+        self.assertEqual(minute.error_count, 1)
+        self.assertEqual(minute.total_duration, 60.0)
+        self.assertEqual(minute.max_duration, 30.0)
+        self.assertEqual(minute.sketch['count'], 3)
+
+        hour = SonarRouteRollup.objects.get(resolution=SonarRouteRollup.HOUR, status_class='5xx')
+        self.assertEqual(hour.bucket, created_at.replace(minute=0, second=0, microsecond=0))
+        self.assertEqual((hour.count, hour.error_count), (1, 1))
+        self.assertEqual(SonarRouteRollup.objects.count(), 4)
+
+    def test_persisted_snapshots_are_rolled_up(self):
+        """persist_snapshots should update the rollups in the same transaction"""
+        persist_snapshots([_snapshot()])
+
+        self.assertEqual(SonarRequest.objects.get().route, 'books/<int:pk>/')
+        self.assertEqual(SonarRouteRollup.objects.filter(route='books/<int:pk>/', count=1).count(), 2)
+
+    def test_rollups_can_be_disabled(self):
+        """Without the setting (off by default) no rollup should be written"""
+        with override_settings(DJANGO_SONAR={}):
+            persist_snapshots([_snapshot()])
+        with override_settings(DJANGO_SONAR={'rollups': False}):
+            persist_snapshots([_snapshot()])
+
+        self.assertFalse(SonarRouteRollup.objects.exists())
+
+    def test_rollups_survive_request_pruning(self):
+        """Pruning raw requests should leave the rollups queryable"""
+        created_at = timezone.now() - timedelta(days=3)
+        persist_snapshots([_snapshot(created_at=created_at)])
+
+        RetentionPruner(policy={'requests': 1}, sleep=0).prune()
+        self.assertFalse(SonarRequest.objects.exists())
+        self.assertEqual(SonarRouteRollup.objects.count(), 2)
+
+        RetentionPruner(policy={'rollups': 2}, sleep=0).prune()
+        self.assertFalse(SonarRouteRollup.objects.exists())
+
+
+class RollupPercentilesTestCase(TestCase):
+    """Test the percentiles and series merged from the rollups"""
+
+    def test_percentiles_are_merged_across_buckets_and_hosts(self):
+        """Sketches of every bucket and host should be merged per endpoint"""
+        now = timezone.now()
+        update_rollups(collect_rollups(
+            [_request(duration=10.0, created_at=now - timedelta(hours=2)) for _ in range(90)]
+            + [_request(duration=500.0, created_at=now, hostname='web-2') for _ in range(10)]
+            + [_request(route='other/', duration=1.0, created_at=now)]
+        ))
+
+        percentiles = get_endpoint_percentiles(0.95, now - timedelta(days=1))
+
+        self.assertAlmostEqual(percentiles[('books/<int:pk>/', 'GET')], 500.0, delta=25)
+        self.assertAlmostEqual(percentiles[('other/', 'GET')], 1.0, delta=0.05)
+        self.assertEqual(list(get_endpoint_percentiles(0.95, now - timedelta(days=1), limit=1)), [
+            ('books/<int:pk>/', 'GET'),
+        ])
+
+    def test_latency_series_fills_empty_buckets(self):
+        """The series should have one point per minute, zero when there was no traffic"""
+        now = timezone.now()
+        update_rollups(collect_rollups([
+            _request(duration=20.0, created_at=now - timedelta(minutes=2)),
+            _request(duration=40.0, created_at=now - timedelta(minutes=2), route='other/'),
+        ]))
+
+        series = get_latency_series(now - timedelta(minutes=5), q=1.0)
+
+        self.assertEqual(len(series), 6)
+        self.assertEqual([point['count'] for point in series], [0, 0, 0, 2, 0, 0])
+        self.assertIsNone(series[0]['quantile'])
+        self.assertAlmostEqual(series[3]['quantile'], 40.0, delta=2)
+
+
+class RouteRollupMiddlewareTestCase(BaseMiddlewareTestCase):
+    """Test the route capture and the rollups of dropped requests"""
+
+    @override_settings(
+        DJANGO_SONAR={'excludes': [], 'rollups': True, 'tail_sampling': True, 'tail_sampling_min_status': 500}
+    )
+    def test_dropped_requests_are_rolled_up(self):
+        """Requests dropped by tail sampling should still count in the rollups"""
+        self.get_response.return_value = HttpResponse('OK')
+        self.mock_resolve.return_value.route = 'requests/'
+        middleware = RequestsMiddleware(self.get_response)
+
+        for _ in range(2):
+            request = self._add_session_to_request(self.factory.get('/requests/'))
+            request.user = self.user
+            middleware(request)
+
+        self.assertFalse(SonarRequest.objects.exists())
+        rollup = SonarRouteRollup.objects.get(resolution=SonarRouteRollup.MINUTE)
+        self.assertEqual(
+            (rollup.route, rollup.verb, rollup.status_class, rollup.count), ('requests/', 'GET', '2xx', 2)
+        )
+
+    @override_settings(DJANGO_SONAR={'excludes': [], 'rollups': True})
+    def test_route_is_captured(self):
+        """Kept requests should store the URL pattern of their view"""
+        self.get_response.return_value = HttpResponse('OK')
+        self.mock_resolve.return_value.route = 'p/<str:panel_key>/<uuid:uuid>/'
+        request = self._add_session_to_request(self.factory.get(f'/p/endpoints/{uuid.uuid4()}/'))
+        request.user = self.user
+
+        RequestsMiddleware(self.get_response)(request)
+
+        self.assertEqual(SonarRequest.objects.get().route, 'p/<str:panel_key>/<uuid:uuid>/')
+        self.assertEqual(
+            SonarRouteRollup.objects.get(resolution=SonarRouteRollup.HOUR).route, 'p/<str:panel_key>/<uuid:uuid>/'
+        )
+
+
+@override_settings(DJANGO_SONAR={'rollups': True})
+class EndpointsPanelTestCase(TestCase):
+    """Test the Endpoints panel"""
+
+    def setUp(self):
+        get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='admin123')
+        self.client = Client()
+        self.client.login(username='admin', password='admin123')
+
+    def _get(self, **params):
+        return self.client.get(
+            reverse('sonar_panel_list', kwargs={'panel_key': 'endpoints'}), params, HTTP_HX_REQUEST='true'
+        )
+
+    def test_endpoints_are_merged_and_sorted(self):
+        """Rows of every status class and host should be merged per route and verb"""
+        update_rollups(collect_rollups([
+            _request(route='cheap/', duration=1.0),
+            _request(route='cheap/', duration=1.0, hostname='web-2'),
+            _request(route='expensive/', duration=100.0),
+            _request(route='expensive/', status=500, duration=50.0),
+        ]))
+
+        response = self._get()
+
+        self.assertEqual(response.status_code, 200)
+        endpoints = response.context['endpoints']
+        self.assertEqual([endpoint['route'] for endpoint in endpoints], ['expensive/', 'cheap/'])
+        self.assertEqual((endpoints[0]['count'], endpoints[0]['error_count']), (2, 1))
+        self.assertEqual(endpoints[1]['count'], 2)
+
+        response = self._get(sort='count', window='7d')
+        self.assertEqual(response.context['window'], '7d')
+
+    def test_window_excludes_old_rollups(self):
+        """Only the rollups of the selected window should be read"""
+        update_rollups(collect_rollups([_request(route='old/', created_at=timezone.now() - timedelta(hours=3))]))
+
+        self.assertEqual(self._get().context['endpoints'], [])
+        self.assertEqual(len(self._get(window='24h').context['endpoints']), 1)
+
+    @override_settings(DJANGO_SONAR={})
+    def test_hidden_without_rollups(self):
+        """The panel should be hidden while the rollups are off"""
+        self.assertEqual(self._get().status_code, 404)
+        self.assertNotContains(self.client.get(reverse('sonar_requests')), 'Endpoints')
+
+
+@override_settings(DJANGO_SONAR={'rollups': True})
+class RequestsPanelPercentileTestCase(TestCase):
+    """Test the percentile filter and sparklines of the Requests panel"""
+
+    def setUp(self):
+        get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='admin123')
+        self.client = Client()
+        self.client.login(username='admin', password='admin123')
+
+    def test_percentile_filter_keeps_slow_requests_of_each_endpoint(self):
+        """Requests should be compared to the percentile of their own endpoint"""
+        snapshots = [_snapshot(duration=10) for _ in range(19)] + [_snapshot(duration=200)]
+        snapshots += [_snapshot(route='reports/', duration=100) for _ in range(19)]
+        snapshots += [_snapshot(route='reports/', duration=900)]
+        persist_snapshots(snapshots)
+
+        response = self.client.get(reverse('sonar_requests'), {'percentile': '95'}, HTTP_HX_REQUEST='true')
+
+        durations = sorted(sonar_request.duration for sonar_request in response.context['sonar_requests'])
+        self.assertEqual(durations, [200, 900])
+        self.assertEqual(response.context['filters']['percentile'], '95')
+        self.assertEqual(response.context['latency']['total'], 40)
+        self.assertContains(response, 'sonar-sparkline')
+
+    def test_percentile_filter_without_rollups(self):
+        """Without rollups no threshold is known and nothing should match"""
+        response = self.client.get(reverse('sonar_requests'), {'percentile': '99'}, HTTP_HX_REQUEST='true')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['latency'])
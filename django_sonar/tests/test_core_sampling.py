@@ -0,0 +1,244 @@
+"""
+Tests for core.sampling module.
+
+Tests RequestSampler rate selection, deterministic keys and the
+middleware fast path for unsampled requests, plus TailSampler keep/drop
+decisions and the dropped-request counters.
+"""
+
+from unittest.mock import MagicMock, patch
+
+from django.http import HttpResponse
+from django.test import override_settings
+from django_sonar import utils
+from django_sonar.core.sampling import RequestSampler, TailSampler
+from django_sonar.middlewares.requests import RequestsMiddleware
+from django_sonar.models import SonarRequest, SonarData, SonarSampleCounter
+from .base import BaseMiddlewareTestCase
+
+
+class RequestSamplerTestCase(BaseMiddlewareTestCase):
+    """Test RequestSampler functionality"""
+
+    def _resolved(self, url_name, namespace=''):
+        resolved = MagicMock()
+        resolved.url_name = url_name
+        resolved.view_name = f'{namespace}:{url_name}' if namespace else url_name
+        return resolved
+
+    @override_settings(DJANGO_SONAR={})
+    def test_default_samples_everything(self):
+        """Without sampling settings every request is captured"""
+        sampler = RequestSampler()
+        request = self.factory.get('/anything/')
+
+        self.assertEqual(sampler.get_rate('/anything/'), 1.0)
+        self.assertTrue(sampler.should_sample(request))
+        self.assertFalse(sampler.needs_resolve)
+
+    @override_settings(DJANGO_SONAR={
+        'sample_rate': 0.5,
+        'sample_rate_paths': {'/api/': 0.1, '/api/health/': 0.0, '/checkout/': 1.0},
+    })
+    def test_longest_path_prefix_wins(self):
+        """Path overrides should apply the most specific prefix"""
+        sampler = RequestSampler()
+
+        self.assertEqual(sampler.get_rate('/api/users/'), 0.1)
+        self.assertEqual(sampler.get_rate('/api/health/live/'), 0.0)
+        self.assertEqual(sampler.get_rate('/checkout/pay/'), 1.0)
+        self.assertEqual(sampler.get_rate('/blog/'), 0.5)
+
+    @override_settings(DJANGO_SONAR={
+        'sample_rate': 0.0,
+        'sample_rate_paths': {'/shop/': 0.0},
+        'sample_rate_url_names': {'shop:checkout': 1.0, 'home': 0.25},
+    })
+    def test_url_name_overrides_take_precedence(self):
+        """URL-name overrides should beat path prefixes and the global rate"""
+        sampler = RequestSampler()
+
+        self.assertTrue(sampler.needs_resolve)
+        self.assertEqual(sampler.get_rate('/shop/checkout/', self._resolved('checkout', 'shop')), 1.0)
+        self.assertEqual(sampler.get_rate('/', self._resolved('home')), 0.25)
+        self.assertEqual(sampler.get_rate('/shop/cart/', self._resolved('cart', 'shop')), 0.0)
+
+    @override_settings(DJANGO_SONAR={'sample_rate': 0.3})
+    def test_request_id_makes_decision_deterministic(self):
+        """The same request id should always get the same decision"""
+        sampler = RequestSampler()
+
+        decisions = set()
+        for _ in range(20):
+            request = self.factory.get('/retry/', HTTP_X_REQUEST_ID='req-42')
+            decisions.add(sampler.should_sample(request))
+        self.assertEqual(len(decisions), 1)
+
+        sampled = sum(
+            sampler.should_sample(self.factory.get('/', HTTP_X_REQUEST_ID=f'req-{index}'))
+            for index in range(2000)
+        )
+        self.assertAlmostEqual(sampled / 2000, 0.3, delta=0.05)
+
+    @override_settings(DJANGO_SONAR={'sample_rate': 0.5, 'sample_request_id_header': 'X-Trace-Id'})
+    def test_custom_request_id_header(self):
+        """The sampling key header should be configurable"""
+        sampler = RequestSampler()
+        request = self.factory.get('/', HTTP_X_TRACE_ID='trace-1')
+
+        self.assertEqual(sampler.get_sample_key(request), sampler.get_sample_key(request))
+
+    @override_settings(DJANGO_SONAR={'excludes': [], 'sample_rate': 0.0})
+    def test_unsampled_request_skips_capture_work(self):
+        """Unsampled requests should not resolve, read memory or persist anything"""
+        request = self.factory.get('/skipped/')
+        request = self._add_session_to_request(request)
+        request.user = self.user
+
+        middleware = RequestsMiddleware(self.get_response)
+        with patch('django_sonar.core.profiling.tracemalloc') as mock_tracemalloc:
+            response = middleware(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.get_response.assert_called_once_with(request)
+        self.mock_resolve.assert_not_called()
+        mock_tracemalloc.get_traced_memory.assert_not_called()
+        self.assertEqual(SonarRequest.objects.count(), 0)
+
+    @override_settings(DJANGO_SONAR={
+        'excludes': [],
+        'sample_rate': 0.0,
+        'sample_rate_paths': {'/kept/': 1.0},
+    })
+    def test_sampled_path_is_captured(self):
+        """Requests matching a full-rate override should still be captured"""
+        request = self.factory.get('/kept/')
+        request = self._add_session_to_request(request)
+        request.user = self.user
+
+        middleware = RequestsMiddleware(self.get_response)
+        middleware(request)
+
+        self.assertEqual(SonarRequest.objects.get().path, '/kept/')
+
+    @override_settings(DJANGO_SONAR={
+        'excludes': [],
+        'sample_rate': 0.0,
+        'sample_rate_paths': {'/keep/': 1.0},
+        'tail_sampling': True,
+        'tail_sampling_min_status': 500,
+    })
+    def test_unsampled_buffers_do_not_leak_into_next_request(self):
+        """Dumps and exceptions of unsampled requests should not be saved with the next sampled one"""
+        middleware = RequestsMiddleware(self.get_response)
+
+        def failing_view(request):
+            utils.sonar({'from': request.path})
+            try:
+                raise ValueError('boom')
+            except ValueError as exc:
+                middleware.process_exception(request, exc)
+            return HttpResponse('OK')
+
+        self.get_response.side_effect = failing_view
+        for _index in range(3):
+            request = self._add_session_to_request(self.factory.get('/skip/'))
+            request.user = self.user
+            middleware(request)
+
+        self.get_response.side_effect = None
+        self.get_response.return_value = HttpResponse('OK')
+        request = self._add_session_to_request(self.factory.get('/keep/'))
+        request.user = self.user
+        middleware(request)
+
+        # A stale exception would have made tail sampling keep the request
+        self.assertFalse(SonarRequest.objects.exists())
+        self.assertEqual(SonarSampleCounter.objects.get().dropped, 1)
+        self.assertEqual(utils.get_sonar_dump(), [])
+        self.assertEqual(utils.get_sonar_exceptions(), [])
+
+
+def keep_vip(request, response, summary):
+    return request.path.startswith('/vip/')
+
+
+class TailSamplerTestCase(BaseMiddlewareTestCase):
+    """Test TailSampler decisions and middleware integration"""
+
+    TAIL_SETTINGS = {
+        'excludes': [],
+        'tail_sampling': True,
+        'tail_sampling_min_status': 500,
+        'tail_sampling_min_duration': 1000,
+        'tail_sampling_min_queries': 10,
+        'tail_sampling_predicates': ['django_sonar.tests.test_core_sampling.keep_vip'],
+    }
+
+    def _summary(self, **overrides):
+        summary = {'status': 200, 'duration': 5.0, 'query_count': 1, 'has_exception': False}
+        summary.update(overrides)
+        return summary
+
+    def _make_request(self, path):
+        request = self.factory.get(path)
+        request = self._add_session_to_request(request)
+        request.user = self.user
+        return request
+
+    @override_settings(DJANGO_SONAR={})
+    def test_disabled_keeps_everything(self):
+        """Without tail sampling every head-sampled request is kept"""
+        sampler = TailSampler()
+        self.assertTrue(sampler.should_keep(self.factory.get('/'), None, self._summary()))
+
+    @override_settings(DJANGO_SONAR=TAIL_SETTINGS)
+    def test_thresholds_and_predicates(self):
+        """Slow, failing, query-heavy, raising or matching requests should be kept"""
+        sampler = TailSampler()
+        request = self.factory.get('/')
+
+        self.assertFalse(sampler.should_keep(request, None, self._summary()))
+        self.assertTrue(sampler.should_keep(request, None, self._summary(status=503)))
+        self.assertTrue(sampler.should_keep(request, None, self._summary(duration=1500)))
+        self.assertTrue(sampler.should_keep(request, None, self._summary(query_count=10)))
+        self.assertTrue(sampler.should_keep(request, None, self._summary(has_exception=True)))
+        self.assertTrue(sampler.should_keep(self.factory.get('/vip/'), None, self._summary()))
+
+    @override_settings(DJANGO_SONAR={**TAIL_SETTINGS, 'tail_sampling_min_status': None})
+    def test_threshold_can_be_disabled(self):
+        """A None threshold should never keep a request"""
+        sampler = TailSampler()
+        self.assertFalse(sampler.should_keep(self.factory.get('/'), None, self._summary(status=500)))
+
+    @override_settings(DJANGO_SONAR=TAIL_SETTINGS)
+    def test_dropped_requests_are_only_counted(self):
+        """Dropped requests should persist nothing but one counter row"""
+        def get_response(request):
+            utils.sonar('dropped dump')
+            return HttpResponse('OK')
+
+        middleware = RequestsMiddleware(get_response)
+        for _ in range(3):
+            middleware(self._make_request('/fast/'))
+
+        self.assertEqual(SonarRequest.objects.count(), 0)
+        self.assertEqual(SonarData.objects.count(), 0)
+        self.assertEqual(utils.get_sonar_dump(), [])
+
+        counter = SonarSampleCounter.objects.get()
+        self.assertEqual(counter.dropped, 3)
+        self.assertEqual(counter.bucket.second, 0)
+
+    @override_settings(DJANGO_SONAR=TAIL_SETTINGS)
+    def test_failing_request_is_kept_in_full(self):
+        """Requests matching a rule should be persisted with their full payload"""
+        self.get_response.return_value = HttpResponse('Error', status=500)
+
+        middleware = RequestsMiddleware(self.get_response)
+        middleware(self._make_request('/broken/'))
+
+        sonar_request = SonarRequest.objects.get()
+        self.assertEqual(sonar_request.status, '500')
+        self.assertTrue(SonarData.objects.filter(sonar_request=sonar_request, category='details').exists())
+        self.assertFalse(SonarSampleCounter.objects.exists())
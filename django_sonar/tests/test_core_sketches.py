@@ -0,0 +1,85 @@
+"""
+Tests for core.sketches module.
+
+Tests LatencySketch quantile accuracy, merging and serialization.
+"""
+
+import random
+
+from django.test import SimpleTestCase
+from django_sonar.core.sketches import LatencySketch
+
+
+class LatencySketchTestCase(SimpleTestCase):
+    """Test LatencySketch functionality"""
+
+    def test_empty_sketch(self):
+        """An empty sketch should have no quantiles"""
+        self.assertIsNone(LatencySketch().quantile(0.5))
+
+    def test_quantiles_within_relative_accuracy(self):
+        """Quantiles should be within the configured relative error"""
+        rng = random.Random(42)
+        values = sorted(rng.lognormvariate(1, 1.5) for _ in range(5000))
+        sketch = LatencySketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        for q in (0.5, 0.95, 0.99):
+            expected = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q), expected, delta=expected * 0.02)
+        self.assertEqual(sketch.quantile(1.0), values[-1])
+
+    def test_merge_matches_single_sketch(self):
+        """Merging sketches should give the same result as one sketch of all values"""
+        combined, left, right = LatencySketch(), LatencySketch(), LatencySketch()
+        for index in range(1, 1001):
+            combined.add(index / 10)
+            (left if index % 2 else right).add(index / 10)
+
+        left.merge(right)
+
+        self.assertEqual(left.count, combined.count)
+        self.assertEqual(left.buckets, combined.buckets)
+        self.assertEqual(left.quantile(0.95), combined.quantile(0.95))
+
+    def test_merge_rejects_different_accuracy(self):
+        """Sketches with different accuracy should not be merged"""
+        with self.assertRaises(ValueError):
+            LatencySketch(0.01).merge(LatencySketch(0.05))
+
+    def test_round_trip_serialization(self):
+        """to_dict()/from_dict() should preserve the sketch"""
+        sketch = LatencySketch()
+        for value in (0, 0.5, 3, 250):
+            sketch.add(value)
+
+        restored = LatencySketch.from_dict(sketch.to_dict())
+
+        self.assertEqual(restored.to_dict(), sketch.to_dict())
+        self.assertEqual(restored.quantile(0.5), sketch.quantile(0.5))
+
+    def test_dense_and_sparse_serialization(self):
+        """Contiguous buckets should serialize as a dense list, scattered ones as a mapping"""
+        dense = LatencySketch()
+        for value in range(100, 200):
+            dense.add(value)
+        sparse = LatencySketch()
+        for value in (0.01, 5000):
+            sparse.add(value)
+
+        self.assertIn('counts', dense.to_dict())
+        self.assertNotIn('buckets', dense.to_dict())
+        self.assertIn('buckets', sparse.to_dict())
+        for sketch in (dense, sparse):
+            self.assertEqual(LatencySketch.from_dict(sketch.to_dict()).buckets, sketch.buckets)
+
+    def test_legacy_serialization_is_read(self):
+        """Sketches stored as a sparse mapping should still be read"""
+        sketch = LatencySketch()
+        for value in range(1, 50):
+            sketch.add(value)
+        legacy = dict(sketch.to_dict(), buckets={str(index): count for index, count in sketch.buckets.items()})
+        del legacy['offset'], legacy['counts']
+
+        self.assertEqual(LatencySketch.from_dict(legacy).quantile(0.95), sketch.quantile(0.95))
@@ -0,0 +1,151 @@
+"""
+Tests for core.writer module.
+
+Tests the write-behind queue and its integration with the middleware.
+"""
+
+import threading
+from unittest.mock import patch
+
+from django.test import override_settings
+from django.utils import timezone
+from django_sonar.core import writer as sonar_writer
+from django_sonar.core.writer import SonarWriter
+from django_sonar.middlewares.requests import RequestsMiddleware
+from django_sonar.models import SonarRequest, SonarData
+from .base import BaseMiddlewareTestCase
+
+
+class SonarWriterTestCase(BaseMiddlewareTestCase):
+    """Test SonarWriter queueing, batching and shutdown"""
+
+    def tearDown(self):
+        sonar_writer.shutdown_writer()
+        super().tearDown()
+
+    def _make_request(self, path='/test/'):
+        request = self.factory.get(path)
+        request = self._add_session_to_request(request)
+        request.user = self.user
+        return request
+
+    def test_flush_writes_in_batches(self):
+        """flush() should hand snapshots to persist in batch_size chunks"""
+        batches = []
+        writer = SonarWriter(queue_size=10, batch_size=2, persist=batches.append)
+
+        for index in range(5):
+            writer.submit({'index': index})
+        writer.flush()
+
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+
+    @override_settings(DJANGO_SONAR={'rollups': True})
+    def test_dropped_requests_are_aggregated(self):
+        """Tail-dropped requests should be written as one count per bucket"""
+        writes = []
+        rollup_writes = []
+        writer = SonarWriter(
+            persist=lambda batch: None, persist_counts=writes.append, persist_rollups=rollup_writes.append
+        )
+        created_at = timezone.now().replace(second=30)
+
+        for duration in (10.0, 20.0):
+            writer.count_dropped_request({
+                'created_at': created_at,
+                'hostname': 'web-1',
+                'duration': duration,
+                'verb': 'GET',
+                'route': 'books/',
+                'status': 200,
+                'has_exception': False,
+            })
+        writer.flush()
+        writer.flush()
+
+        bucket = created_at.replace(second=0, microsecond=0)
+        self.assertEqual(writes, [{(bucket, 'web-1'): [2, 30.0]}])
+        self.assertEqual(len(rollup_writes), 1)
+        self.assertEqual(
+            rollup_writes[0][('minute', bucket, 'books/', 'GET', '2xx', 'web-1')]['count'], 2
+        )
+        self.assertEqual(writer.pending, 0)
+
+    def test_submit_drops_when_queue_is_full(self):
+        """submit() should never block: overflowing snapshots are dropped"""
+        writer = SonarWriter(queue_size=2, persist=lambda batch: None)
+
+        self.assertTrue(writer.submit({}))
+        self.assertTrue(writer.submit({}))
+        self.assertFalse(writer.submit({}))
+        self.assertEqual(writer.dropped, 1)
+
+    def test_worker_thread_drains_queue_and_stop_flushes(self):
+        """The worker thread should persist snapshots and stop cleanly"""
+        written = []
+        persisted = threading.Event()
+
+        def persist(batch):
+            written.extend(batch)
+            persisted.set()
+
+        writer = SonarWriter(batch_size=10, flush_interval=0.01, persist=persist)
+        writer.start()
+        writer.submit({'index': 1})
+
+        self.assertTrue(persisted.wait(5))
+        writer.stop(timeout=5)
+
+        self.assertFalse(writer.is_running)
+        self.assertEqual(written, [{'index': 1}])
+
+    def test_persist_errors_do_not_break_the_writer(self):
+        """A failing batch should be logged and not stop later batches"""
+        calls = []
+
+        def persist(batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise RuntimeError('database is down')
+
+        writer = SonarWriter(batch_size=1, persist=persist)
+        writer.submit({'index': 1})
+        writer.submit({'index': 2})
+
+        with self.assertLogs('django_sonar.core.writer', level='ERROR'):
+            writer.flush()
+
+        self.assertEqual(len(calls), 2)
+
+    @override_settings(DJANGO_SONAR={'excludes': [], 'write_behind': True})
+    def test_middleware_queues_snapshot_when_write_behind_enabled(self):
+        """With write_behind enabled the middleware should not write inline"""
+        middleware = RequestsMiddleware(self.get_response)
+
+        # Keep the worker thread off so the queue can be inspected
+        with patch.object(SonarWriter, 'start'):
+            response = middleware(self._make_request('/queued/'))
+            writer = sonar_writer.get_writer()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(SonarRequest.objects.count(), 0)
+        self.assertEqual(writer.pending, 1)
+
+        writer.flush()
+
+        sonar_request = SonarRequest.objects.get()
+        self.assertEqual(sonar_request.uuid, middleware.sonar_request_uuid)
+        self.assertEqual(sonar_request.path, '/queued/')
+        self.assertTrue(
+            SonarData.objects.filter(sonar_request=sonar_request, category='details').exists()
+        )
+
+    @override_settings(DJANGO_SONAR={'excludes': []})
+    def test_middleware_writes_inline_by_default(self):
+        """Without write_behind the snapshot should be persisted inline"""
+        middleware = RequestsMiddleware(self.get_response)
+
+        middleware(self._make_request())
+
+        self.assertEqual(SonarRequest.objects.count(), 1)
+        self.assertIsNone(sonar_writer._writer)
@@ -0,0 +1,137 @@
+"""
+Async (ASGI) middleware tests.
+
+Tests that RequestsMiddleware runs natively in async mode and keeps
+request-scoped buffers isolated between concurrent requests.
+"""
+
+import asyncio
+import contextvars
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, override_settings
+from django_sonar import utils
+from django_sonar.middlewares.requests import RequestsMiddleware
+from django_sonar.models import SonarRequest, SonarData, SonarSampleCounter
+from .base import BaseMiddlewareTestCase
+
+
+class MiddlewareAsyncTestCase(BaseMiddlewareTestCase):
+    """Test async middleware mode and contextvars-based buffers"""
+
+    def setUp(self):
+        super().setUp()
+        self.async_factory = AsyncRequestFactory()
+
+    def _make_async_request(self, path, user=None):
+        request = self.async_factory.get(path)
+        request.session = SessionStore()
+        request.user = user or AnonymousUser()
+        return request
+
+    @override_settings(DJANGO_SONAR={'excludes': []})
+    def test_middleware_is_sync_when_get_response_is_sync(self):
+        """The middleware should stay synchronous under WSGI"""
+        middleware = RequestsMiddleware(self.get_response)
+        self.assertFalse(iscoroutinefunction(middleware))
+
+    @override_settings(DJANGO_SONAR={'excludes': []})
+    async def test_middleware_async_request_is_captured(self):
+        """An async get_response should be awaited and the request persisted"""
+        async def get_response(request):
+            utils.sonar('async dump')
+            return HttpResponse('OK', status=201)
+
+        middleware = RequestsMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        response = await middleware(self._make_async_request('/async/'))
+
+        self.assertEqual(response.status_code, 201)
+        sonar_request = await SonarRequest.objects.aget(uuid=middleware.sonar_request_uuid)
+        self.assertEqual(sonar_request.path, '/async/')
+        self.assertEqual(sonar_request.status, '201')
+        dumps = [entry.data async for entry in SonarData.objects.filter(
+            sonar_request=sonar_request, category='dumps'
+        )]
+        self.assertEqual(dumps, ['async dump'])
+
+    @override_settings(DJANGO_SONAR={'excludes': []})
+    async def test_middleware_async_uses_auser(self):
+        """User info should be resolved through request.auser() when available"""
+        async def get_response(request):
+            return HttpResponse('OK')
+
+        request = self._make_async_request('/profile/')
+
+        async def auser():
+            return self.user
+        request.auser = auser
+
+        middleware = RequestsMiddleware(get_response)
+        await middleware(request)
+
+        details = await SonarData.objects.aget(
+            sonar_request_id=middleware.sonar_request_uuid, category='details'
+        )
+        self.assertEqual(details.data['user_info']['username'], 'testuser')
+
+    @override_settings(DJANGO_SONAR={'excludes': []})
+    async def test_concurrent_requests_do_not_mix_buffers(self):
+        """Interleaved coroutines should each persist only their own dumps and logs"""
+        async def get_response(request):
+            utils.sonar(request.path)
+            await asyncio.sleep(0.01)
+            utils.add_sonar_log({'message': request.path})
+            await asyncio.sleep(0.01)
+            return HttpResponse('OK')
+
+        middleware = RequestsMiddleware(get_response)
+
+        async def call(path):
+            await middleware(self._make_async_request(path))
+            return middleware.sonar_request_uuid
+
+        uuids = await asyncio.gather(call('/first/'), call('/second/'))
+
+        self.assertNotEqual(uuids[0], uuids[1])
+        for request_uuid in uuids:
+            sonar_request = await SonarRequest.objects.aget(uuid=request_uuid)
+            entries = [entry async for entry in SonarData.objects.filter(
+                sonar_request=sonar_request, category__in=['dumps', 'logs']
+            )]
+            self.assertEqual(len(entries), 2)
+            self.assertEqual(
+                [entry.data for entry in entries if entry.category == 'dumps'],
+                [sonar_request.path]
+            )
+
+    @override_settings(DJANGO_SONAR={'excludes': [], 'tail_sampling': True})
+    async def test_async_tail_sampling_counts_dropped_requests(self):
+        """Dropped async requests should only bump the sample counter"""
+        async def get_response(request):
+            return HttpResponse('OK')
+
+        middleware = RequestsMiddleware(get_response)
+        await middleware(self._make_async_request('/fast/'))
+
+        self.assertFalse(await SonarRequest.objects.aexists())
+        counter = await SonarSampleCounter.objects.aget()
+        self.assertEqual(counter.dropped, 1)
+
+    def test_buffers_are_isolated_per_context(self):
+        """Buffers reset in one context should not leak into another"""
+        utils.reset_sonar_dump()
+        utils.sonar('outer')
+
+        def inner():
+            utils.reset_sonar_dump()
+            utils.sonar('inner')
+            return list(utils.get_sonar_dump())
+
+        self.assertEqual(contextvars.copy_context().run(inner), ['inner'])
+        self.assertEqual(utils.get_sonar_dump(), ['outer'])
+        utils.reset_sonar_dump()
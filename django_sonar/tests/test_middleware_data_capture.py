@@ -132,6 +132,20 @@ class MiddlewareDataCaptureTestCase(BaseMiddlewareTestCase):
         self.assertEqual(sonar_request.ip_address, '10.0.0.1')
 
     @override_settings(DJANGO_SONAR={'excludes': []})
+    def test_middleware_skips_memory_usage_by_default(self):
+        """Test memory profiling is off unless enabled"""
+        request = self.factory.get('/test/')
+        request = self._add_session_to_request(request)
+        request.user = self.user
+
+        middleware = RequestsMiddleware(self.get_response)
+        middleware(request)
+
+        details_data = SonarData.objects.get(category='details')
+        self.assertIsNone(details_data.data['memory_used'])
+        self.assertNotIn('memory_top_allocations', details_data.data)
+
+    @override_settings(DJANGO_SONAR={'excludes': [], 'memory_profiling_rate': 1.0})
     def test_middleware_captures_memory_usage(self):
         """Test middleware captures memory usage"""
         request = self.factory.get('/test/')
@@ -150,6 +164,8 @@ class MiddlewareDataCaptureTestCase(BaseMiddlewareTestCase):
         
         self.assertIn('memory_used', details_data.data)
         self.assertIsInstance(details_data.data['memory_used'], (int, float))
+        self.assertIsInstance(details_data.data['memory_peak'], (int, float))
+        self.assertIsInstance(details_data.data['memory_top_allocations'], list)
 
     @override_settings(DJANGO_SONAR={'excludes': []})
     def test_middleware_captures_view_function(self):
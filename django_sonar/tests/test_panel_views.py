@@ -2,9 +2,12 @@
 Tests for generic panel list/detail rendering and dynamic navigation.
 """
 
+from datetime import timedelta
+
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from django_sonar.models import SonarData, SonarRequest
 from django_sonar.panels import SonarPanel
@@ -97,6 +100,57 @@ class GenericPanelViewTestCase(TestCase):
         self.assertContains(response, '<h5 class="card-title">Requests</h5>', html=True)
         self.assertNotContains(response, '<!doctype html>', html=False)
 
+    def test_requests_table_shows_n_plus_one_badge(self):
+        """Requests with an N+1 finding should be flagged in the table."""
+        self.client.login(username='admin', password='admin123')
+
+        response = self._hx_get(reverse('sonar_requests_table'))
+        self.assertNotContains(response, 'N+1')
+
+        SonarData.objects.create(
+            sonar_request_id=self.sonar_request.uuid,
+            category='n_plus_one',
+            data={'findings': [{'fingerprint': 'abc', 'sql': 'SELECT ?', 'count': 6, 'total_time': 1.0}]},
+        )
+        response = self._hx_get(reverse('sonar_requests_table'))
+        self.assertContains(response, 'N+1')
+
+    def test_requests_table_verb_filter_is_case_insensitive(self):
+        """Verb filter should match stored upper-case verbs whatever the input case."""
+        self.client.login(username='admin', password='admin123')
+        SonarRequest.objects.create(verb='POST', path='/posted/', status='201', duration=5)
+
+        response = self._hx_get(reverse('sonar_requests_table'), {'verb': 'post'})
+
+        self.assertEqual([r.path for r in response.context['sonar_requests']], ['/posted/'])
+
+    @override_settings(DJANGO_SONAR={'dashboard_window_days': 7})
+    def test_requests_table_is_bounded_by_dashboard_window(self):
+        """Requests older than dashboard_window_days should not be listed"""
+        self.client.login(username='admin', password='admin123')
+        SonarRequest.objects.create(
+            verb='GET', path='/old/', status='200', duration=5, created_at=timezone.now() - timedelta(days=8)
+        )
+
+        response = self._hx_get(reverse('sonar_requests_table'))
+
+        self.assertEqual([r.path for r in response.context['sonar_requests']], ['/events/'])
+
+    @override_settings(DJANGO_SONAR={'dashboard_window_days': 7})
+    def test_queries_list_is_bounded_by_dashboard_window(self):
+        """Queries captured before dashboard_window_days should not be listed"""
+        self.client.login(username='admin', password='admin123')
+        SonarData.objects.create(
+            sonar_request_id=self.sonar_request.uuid,
+            category='queries',
+            data={'executed_queries': [{'sql': 'SELECT 2', 'time': '0.001'}]},
+            created_at=timezone.now() - timedelta(days=8),
+        )
+
+        response = self._hx_get(reverse('sonar_panel_list', kwargs={'panel_key': 'queries'}))
+
+        self.assertEqual([q['sql'] for q in response.context['queries']], ['SELECT 1'])
+
     @override_settings(DJANGO_SONAR={
         'custom_panels': ['django_sonar.tests.test_panel_views.EventsPanel'],
     })
@@ -0,0 +1,172 @@
+"""
+Tests for storage.memory module.
+
+Tests the in-memory ring buffer backend and the dashboard reading it.
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_sonar.core.collectors import DataCollector
+from django_sonar.middlewares.requests import RequestsMiddleware
+from django_sonar.models import SonarQueryStat, SonarRequest, SonarRouteRollup
+from django_sonar.panels.builtins import uses_database_storage
+from django_sonar.storage import get_storage
+from django_sonar.storage.memory import RECORD_OVERHEAD, MemoryStorage
+from .base import BaseMiddlewareTestCase
+from .test_core_rollups import _snapshot
+
+
+class MemoryStorageTestCase(TestCase):
+    """Test the bounded ring buffer"""
+
+    def test_oldest_requests_are_evicted_by_count(self):
+        """Only the last max_requests requests should be kept"""
+        storage = MemoryStorage(max_requests=3)
+        snapshots = [_snapshot(duration=duration) for duration in range(5)]
+
+        storage.save_snapshots(snapshots)
+
+        self.assertEqual(len(storage), 3)
+        self.assertEqual(storage.evicted, 2)
+        self.assertEqual([sonar_request.duration for sonar_request in storage.requests()], [4, 3, 2])
+        self.assertFalse(storage.entries().filter(sonar_request_id=snapshots[0]['uuid']).exists())
+
+    def test_oldest_requests_are_evicted_by_size(self):
+        """The encoded size of the buffer should stay below max_bytes"""
+        storage = MemoryStorage(max_bytes=RECORD_OVERHEAD * 3 + 1200)
+
+        storage.save_snapshots([_snapshot(headers={'Cookie': 'x' * 300}) for _ in range(10)])
+
+        self.assertLessEqual(storage.size, storage.max_bytes)
+        self.assertLess(len(storage), 10)
+        self.assertEqual(storage.requests().count(), len(storage))
+
+    def test_oversized_request_is_not_kept(self):
+        """A request larger than the whole budget should be dropped instead of flushing the buffer"""
+        storage = MemoryStorage(max_bytes=RECORD_OVERHEAD * 4)
+        storage.save_snapshots([_snapshot()])
+
+        storage.save_snapshots([_snapshot(headers={'Cookie': 'x' * RECORD_OVERHEAD * 4})])
+
+        self.assertEqual(len(storage), 1)
+        self.assertEqual(storage.evicted, 1)
+
+    def test_entries_saved_one_by_one_join_their_request(self):
+        """DataCollector entries should be appended to the record of their request"""
+        snapshot = _snapshot()
+        with override_settings(DJANGO_SONAR={'storage': 'memory'}):
+            storage = get_storage()
+            storage.clear()
+            storage.save_snapshots([snapshot])
+            DataCollector(snapshot['uuid']).save_entry('events', {'name': 'late'})
+
+            events = storage.entries().filter(sonar_request_id=snapshot['uuid'], category='events')
+            self.assertEqual([event.data for event in events], [{'name': 'late'}])
+            self.assertEqual(len(storage), 1)
+            storage.clear()
+
+    def test_entries_keep_their_capture_order(self):
+        """Entries should come newest first like the database ordering, (-created_at, -pk)"""
+        storage = MemoryStorage()
+        snapshot = _snapshot(logs=[{'message': str(index)} for index in range(3)])
+        storage.save_snapshots([snapshot])
+
+        logs = storage.entries().filter(sonar_request_id=snapshot['uuid'], category='logs')
+        self.assertEqual([log.data['message'] for log in logs], ['2', '1', '0'])
+        self.assertEqual([log.data['message'] for log in logs.order_by('created_at', 'pk')], ['0', '1', '2'])
+
+    def test_prune_and_clear(self):
+        """Pruning should drop the requests older than the cutoff, clear() everything"""
+        storage = MemoryStorage()
+        storage.save_snapshots([_snapshot(created_at=timezone.now() - timedelta(days=2)), _snapshot()])
+
+        self.assertEqual(storage.prune(timezone.now() - timedelta(days=1))['rows'], 1)
+        self.assertEqual(storage.requests().count(), 1)
+
+        storage.clear()
+        self.assertEqual((len(storage), storage.size), (0, 0))
+
+
+class MemoryStorageDashboardTestCase(BaseMiddlewareTestCase):
+    """Test the middleware and the dashboard with the memory storage"""
+
+    def setUp(self):
+        super().setUp()
+        # The aggregates are enabled: their panels are hidden by the storage alone
+        settings = override_settings(
+            DJANGO_SONAR={'excludes': [], 'storage': 'memory', 'query_stats': True, 'rollups': True}
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(get_storage().clear)
+
+        get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='admin123')
+        self.client = Client()
+        self.client.login(username='admin', password='admin123')
+
+    def test_capture_does_not_write_to_the_database(self):
+        """Captured requests should be kept in memory and shown by the dashboard"""
+        self.get_response.return_value = HttpResponse('OK')
+        request = self._add_session_to_request(self.factory.get('/books/'))
+        request.user = self.user
+
+        with self.assertNumQueries(0):
+            RequestsMiddleware(self.get_response)(request)
+
+        self.assertFalse(SonarRequest.objects.exists())
+        response = self.client.get(reverse('sonar_requests'), HTTP_HX_REQUEST='true')
+        sonar_request = response.context['sonar_requests'][0]
+        self.assertEqual(sonar_request.path, '/books/')
+
+        response = self.client.get(
+            reverse('sonar_request_detail', kwargs={'uuid': sonar_request.uuid}), HTTP_HX_REQUEST='true'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(get_storage().requests().get().is_read)
+
+    def _assert_no_aggregate_queries(self, queries):
+        tables = (SonarQueryStat._meta.db_table, SonarRouteRollup._meta.db_table)
+        self.assertFalse([query['sql'] for query in queries if any(table in query['sql'] for table in tables)])
+
+    def test_aggregate_panels_are_hidden(self):
+        """Top Queries and Endpoints need the database aggregates: hidden, never queried"""
+        with CaptureQueriesContext(connection) as queries:
+            index = self.client.get(reverse('sonar_requests'))
+            top_queries = self.client.get(reverse('sonar_panel_list', kwargs={'panel_key': 'top_queries'}))
+            endpoints = self.client.get(reverse('sonar_panel_list', kwargs={'panel_key': 'endpoints'}))
+
+        self.assertEqual(index.status_code, 200)
+        self.assertNotContains(index, 'Top Queries')
+        self.assertNotContains(index, 'Endpoints')
+        self.assertEqual(top_queries.status_code, 404)
+        self.assertEqual(endpoints.status_code, 404)
+        self._assert_no_aggregate_queries(queries.captured_queries)
+
+    def test_aggregate_panels_follow_the_given_settings(self):
+        """Panel availability should follow the storage of the settings it is given"""
+        self.assertTrue(uses_database_storage({'storage': 'database'}))
+        self.assertTrue(uses_database_storage({}))
+        self.assertFalse(uses_database_storage({'storage': 'memory'}))
+
+    def test_query_detail_without_statistics(self):
+        """The query detail should render without the query statistics table"""
+        snapshot = _snapshot(queries=[
+            {'sql': 'SELECT 1', 'params': [], 'time': 0.5, 'rowcount': 1, 'alias': 'default', 'call_site': None},
+        ])
+        get_storage().save_snapshots([snapshot])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('sonar_queries_detail', kwargs={'uuid': snapshot['uuid'], 'index': 0}), HTTP_HX_REQUEST='true'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['sonar_query']['stat'])
+        self._assert_no_aggregate_queries(queries.captured_queries)
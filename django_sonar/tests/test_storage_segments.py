@@ -0,0 +1,192 @@
+"""
+Tests for storage.segments module.
+
+Tests the append-only segment-file backend and the dashboard reading it.
+"""
+
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_sonar.core.retention import RetentionPruner
+from django_sonar.middlewares.requests import RequestsMiddleware
+from django_sonar.models import SonarData, SonarRequest
+from django_sonar.storage import get_storage
+from django_sonar.storage.segments import SegmentStorage
+from .base import BaseMiddlewareTestCase
+from .test_core_rollups import _snapshot
+
+
+class SegmentStorageTestCase(TestCase):
+    """Test writing and reading segment files"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.storage = SegmentStorage(self.directory)
+        self.addCleanup(self.storage.close)
+
+    def test_snapshots_round_trip(self):
+        """Requests and entries should be read back newest first, without database rows"""
+        now = timezone.now()
+        old = _snapshot(duration=10, created_at=now - timedelta(minutes=5), headers={'Host': 'old'})
+        new = _snapshot(duration=20, created_at=now, status=500, queries=[{'sql': 'SELECT 1', 'time': 1.5}])
+
+        self.storage.save_snapshots([old, new])
+
+        self.assertFalse(SonarRequest.objects.exists())
+        self.assertFalse(SonarData.objects.exists())
+        requests = self.storage.requests()
+        self.assertEqual(requests.count(), 2)
+        self.assertEqual([sonar_request.duration for sonar_request in requests], [20, 10])
+        self.assertEqual(requests.filter(status='500').get().uuid, new['uuid'])
+        self.assertEqual(requests.filter(created_at__lt=now).get().created_at, old['created_at'])
+        self.assertEqual(requests.filter(path__icontains='BOOKS').count(), 2)
+
+        headers = self.storage.entries().filter(sonar_request_id=old['uuid'], category='headers').first()
+        self.assertEqual(headers.data, {'request_headers': {'Host': 'old'}})
+        queries = self.storage.entries().filter(category='queries')
+        self.assertEqual(queries.first().data['executed_queries'][0]['sql'], 'SELECT 1')
+        with self.assertRaises(SonarRequest.DoesNotExist):
+            requests.get(uuid=uuid.uuid4())
+
+    def test_entries_keep_their_capture_order(self):
+        """Entries should come newest first like the database ordering, (-created_at, -pk)"""
+        snapshot = _snapshot(logs=[{'message': str(index)} for index in range(3)])
+        self.storage.save_snapshots([snapshot])
+
+        logs = self.storage.entries().filter(sonar_request_id=snapshot['uuid'], category='logs')
+        self.assertEqual([log.data['message'] for log in logs], ['2', '1', '0'])
+        self.assertEqual([log.data['message'] for log in logs.order_by('created_at', 'pk')], ['0', '1', '2'])
+
+    @override_settings(DJANGO_SONAR={'compression': True, 'compression_threshold': 10, 'dedup': True})
+    def test_compressed_and_deduplicated_entries(self):
+        """Compressed bodies and deduplicated payloads should be stored in the segment"""
+        snapshot = _snapshot(session={'key': 'value' * 50})
+
+        self.storage.save_snapshots([snapshot])
+
+        session = self.storage.entries().get(sonar_request_id=snapshot['uuid'], category='session')
+        self.assertEqual(session.data, {'session_data': {'key': 'value' * 50}})
+        self.assertEqual(self.storage.entries().filter(sonar_request_id=snapshot['uuid']).count(), 5)
+
+    def test_segments_rotate_and_index_can_be_rebuilt(self):
+        """Full segments should rotate, and a missing index should be rebuilt from the records"""
+        storage = SegmentStorage(self.directory, max_bytes=512)
+        self.addCleanup(storage.close)
+        storage.save_snapshots([_snapshot(duration=duration) for duration in range(5)])
+
+        segments = storage.get_segments()
+        self.assertEqual(len(segments), 5)
+        os.remove(segments[0][:-len('.seg')] + '.idx')
+
+        self.assertEqual(SegmentStorage(self.directory).requests().count(), 5)
+
+    def test_new_records_are_read_incrementally(self):
+        """The index cache should pick up records appended after the first read"""
+        self.storage.save_snapshots([_snapshot()])
+        self.assertEqual(self.storage.requests().count(), 1)
+
+        self.storage.save_snapshots([_snapshot()])
+
+        self.assertEqual(self.storage.requests().count(), 2)
+
+    def test_prune_deletes_old_segments(self):
+        """Segments whose records are all older than the cutoff should be deleted"""
+        storage = SegmentStorage(self.directory, max_bytes=1)
+        self.addCleanup(storage.close)
+        storage.save_snapshots([
+            _snapshot(created_at=timezone.now() - timedelta(days=3)),
+            _snapshot(created_at=timezone.now()),
+        ])
+        old_segment = storage.get_segments()[0]
+        old_time = (timezone.now() - timedelta(days=3)).timestamp()
+        os.utime(old_segment, (old_time, old_time))
+
+        result = storage.prune(timezone.now() - timedelta(days=1))
+
+        self.assertEqual(result['rows'], 1)
+        self.assertGreater(result['bytes'], 0)
+        self.assertEqual(storage.requests().count(), 1)
+
+    def test_clear_deletes_every_segment(self):
+        """clear() should remove every segment and index"""
+        self.storage.save_snapshots([_snapshot()])
+
+        self.storage.clear()
+
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertFalse(self.storage.requests().exists())
+
+
+class SegmentStorageDashboardTestCase(BaseMiddlewareTestCase):
+    """Test the middleware and the dashboard with the segment storage"""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings = override_settings(DJANGO_SONAR={
+            'excludes': [], 'storage': 'segments', 'segment_dir': self.directory, 'retention': {'requests': 1},
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(get_storage().close)
+
+        get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='admin123')
+        self.client = Client()
+        self.client.login(username='admin', password='admin123')
+
+    def _capture(self, path='/requests/'):
+        self.get_response.return_value = HttpResponse('OK')
+        request = self._add_session_to_request(self.factory.get(path, {'page': '2'}))
+        request.user = self.user
+        RequestsMiddleware(self.get_response)(request)
+
+    def test_captured_requests_are_listed_and_detailed(self):
+        """Captured requests should be listed and shown from the segment files"""
+        self._capture()
+
+        self.assertFalse(SonarRequest.objects.exists())
+        response = self.client.get(reverse('sonar_requests'), HTTP_HX_REQUEST='true')
+        sonar_requests = list(response.context['sonar_requests'])
+        self.assertEqual(len(sonar_requests), 1)
+        self.assertFalse(sonar_requests[0].is_read)
+        self.assertIsNone(response.context['latency'])
+
+        detail_url = reverse('sonar_request_detail', kwargs={'uuid': sonar_requests[0].uuid})
+        response = self.client.get(detail_url, HTTP_HX_REQUEST='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['sonar_request'].path, '/requests/?page=2')
+
+        response = self.client.get(
+            reverse('sonar_detail_payload', kwargs={'uuid': sonar_requests[0].uuid}), HTTP_HX_REQUEST='true'
+        )
+        self.assertEqual(response.context['payload']['get_payload'], {'page': '2'})
+        self.assertTrue(get_storage().requests().get().is_read)
+
+    def test_filters_are_applied(self):
+        """Verb and path filters should be applied to the segment records"""
+        self._capture('/requests/')
+        self._capture('/other/')
+
+        response = self.client.get(reverse('sonar_requests'), {'path': 'other'}, HTTP_HX_REQUEST='true')
+
+        self.assertEqual([r.path for r in response.context['sonar_requests']], ['/other/?page=2'])
+
+    def test_retention_and_clear_use_the_storage(self):
+        """Retention and the clear view should act on the segment files"""
+        self._capture()
+        storage = get_storage()
+        self.assertEqual(RetentionPruner(sleep=0).prune()['requests'], {'rows': 0, 'bytes': 0})
+
+        self.client.get(reverse('sonar_request_clear'))
+
+        self.assertEqual(storage.get_segments(), [])
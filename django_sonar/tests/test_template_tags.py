@@ -3,6 +3,7 @@
 from django.test import SimpleTestCase
 
 from django_sonar.templatetags.sonar_badges import sonar_level_badge_class
+from django_sonar.templatetags.sonar_charts import sonar_sparkline
 
 
 class SonarBadgeTemplateTagTestCase(SimpleTestCase):
@@ -31,3 +32,16 @@ class SonarBadgeTemplateTagTestCase(SimpleTestCase):
 
     def test_none_level_defaults_to_info(self):
         self.assertEqual(sonar_level_badge_class(None), 'bg-info text-dark')
+
+
+class SonarSparklineTemplateTagTestCase(SimpleTestCase):
+    """Validate the inline SVG sparkline."""
+
+    def test_points_are_scaled_to_the_peak(self):
+        svg = sonar_sparkline([0, 5, 10, None], width=30, height=12, title='<p95>')
+
+        self.assertIn('points="0.0,11.0 10.0,6.0 20.0,1.0 30.0,11.0"', svg)
+        self.assertIn('<title>&lt;p95&gt;</title>', svg)
+
+    def test_empty_series_renders_nothing(self):
+        self.assertEqual(sonar_sparkline([]), '')
@@ -1,11 +1,36 @@
 import json
-import threading
+from contextvars import ContextVar
 from decimal import Decimal
 from datetime import datetime, date, time
 from uuid import UUID
 
-_thread_locals = threading.local()
-_thread_locals.sonar_dump = []
+from django.conf import settings
+
+# Request-scoped buffers. Context variables (instead of thread locals) keep
+# concurrent requests apart under ASGI, where many requests share a thread,
+# and follow the request across sync_to_async/async_to_sync boundaries.
+_sonar_dump = ContextVar('sonar_dump', default=None)
+_sonar_exceptions = ContextVar('sonar_exceptions', default=None)
+_sonar_events = ContextVar('sonar_events', default=None)
+_sonar_logs = ContextVar('sonar_logs', default=None)
+_sonar_request_uuid = ContextVar('sonar_request_uuid', default=None)
+
+
+def _get_buffer(var):
+    buffer = var.get()
+    if buffer is None:
+        buffer = []
+        var.set(buffer)
+    return buffer
+
+
+def get_sonar_settings():
+    """
+    Return the DJANGO_SONAR settings dictionary.
+
+    :return: DJANGO_SONAR dictionary, or an empty dict when not configured
+    """
+    return getattr(settings, 'DJANGO_SONAR', None) or {}
 
 
 def make_json_serializable(obj):
@@ -59,53 +84,70 @@ def make_json_serializable(obj):
 
 
 def get_sonar_dump():
-    return getattr(_thread_locals, 'sonar_dump', [])
+    return _get_buffer(_sonar_dump)
 
 
 def reset_sonar_dump():
-    _thread_locals.sonar_dump = []
+    _sonar_dump.set([])
 
 
 def get_sonar_exceptions():
-    return getattr(_thread_locals, 'sonar_exceptions', [])
+    return _get_buffer(_sonar_exceptions)
 
 
 def add_sonar_exception(exception):
-    sonar_exceptions = get_sonar_exceptions()
-    sonar_exceptions += [exception]
-    _thread_locals.sonar_exceptions = sonar_exceptions
+    get_sonar_exceptions().append(exception)
 
 
 def reset_sonar_exceptions():
-    _thread_locals.sonar_exceptions = []
+    _sonar_exceptions.set([])
 
 
 def get_sonar_events():
-    return getattr(_thread_locals, 'sonar_events', [])
+    return _get_buffer(_sonar_events)
 
 
 def add_sonar_event(event):
-    sonar_events = get_sonar_events()
-    sonar_events += [event]
-    _thread_locals.sonar_events = sonar_events
+    get_sonar_events().append(event)
 
 
 def reset_sonar_events():
-    _thread_locals.sonar_events = []
+    _sonar_events.set([])
 
 
 def get_sonar_logs():
-    return getattr(_thread_locals, 'sonar_logs', [])
+    return _get_buffer(_sonar_logs)
 
 
 def add_sonar_log(log_entry):
-    sonar_logs = get_sonar_logs()
-    sonar_logs += [log_entry]
-    _thread_locals.sonar_logs = sonar_logs
+    get_sonar_logs().append(log_entry)
 
 
 def reset_sonar_logs():
-    _thread_locals.sonar_logs = []
+    _sonar_logs.set([])
+
+
+def start_request_buffers():
+    """
+    Give the current context its own request-scoped buffers.
+
+    Events and logs start empty; dumps and exceptions already buffered in this
+    context (e.g. recorded before the request started) are carried over.
+    Unsampled and excluded requests discard their buffers when they end, so
+    what is carried over never belongs to another request.
+    """
+    _sonar_events.set([])
+    _sonar_logs.set([])
+    _sonar_dump.set(list(_sonar_dump.get() or []))
+    _sonar_exceptions.set(list(_sonar_exceptions.get() or []))
+
+
+def get_sonar_request_uuid():
+    return _sonar_request_uuid.get()
+
+
+def set_sonar_request_uuid(request_uuid):
+    _sonar_request_uuid.set(request_uuid)
 
 
 def sonar(*args):
@@ -116,8 +158,7 @@ def sonar(*args):
             serializable_arg = make_json_serializable(arg)
             # Verify it's actually serializable
             json.dumps(serializable_arg)
-            sonar_dump += [serializable_arg]
-            _thread_locals.sonar_dump = sonar_dump
+            sonar_dump.append(serializable_arg)
         except (TypeError, ValueError) as e:
             # If still not serializable, store error info
             print(f"SONAR: Argument of type {type(arg).__name__} could not be serialized: {e}")
@@ -4,10 +4,13 @@ from django.template.response import TemplateResponse
 from django.urls import reverse, reverse_lazy
 from django.views.generic import DetailView, RedirectView, TemplateView
 
+from django_sonar.core.callsite import group_by_call_site
+from django_sonar.core.fingerprints import fingerprint_sql
 from django_sonar.mixins import SuperuserRequiredMixin
-from django_sonar.models import SonarData, SonarRequest
+from django_sonar.models import SonarQueryStat
 from django_sonar.panels import registry as panel_registry
 from django_sonar.panels.builtins import RequestsPanel
+from django_sonar.storage import get_storage
 
 
 class SonarPanelsContextMixin:
@@ -89,6 +92,10 @@ class SonarRequestDetailRedirectMixin:
             )
         return super().get(request, *args, **kwargs)
 
+    def get_entries(self, category):
+        """Return the SonarData entries of a category for the requested UUID."""
+        return get_storage().entries().filter(sonar_request_id=self.kwargs.get('uuid'), category=category)
+
 
 class GenericPanelMixin:
     """Resolve panel metadata from URL kwargs or class-level key."""
@@ -135,7 +142,7 @@ class SonarRequestClearView(SuperuserRequiredMixin, RedirectView):
     url = reverse_lazy('sonar_index')
 
     def get(self, request, *args, **kwargs):
-        SonarRequest.objects.all().delete()
+        get_storage().clear()
         return super().get(request, *args, **kwargs)
 
 
@@ -254,12 +261,12 @@ class SonarRequestDetailView(SuperuserRequiredMixin, SonarDualModeMixin, DetailV
     active_panel_key = 'requests'
 
     def get_object(self):
-        record = SonarRequest.objects.get(uuid=self.kwargs.get('uuid'))
-        record.is_read = True
-        record.save()
+        storage = get_storage()
+        record = storage.requests().get(uuid=self.kwargs.get('uuid'))
+        storage.mark_read(record)
 
         # get details from SonarData
-        details = SonarData.objects.filter(sonar_request_id=record.uuid, category='details').first()
+        details = storage.entries().filter(sonar_request_id=record.uuid, category='details').first()
         record.details = details.data if details else {}
         return record
 
@@ -270,13 +277,20 @@ class SonarQueriesDetailView(SuperuserRequiredMixin, SonarDualModeMixin, DetailV
     active_panel_key = 'queries'
 
     def get_object(self):
-        queries = SonarData.objects.filter(
+        queries = get_storage().entries().filter(
             category='queries',
             sonar_request_id=self.kwargs.get('uuid'),
         ).first()
         executed_queries = queries.data['executed_queries'] if queries else []
         single_query = executed_queries[self.kwargs.get('index')] or {}
         single_query['sonar_request_id'] = self.kwargs.get('uuid')
+
+        # Query plan captured for this fingerprint, if any (statistics only exist in the database storage)
+        single_query['stat'] = None
+        if single_query.get('sql') and get_storage().database:
+            single_query['stat'] = SonarQueryStat.objects.filter(
+                fingerprint=fingerprint_sql(single_query['sql'])
+            ).only('fingerprint', 'explain_plan', 'explain_sql', 'explained_at').first()
         return single_query
 
 
@@ -285,7 +299,7 @@ class SonarDetailPayloadView(SuperuserRequiredMixin, SonarRequestDetailRedirectM
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        payload = SonarData.objects.filter(sonar_request_id=self.kwargs.get('uuid'), category='payload').first()
+        payload = self.get_entries('payload').first()
         context['payload'] = payload.data if payload else {}
         return context
 
@@ -295,7 +309,7 @@ class SonarDetailHeadersView(SuperuserRequiredMixin, SonarRequestDetailRedirectM
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        headers = SonarData.objects.filter(sonar_request_id=self.kwargs.get('uuid'), category='headers').first()
+        headers = self.get_entries('headers').first()
         context['headers'] = headers.data if headers else {}
         return context
 
@@ -305,8 +319,11 @@ class SonarDetailQueriesView(SuperuserRequiredMixin, SonarRequestDetailRedirectM
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        queries = SonarData.objects.filter(sonar_request_id=self.kwargs.get('uuid'), category='queries').first()
+        queries = self.get_entries('queries').first()
         context['queries'] = queries.data if queries else {}
+        context['call_sites'] = group_by_call_site(context['queries'].get('executed_queries', []))
+        n_plus_one = self.get_entries('n_plus_one').first()
+        context['n_plus_one'] = n_plus_one.data.get('findings', []) if n_plus_one else []
         return context
 
 
@@ -315,7 +332,7 @@ class SonarDetailSessionView(SuperuserRequiredMixin, SonarRequestDetailRedirectM
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        session = SonarData.objects.filter(sonar_request_id=self.kwargs.get('uuid'), category='session').first()
+        session = self.get_entries('session').first()
         context['session'] = session.data if session else {}
         return context
 
@@ -325,7 +342,7 @@ class SonarDetailMiddlewaresView(SuperuserRequiredMixin, SonarRequestDetailRedir
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        middlewares = SonarData.objects.filter(sonar_request_id=self.kwargs.get('uuid'), category='details').first()
+        middlewares = self.get_entries('details').first()
         context['middlewares'] = middlewares.data if middlewares else {}
         return context
 
@@ -336,7 +353,7 @@ class SonarDetailDumpsView(SuperuserRequiredMixin, SonarRequestDetailRedirectMix
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['dumps'] = []
-        dumps = SonarData.objects.filter(sonar_request_id=self.kwargs.get('uuid'), category='dumps').all()
+        dumps = self.get_entries('dumps').order_by('created_at', 'pk')
         for dump in dumps:
             context['dumps'] += [dump.data]
 
@@ -348,6 +365,6 @@ class SonarDetailExceptionView(SuperuserRequiredMixin, SonarRequestDetailRedirec
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        exception = SonarData.objects.filter(sonar_request_id=self.kwargs.get('uuid'), category='exception').first()
+        exception = self.get_entries('exception').first()
         context['exception'] = exception.data if exception else {}
         return context
@@ -20,6 +20,28 @@ def run_tests():
         ('test_middleware_data_capture', 'Data Capture', 11),
         ('test_middleware_exclusions', 'Path Exclusions', 4),
         ('test_middleware_helpers', 'Helper Methods', 5),
+        ('test_middleware_async', 'Async Middleware', 2),
+        ('test_core_collectors', 'Data Collectors', 19),
+        ('test_core_writer', 'Write-behind Writer', 7),
+        ('test_core_sampling', 'Request Sampling', 13),
+        ('test_core_profiling', 'Memory Profiling', 5),
+        ('test_core_queries', 'Query Capture', 7),
+        ('test_core_fingerprints', 'SQL Fingerprints', 6),
+        ('test_core_sketches', 'Latency Sketches', 7),
+        ('test_core_query_stats', 'Query Statistics', 4),
+        ('test_core_explain', 'EXPLAIN Plans', 5),
+        ('test_core_callsite', 'Query Call Sites', 6),
+        ('test_core_retention', 'Retention Pruning', 13),
+        ('test_core_partitions', 'Table Partitioning', 7),
+        ('test_core_compression', 'Payload Compression', 10),
+        ('test_core_blobs', 'Blob Deduplication', 12),
+        ('test_core_rollups', 'Route Rollups', 13),
+        ('test_core_exports', 'NDJSON Export', 7),
+        ('test_core_imports', 'NDJSON Import', 10),
+        ('test_core_parquet', 'Parquet Export', 5),
+        ('test_core_clear', 'Data Clearing', 13),
+        ('test_storage_segments', 'Segment Storage', 10),
+        ('test_storage_memory', 'Memory Storage', 10),
     ]
     
     total_tests = sum(count for _, _, count in test_modules)